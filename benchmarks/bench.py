@@ -0,0 +1,380 @@
+# encoding: utf-8
+""" Offline benchmarks of the hot paths of the scraper: parsing result
+    and notes pages, parsing categories, planning requests, period date
+    math and exporting datasets. Everything runs on synthetic pages, in
+    the same format as the recorded pages in tests/data, so no requests
+    are made.
+
+    python benchmarks/bench.py
+    python benchmarks/bench.py --sizes 10000,1000000 --only parse_data
+    python benchmarks/bench.py --save before.json
+    python benchmarks/bench.py --compare before.json
+
+    Every benchmark reports the best time out of a number of rounds,
+    throughput (items per second) and peak memory. Peak memory is traced
+    with tracemalloc (Python 3), or taken as the growth of the max
+    resident size of the process (Python 2).
+"""
+from __future__ import print_function
+
+import os
+import gc
+import sys
+import json
+import time
+import tempfile
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bra_scraper.topic import Topic
+from bra_scraper.dimension import Regions, Crimes, Periods, Measures
+from bra_scraper.category import Period
+from bra_scraper.resultset import Dataset, ResultSet
+from bra_scraper.utils import group_queries
+from bra_scraper.emulator import period_rows, region_rows, crime_rows, \
+    topic_html
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+
+
+""" SYNTHETIC DATA
+
+    Dimensions and topic pages are those of the emulator
+    (see `bra_scraper.emulator`).
+"""
+
+def make_topic(n_regions=300, n_crimes=30, n_periods=170):
+    """ A topic with synthetic dimensions, that never touches the site
+    """
+    topic = Topic(u"Benchmark", "http://statistik.bra.se/?menyid=1",
+                  description=u"brottskod")
+    topic._regions = Regions(categories=region_rows(n_regions))
+    topic._crimes = Crimes(categories=crime_rows(n_crimes))
+    topic._periods = Periods(categories=period_rows(n_periods))
+    topic._measures = Measures()
+    return topic
+
+def result_page(topic, n):
+    """ A result page with `n` value cells, every tenth of them missing
+    """
+    regions = [x.id for x in topic.regions]
+    crimes = [x.id for x in topic.crimes]
+    periods = [x.id for x in topic.periods]
+    cells = []
+    for i in range(n):
+        if i % 10 == 9:
+            value = u".."
+        else:
+            value = u"{:,}".format(i * 37).replace(",", u"&nbsp;")
+        cells.append(
+            u'<tr><td align="right" class="resultatAntal" '
+            u'headers="{} 289 {} {} antal">{}</td></tr>'.format(
+                periods[i % len(periods)],
+                crimes[(i // len(periods)) % len(crimes)],
+                regions[(i // len(periods) // len(crimes)) % len(regions)],
+                value))
+    return u"<html><body><table>{}</table></body></html>".format(
+        u"\n".join(cells))
+
+def notes_page(topic, n):
+    """ A notes page with `n` notes on regions
+    """
+    parts = []
+    for region in list(topic.regions)[:n]:
+        parts.append(u"<span>{}</span><div>Uppgifterna för {} är preliminära."
+                     u"</div>".format(region.label_short, region.label))
+    return u'<html><body><div id="infotexter">{}</div></body></html>'.format(
+        u"".join(parts))
+
+def make_dataset(topic, n):
+    regions = list(topic.regions)
+    crimes = list(topic.crimes)
+    periods = list(topic.periods)
+    count = topic._measures.get("count")
+    dataset = Dataset()
+    for i in range(n):
+        dataset.add(periods[i % len(periods)],
+                    regions[(i // len(periods)) % len(regions)],
+                    crimes[(i // len(periods) // len(regions)) % len(crimes)],
+                    count,
+                    None if i % 10 == 9 else i,
+                    "missing" if i % 10 == 9 else None)
+    return dataset
+
+
+""" BENCHMARKS
+
+    Every benchmark takes a size and returns a function to time and the
+    number of items it handles. Setup is not timed.
+"""
+
+# Max number of value cells on one result page
+PAGE_SIZE = Topic.MAX_DATAPOINTS
+
+def bench_parse_data(n):
+    """ `Topic._parse_data` on pages of (up to) 10 000 cells """
+    topic = make_topic()
+    page = result_page(topic, min(n, PAGE_SIZE))
+    n_pages = max(1, n // PAGE_SIZE)
+
+    def run():
+        for i in range(n_pages):
+            topic._parse_data(page)
+    return run, n_pages * min(n, PAGE_SIZE)
+
+def bench_parse_notes(n):
+    """ `Topic._parse_notes` on pages of 100 notes, one page per 10 000
+        datapoints """
+    topic = make_topic()
+    topic.category_index
+    page = notes_page(topic, 100)
+    n_pages = max(1, n // PAGE_SIZE)
+
+    def run():
+        for i in range(n_pages):
+            topic._parse_notes(page)
+    return run, n_pages
+
+def bench_parse_categories(n):
+    """ `Dimension._parse_categories` of a topic page, one category per
+        100 datapoints """
+    n_categories = max(10, n // 100)
+    html = topic_html(n_categories, n_categories, min(n_categories, 1000))
+
+    def run():
+        Regions(html=html)
+        Crimes(html=html)
+        Periods(html=html)
+    return run, n_categories * 2 + min(n_categories, 1000)
+
+def query_shape(n, n_regions, max_periods):
+    """ Numbers of regions, crimes, periods and measures of a query of
+        about `n` datapoints
+    """
+    n_periods = min(max_periods, max(1, n // (n_regions * 2)))
+    n_crimes = max(1, n // (n_regions * n_periods * 2))
+    return [n_regions, n_crimes, n_periods, 2]
+
+def bench_plan(n):
+    """ `Topic.plan` of a query of `n` datapoints, over 290 regions and
+        both measures """
+    shape = query_shape(n, 290, 170)
+    topic = make_topic(*shape[:3])
+
+    def run():
+        topic.plan(measures="*")
+    return run, shape[0] * shape[1] * shape[2] * shape[3]
+
+def bench_group_queries(n):
+    """ `utils.group_queries` of `n` datapoints in awkward dimensions """
+    lengths = query_shape(n, 293, 173)
+    ids = [list(range(x)) for x in lengths]
+
+    def run():
+        group_queries(ids, PAGE_SIZE)
+    return run, lengths[0] * lengths[1] * lengths[2] * lengths[3]
+
+def bench_period_math(n):
+    """ Start, end and periodicity of new periods, one per 10 datapoints """
+    rows = period_rows(max(10, n // 10))
+
+    def run():
+        for id, label, parent in rows:
+            Period(id, label).period_end
+    return run, len(rows)
+
+def bench_dataset_add(n):
+    """ Building a `Dataset` of `n` datapoints """
+    topic = make_topic()
+
+    def run():
+        make_dataset(topic, n)
+    return run, n
+
+def bench_dictlist(n):
+    """ `Dataset.dictlist` of `n` datapoints """
+    dataset = make_dataset(make_topic(), n)
+
+    def run():
+        dataset.dictlist
+    return run, n
+
+def bench_to_csv(n):
+    """ `Dataset.to_csv` of `n` datapoints """
+    dataset = make_dataset(make_topic(), n)
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+
+    def run():
+        dataset.to_csv(path)
+        os.remove(path)
+    return run, n
+
+def bench_to_parquet(n):
+    """ `Dataset.to_parquet` of `n` datapoints """
+    dataset = make_dataset(make_topic(), n)
+    fd, path = tempfile.mkstemp(suffix=".parquet")
+    os.close(fd)
+
+    def run():
+        dataset.to_parquet(path)
+        os.remove(path)
+    return run, n
+
+def bench_to_sqlite(n):
+    """ `ResultSet.to_sqlite` of `n` datapoints, into a new database """
+    results = ResultSet()
+    results.add_data(make_dataset(make_topic(), n))
+    directory = tempfile.mkdtemp()
+
+    def run():
+        path = os.path.join(directory, "bench.db")
+        results.to_sqlite(path, "1")
+        for file_name in os.listdir(directory):
+            os.remove(os.path.join(directory, file_name))
+    return run, n
+
+BENCHMARKS = [
+    ("parse_data", bench_parse_data),
+    ("parse_notes", bench_parse_notes),
+    ("parse_categories", bench_parse_categories),
+    ("plan", bench_plan),
+    ("group_queries", bench_group_queries),
+    ("period_math", bench_period_math),
+    ("dataset_add", bench_dataset_add),
+    ("dictlist", bench_dictlist),
+    ("to_csv", bench_to_csv),
+    ("to_parquet", bench_to_parquet),
+    ("to_sqlite", bench_to_sqlite),
+]
+
+
+""" RUNNER
+"""
+
+# Min duration of a timed round, in seconds
+MIN_ROUND_TIME = 0.2
+
+def max_rss():
+    """ Max resident size of the process so far, in bytes """
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return rss if sys.platform == "darwin" else rss * 1024
+
+def measure(func, rounds):
+    """ Time `func` and trace its memory use. Fast functions are called
+        several times per round, to get above the resolution of the clock.
+        :returns (tuple): (best time per call in seconds, peak memory in bytes)
+    """
+    t0 = time.time()
+    func()
+    number = max(1, int(MIN_ROUND_TIME / max(time.time() - t0, 1e-6)))
+
+    best = None
+    for i in range(rounds):
+        gc.collect()
+        t0 = time.time()
+        for j in range(number):
+            func()
+        duration = (time.time() - t0) / number
+        if best is None or duration < best:
+            best = duration
+
+    # A separate round for memory, as tracing slows things down
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    else:
+        rss_before = max_rss()
+        func()
+        peak = max_rss() - rss_before
+
+    return best, peak
+
+def run_benchmarks(names, sizes, rounds):
+    """ :returns: A generator of dicts, one per benchmark and size """
+    for name, bench in BENCHMARKS:
+        if names and name not in names:
+            continue
+        for n in sizes:
+            func, n_items = bench(n)
+            try:
+                duration, peak = measure(func, rounds)
+            except ImportError as e:
+                # Optional dependencies, like pandas
+                print("{:<18} {:>10}  skipped: {}".format(name, n, e))
+                continue
+            yield {
+                "name": name,
+                "size": n,
+                "items": n_items,
+                "seconds": duration,
+                "items_per_second": n_items / duration if duration else None,
+                "peak_bytes": peak,
+            }
+
+def format_result(result, baseline=None):
+    line = u"{name:<18} {size:>10} {seconds:>12.6f} s {rate:>14} /s {peak:>9.1f} MB"\
+        .format(name=result["name"], size=result["size"],
+                seconds=result["seconds"],
+                rate="{:,.0f}".format(result["items_per_second"] or 0),
+                peak=result["peak_bytes"] / 1024.0 / 1024)
+    if baseline is not None:
+        line += u"  {:>6.2f}x".format(result["seconds"] / baseline["seconds"])
+    return line
+
+def main():
+    parser = ArgumentParser(description="Run offline benchmarks")
+    parser.add_argument("--sizes", type=str,
+        default=",".join([str(x) for x in DEFAULT_SIZES]),
+        help="comma separated numbers of datapoints (for example 10000,10000000)")
+    parser.add_argument("--only", type=str,
+        help="comma separated names of benchmarks to run ({})".format(
+            ", ".join([x[0] for x in BENCHMARKS])))
+    parser.add_argument("--rounds", type=int, default=3,
+        help="number of timed rounds, the best one is reported")
+    parser.add_argument("--save", type=str,
+        help="store the results in this json file")
+    parser.add_argument("--compare", type=str,
+        help="compare with results stored with --save (time relative to them)")
+    args = parser.parse_args()
+
+    sizes = [int(x) for x in args.sizes.split(",")]
+    names = args.only.split(",") if args.only else None
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            for result in json.load(f):
+                baseline[(result["name"], result["size"])] = result
+
+    print("{:<18} {:>10} {:>14} {:>17} {:>12}".format(
+        "benchmark", "size", "time", "throughput", "peak memory"))
+    results = []
+    for result in run_benchmarks(names, sizes, args.rounds):
+        results.append(result)
+        print(format_result(result,
+            baseline.get((result["name"], result["size"]))))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# encoding: utf-8
+""" Load test `Topic.query` end to end against a local emulator of the
+    site (see `bra_scraper.emulator`), with a range of worker counts and,
+    optionally, the adaptive throttle.
+
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --workers 1,4,16 --latency 0.05 --capacity 8
+    python benchmarks/load_test.py --throttle --error-rate 0.02
+
+    Reports wall time, datapoints per second, number of requests and the
+    errors and max concurrency seen by the emulator, per run.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bra_scraper import BRA
+from bra_scraper.emulator import Emulator
+from bra_scraper.throttle import AdaptiveController
+
+
+def run(args, workers):
+    """ Query one topic with fresh sessions against a fresh emulator
+        :returns (dict):
+    """
+    emulator = Emulator(n_regions=args.regions, n_crimes=args.crimes,
+                        n_periods=args.periods, latency=args.latency,
+                        jitter=args.jitter, error_rate=args.error_rate,
+                        capacity=args.capacity, seed=args.seed).start()
+    try:
+        throttle = None
+        if args.throttle:
+            throttle = AdaptiveController(max_limit=workers)
+        scraper = BRA(base_url=emulator.base_url, throttle=throttle)
+        topic = scraper.topics[0]
+        topic.dimensions()
+
+        t0 = time.time()
+        try:
+            n_datapoints = len(topic.query(measures="*",
+                                           max_workers=workers).data)
+        except Exception as e:
+            # Without a throttle, errors are not retried
+            print("{:>8} failed: {}".format(workers, e))
+            return None
+        duration = time.time() - t0
+
+        stats = emulator.stats()
+    finally:
+        emulator.stop()
+
+    return {
+        "workers": workers,
+        "seconds": duration,
+        "datapoints": n_datapoints,
+        "requests": topic.request_count,
+        "errors": sum(stats["errors"].values()),
+        "max_in_flight": stats["max_in_flight"],
+    }
+
+def main():
+    parser = ArgumentParser(description="Load test Topic.query against a local emulator")
+    parser.add_argument("--workers", type=str, default="1,2,4,8",
+        help="comma separated numbers of parallel sessions to try")
+    parser.add_argument("--throttle", action="store_true", default=False,
+        help="use the adaptive throttle, with the number of workers as max limit")
+    parser.add_argument("--regions", type=int, default=300)
+    parser.add_argument("--crimes", type=int, default=20)
+    parser.add_argument("--periods", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.02,
+        help="min response time of the emulator, in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02,
+        help="max random time added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+        help="share of requests that fail (0-1)")
+    parser.add_argument("--capacity", type=int,
+        help="max number of concurrent requests of the emulator")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print("{:>8} {:>10} {:>12} {:>16} {:>9} {:>7} {:>14}".format(
+        "workers", "time", "datapoints", "datapoints/s", "requests",
+        "errors", "max in flight"))
+    for workers in [int(x) for x in args.workers.split(",")]:
+        result = run(args, workers)
+        if result is None:
+            continue
+        print("{workers:>8} {seconds:>8.2f} s {datapoints:>12} {rate:>16,.0f} "
+              "{requests:>9} {errors:>7} {max_in_flight:>14}".format(
+                rate=result["datapoints"] / result["seconds"], **result))
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,8 @@
 # encoding: utf-8
+import os
+import json
+import time
+import tempfile
 import requests
 from lxml import html
 from bra_scraper.topic import Topic
@@ -8,41 +12,124 @@ from bra_scraper.surfer import Surfer
 class BRA(Surfer):
     """ The entry point for site scraping
     """
+    def __init__(self, catalog=None, catalog_max_age=24*3600, **kwargs):
+        """ :param catalog (str): Path to a json file to store the list of
+                topics in, so that new processes don't have to fetch it.
+            :param catalog_max_age (int): Max age of the stored list of
+                topics, in seconds.
+        """
+        super(BRA, self).__init__(**kwargs)
+        self.catalog = catalog
+        self.catalog_max_age = catalog_max_age
+        self._topics = None
+        self._topics_by_url = None
+        self._topics_by_label = None
 
     @property
     def topics(self):
-        """ Get a list of all topic
+        """ Get a list of all topic. The list is fetched once per instance
+            (or read from the catalog file).
             :returns (list): A list of Topic instances 
         """
-        _topics = []
-        r = requests.get(self.BASE_URL + "solwebb/action/start?menykatalogid=1", verify=False)
+        if self._topics is None:
+            topics = self._load_catalog()
+            if topics is None:
+                with self.phase("catalog"):
+                    topics = self._fetch_catalog()
+                self._save_catalog(topics)
+
+            self._topics = [
+                Topic(label, url, desc, logger=self.logger, cache=self.cache,
+                      throttle=self.throttle, base_url=self.BASE_URL,
+                      metrics=self.metrics)
+                for label, url, desc in topics
+            ]
+            self._topics_by_url = {}
+            self._topics_by_label = {}
+            for topic in self._topics:
+                self._topics_by_url.setdefault(topic.url, topic)
+                self._topics_by_label.setdefault(topic.label, []).append(topic)
+
+        return self._topics
+
+    def refresh_topics(self):
+        """ Fetch the list of topics again, ignoring the catalog file
+            :returns (list): A list of Topic instances
+        """
+        self._save_catalog(self._fetch_catalog())
+        self._topics = None
+        return self.topics
+
+    def topic(self, label_or_url, level="brottstyp"):
+        """ Get topic by label or url
+            :param label_or_url: Label (e.g "Årsvis - Kommun och storstädernas stadsdelar 1996-")
+                or url (e.g "http://statistik.bra.se/solwebb/action/anmalda/urval/urval?menyid=101")
+            :param level: "brottskod" | "brottstyp"     
+            :returns (Topic):
+        """
+        # Make sure the topics and their lookups are loaded
+        self.topics
+        if "http" in label_or_url:
+            # Get by url
+            return self._topics_by_url.get(label_or_url)
+        else:
+            # Get by label
+            for topic in self._topics_by_label.get(label_or_url, []):
+                if topic.level == level:
+                    return topic
+        return None
+
+    def _fetch_catalog(self):
+        """ Get the list of topics from the start page
+            :returns (list): A list of (label, url, description) tuples
+        """
+        if self.session is None:
+            self.session = requests.session()
+        r = self.request("GET", self.BASE_URL + "solwebb/action/start?menykatalogid=1")
         _html = r.content
         _tree = html.fromstring(_html)
         links = _tree.xpath("//li[@class='menySol']/a")
         
+        topics = []
         for link in links:
             url = link.get("href")
             name = link.xpath("span[@class='menytext']")[0].text
             desc = link.xpath("../following-sibling::li[@class='menyText']")[0].text
-            _topic = Topic(name, url, desc, logger=self.logger)
-            _topics.append(_topic)
+            topics.append((name, url, desc))
 
-        return _topics
+        return topics
 
-    def topic(self, label_or_url, level="brottstyp"):
-        """ Get topic by label or url
-            :param label_or_url: Label (e.g "Årsvis - Kommun och storstädernas stadsdelar 1996-")
-                or url (e.g "http://statistik.bra.se/solwebb/action/anmalda/urval/urval?menyid=101")
-            :param level: "brottskod" | "brottstyp"     
-            :returns (Topic):
+    def _load_catalog(self):
+        """ Read the list of topics from the catalog file, if it is fresh
+            :returns (list): A list of (label, url, description) tuples,
+                or None
         """
+        if self.catalog is None or not os.path.exists(self.catalog):
+            return None
+
         try:
-            if "http" in label_or_url:
-                # Get by url
-                return [x for x in self.topics if x.url == label_or_url ][0]
-            else:
-                # Get by label
-                return [x for x in self.topics if x.label == label_or_url and x.level == level][0]
-        except IndexError:
+            with open(self.catalog) as f:
+                catalog = json.load(f)
+        except ValueError:
+            # Truncated or corrupt. Fetch the list again.
+            self.log.warning(u"Could not read {}".format(self.catalog))
+            return None
+
+        age = time.time() - catalog["fetched"]
+        if self.catalog_max_age is not None and age > self.catalog_max_age:
             return None
-    
+
+        self.log.debug("Read list of topics from {}".format(self.catalog))
+        return [tuple(x) for x in catalog["topics"]]
+
+    def _save_catalog(self, topics):
+        if self.catalog is None:
+            return
+
+        # A temporary file of our own, as other processes may share the
+        # catalog
+        directory = os.path.dirname(os.path.abspath(self.catalog))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"fetched": time.time(), "topics": topics}, f)
+        os.rename(tmp_path, self.catalog)
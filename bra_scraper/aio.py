@@ -0,0 +1,163 @@
+# encoding: utf-8
+""" An asyncio based transport for querying topics.
+    Requires Python 3 and aiohttp. Use it through `Topic.aquery()`.
+"""
+import time
+import asyncio
+from bra_scraper.utils import is_result_page
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncSurfer(object):
+    """ Asynchronous counterpart of Surfer. Every instance keeps a session
+        of its own, as the site keeps track of the navigation per session.
+        Several surfers can share one connection pool.
+    """
+    def __init__(self, surfer, connector=None):
+        """ :param surfer (Surfer): The surfer (typically a Topic) whose
+                urls and logger to use.
+            :param connector (aiohttp.TCPConnector): A shared connection pool
+        """
+        if aiohttp is None:
+            raise ImportError("The asyncio transport requires aiohttp. "
+                              "Install it with `pip install aiohttp`.")
+        self.surfer = surfer
+        # An unsafe cookie jar also keeps cookies from ip addresses,
+        # like that of a local emulator
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            connector_owner=connector is None,
+            cookie_jar=aiohttp.CookieJar(unsafe=True))
+
+    async def start_session(self):
+        """ Open the pages one by one to get a correct node path
+            in the session. See `Surfer.start_session()`.
+        """
+        self.surfer.log.info("Start new async session")
+        await self.get(self.surfer.INTERFACE_URL)
+        await self.get(self.surfer.INTERFACE_URL + "/start?menykatalogid=1")
+
+    async def get(self, url):
+        return await self.request("GET", url)
+
+    async def post(self, url, data):
+        return await self.request("POST", url, data=data)
+
+    async def request(self, method, url, **kwargs):
+        """ Make a request and record it in the metrics of the surfer,
+            if any. Error responses raise `aiohttp.ClientResponseError`.
+            See `Surfer.request()`.
+            :returns (str): The response body
+        """
+        metrics = self.surfer.metrics
+        start = time.time()
+        try:
+            async with self.session.request(method, url, ssl=False,
+                                            **kwargs) as r:
+                body = await r.read()
+                text = await r.text()
+        except aiohttp.ClientError:
+            if metrics is not None:
+                metrics.record_request(method, url, time.time() - start, 0, None)
+            raise
+        if metrics is not None:
+            metrics.record_request(method, url, time.time() - start,
+                                   len(body), r.status)
+        r.raise_for_status()
+        return text
+
+    async def get_result_page(self, topic, regions, crimes, periods, measures):
+        """ Make a query and return the html of the result and notes page.
+            See `Topic._get_result_page()`.
+        """
+        cache = topic.cache
+        if cache is not None:
+            cache_key = cache.key(topic.menu_id,
+                regions, crimes, periods, measures)
+            pages = cache.get(cache_key)
+            if pages is not None:
+                return pages
+
+        payload = topic._payload(regions, crimes, periods, measures)
+        start = time.time()
+
+        # Make the search
+        await self.get(topic.url)
+        await self.post(topic.SEARCH_URL + "vantapopup", payload)
+        await self.get(topic.SEARCH_URL + "sok")
+
+        # Get data table and notes
+        table = await self.get(topic.SEARCH_URL + "soktabell")
+        notes = await self.get(topic.SEARCH_URL + "sokinfo")
+        if topic.metrics is not None:
+            topic.metrics.record_phase("fetch", time.time() - start)
+
+        if cache is not None:
+            if is_result_page(table, notes):
+                cache.set(cache_key, table, notes)
+            else:
+                topic.log.debug("Got no result page, not caching it")
+
+        return table, notes
+
+    async def close(self):
+        await self.session.close()
+
+
+async def query(topic, max_pipelines=10, **kwargs):
+    """ Get the data for a topic with up to `max_pipelines` chunks in flight
+        at once. Takes the same arguments as `Topic.query()`.
+        :returns (ResultSet):
+    """
+    connector = aiohttp.TCPConnector(limit=max_pipelines) if aiohttp else None
+
+    try:
+        if not topic._html:
+            surfer = AsyncSurfer(topic, connector=connector)
+            try:
+                await surfer.start_session()
+                topic._html = await surfer.get(topic.url)
+            finally:
+                await surfer.close()
+
+        topic.dimensions()
+        with topic.phase("plan"):
+            queries = topic.plan(**kwargs)
+        pages = [None] * len(queries)
+        todo = asyncio.Queue()
+        for i, q in enumerate(queries):
+            todo.put_nowait(i)
+
+        async def pipeline():
+            surfer = AsyncSurfer(topic, connector=connector)
+            try:
+                await surfer.start_session()
+                while not todo.empty():
+                    i = todo.get_nowait()
+                    q = queries[i]
+                    pages[i] = await surfer.get_result_page(
+                        topic, q["regions"], q["crimes"], q["periods"],
+                        q["measures"])
+            finally:
+                await surfer.close()
+
+        n_pipelines = max(1, min(max_pipelines, len(queries)))
+        tasks = [asyncio.ensure_future(pipeline())
+                 for _ in range(n_pipelines)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # Stop the other pipelines before their connections are closed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+    finally:
+        if connector is not None:
+            await connector.close()
+
+    return topic._parse_pages(pages, len(pages))
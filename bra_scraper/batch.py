@@ -0,0 +1,151 @@
+# encoding: utf-8
+""" Run many queries, on many topics, from one job file:
+
+    {
+        "defaults": {"period_start": "2015-01-01"},
+        "jobs": [
+            {"topic": "Årsvis - Land och län 1975-2014, land och region 2015-",
+             "regions": ["Stockholms län"], "outfile": "stockholm.csv"},
+            {"topic": "http://statistik.bra.se/solwebb/action/anmalda/urval/urval?menyid=101",
+             "outfile": "bra.db"}
+        ]
+    }
+
+    Job files can also be written in YAML (requires PyYAML), or be just
+    a list of jobs.
+"""
+import io
+import json
+import time
+from multiprocessing.pool import ThreadPool
+from bra_scraper.checkpoint import Checkpoint
+
+# Keys of a job that are passed on to `Topic.query()`
+QUERY_KEYS = ["regions", "crimes", "measures", "period_start", "period_end",
+              "ignore_ceased_regions", "ignore_ceased_crimes", "manifest",
+              "store"]
+
+
+def load_jobs(path):
+    """ Read a job file
+        :param path (str): A .json, .yaml or .yml file
+        :returns (list): A dict per job, with the defaults filled in
+    """
+    with io.open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("YAML job files require PyYAML. "
+                                  "Install it with `pip install pyyaml`.")
+            content = yaml.safe_load(f)
+        else:
+            content = json.load(f)
+
+    if isinstance(content, list):
+        content = {"jobs": content}
+
+    jobs = []
+    for i, job in enumerate(content["jobs"]):
+        job = dict(content.get("defaults", {}), **job)
+        for key in ("topic", "outfile"):
+            if key not in job:
+                raise ValueError("Job {} has no {}".format(i + 1, key))
+        jobs.append(job)
+
+    return jobs
+
+def run_batch(scraper, jobs, max_jobs=4, resume=False):
+    """ Run jobs on up to `max_jobs` topics at once. All topics are taken
+        from one catalog. Jobs on the same topic are run one after the
+        other, in the session of the topic. To limit the number of
+        requests in flight across all jobs, give the scraper a throttle.
+
+        :param scraper (BRA):
+        :param jobs (list): Jobs, as returned by `load_jobs()`
+        :param resume (bool): Don't fetch requests that were finished in
+            an earlier, interrupted run
+        :returns (dict): A summary with timings, request counts and
+            errors of every job
+    """
+    start = time.time()
+
+    # Resolve all topics before we start, to fail early on unknown topics
+    by_topic = []
+    for i, job in enumerate(jobs):
+        topic = scraper.topic(job["topic"], level=job.get("level", "brottstyp"))
+        if topic is None:
+            raise ValueError(u"Unknown topic: {}".format(job["topic"]))
+        for group_topic, group_jobs in by_topic:
+            if group_topic is topic:
+                group_jobs.append((i, job))
+                break
+        else:
+            by_topic.append((topic, [(i, job)]))
+
+    def run_group(group):
+        topic, group_jobs = group
+        try:
+            return [(i, run_job(topic, job, resume=resume))
+                    for i, job in group_jobs]
+        finally:
+            topic.close()
+
+    summaries = []
+    pool = ThreadPool(max(1, min(max_jobs, len(by_topic))))
+    try:
+        for group_summaries in pool.imap_unordered(run_group, by_topic):
+            summaries += group_summaries
+    finally:
+        pool.terminate()
+
+    # In the order of the job file
+    summaries = [summary for i, summary in sorted(summaries)]
+
+    return {
+        "seconds": time.time() - start,
+        "jobs": summaries,
+        "failed": len([x for x in summaries if x["error"]]),
+        "datapoints": sum([x["datapoints"] for x in summaries]),
+        "requests": scraper.request_count + \
+            sum([topic.request_count for topic, group_jobs in by_topic]),
+    }
+
+def run_job(topic, job, resume=False):
+    """ Query a topic and write the result to the outfile of the job
+        :returns (dict): Summary of the job
+    """
+    start = time.time()
+    request_count = topic.request_count
+    summary = {
+        "topic": topic.label,
+        "outfile": job["outfile"],
+        "datapoints": 0,
+        "error": None,
+    }
+
+    # Jobs on different topics may share a database
+    checkpoint = Checkpoint(u"{}.{}.checkpoint".format(job["outfile"],
+                                                      topic.menu_id))
+    if not resume:
+        checkpoint.clear()
+
+    query = dict([(key, job[key]) for key in QUERY_KEYS if key in job])
+    try:
+        result = topic.query(checkpoint=checkpoint, **query)
+        with topic.phase("export"):
+            # In incremental mode, append to the outfile
+            append = "manifest" in job
+            if len(result.data) or not append:
+                result.save(job["outfile"], topic, append=append)
+            if job.get("notes") and result.notes:
+                result.notes.to_csv(job["notes"])
+        checkpoint.clear()
+        summary["datapoints"] = len(result.data)
+    except Exception as e:
+        topic.log.error(u"Job on {} failed: {}".format(topic.label, e))
+        summary["error"] = u"{}: {}".format(type(e).__name__, e)
+
+    summary["seconds"] = time.time() - start
+    summary["requests"] = topic.request_count - request_count
+    return summary
@@ -0,0 +1,119 @@
+# encoding: utf-8
+import os
+import json
+import time
+import zlib
+import tempfile
+from bra_scraper.utils import request_key
+
+
+class ResponseCache(object):
+    """ Stores result and notes pages on disk, so that repeated queries
+        can be served without making any requests.
+
+        Pages are stored compressed, one file per request, named by a hash
+        of the topic and the ids in the request.
+    """
+    def __init__(self, path, ttl=None, max_size=None):
+        """ :param path (str): Directory to store the cache in
+            :param ttl (int): Max age of cached pages in seconds.
+                Default is to keep them forever.
+            :param max_size (int): Max total size of the cache in bytes.
+                The least recently used pages are removed when the cache
+                grows beyond this size.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def key(self, topic_id, regions, crimes, periods, measures):
+        """ Get the cache key of a request
+            :param topic_id (str): Menu id of the topic
+            :returns (str):
+        """
+        return request_key(topic_id, regions, crimes, periods, measures)
+
+    def get(self, key):
+        """ Get the pages stored under a key
+            :returns (tuple): (result page, notes page), or None if there
+                are no fresh pages for this key.
+        """
+        file_path = self._file_path(key)
+        try:
+            with open(file_path, "rb") as f:
+                data = json.loads(zlib.decompress(f.read()).decode("utf-8"))
+        except (IOError, OSError, ValueError, zlib.error):
+            return None
+
+        if self.ttl is not None and time.time() - data["created"] > self.ttl:
+            self._remove(file_path)
+            return None
+
+        # Mark as recently used
+        try:
+            os.utime(file_path, None)
+        except OSError:
+            pass
+
+        return data["table"], data["notes"]
+
+    def set(self, key, table, notes):
+        """ Store a result and notes page
+        """
+        data = json.dumps({
+            "created": time.time(),
+            "table": table,
+            "notes": notes,
+        })
+        content = zlib.compress(data.encode("utf-8"))
+
+        # Write to a temporary file first, so that a reader never sees
+        # half a file
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.rename(tmp_path, self._file_path(key))
+
+        if self.max_size is not None:
+            self._evict()
+
+    def clear(self):
+        """ Remove all cached pages
+        """
+        for file_path in self._files():
+            self._remove(file_path)
+
+    def _evict(self):
+        """ Remove the least recently used pages until the cache fits
+            within `max_size`.
+        """
+        files = []
+        total_size = 0
+        for file_path in self._files():
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, file_path))
+            total_size += stat.st_size
+
+        for mtime, size, file_path in sorted(files):
+            if total_size <= self.max_size:
+                break
+            self._remove(file_path)
+            total_size -= size
+
+    def _files(self):
+        return [os.path.join(self.path, x) for x in os.listdir(self.path)
+                if x.endswith(".zlib")]
+
+    def _file_path(self, key):
+        return os.path.join(self.path, key + ".zlib")
+
+    def _remove(self, file_path):
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
@@ -3,7 +3,6 @@
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 import re
-from copy import deepcopy
 
 class Category(object):
     """ Represents a category in a dimension. Could be a county (if region)
@@ -64,16 +63,63 @@ class Region(Category):
     
 
 class Period(Category):
-    """ Represents a category in the Period dimension
+    """ Represents a category in the Period dimension.
+        Start, end and periodicity are parsed from the label once,
+        on first use.
     """
+    def __init__(self, id, label):
+        super(Period, self).__init__(id, label)
+        self._preliminary = "Prel" in label
+        self._bounds = None
 
     @property
     def period_start(self):
         """ Get the timepoint of the start of the period.
             :returns (Datetime): 
         """
+        return self._parse()[0]
+
+    @property
+    def period_end(self):
+        """ Get the timepoint of the end of the period.
+            :returns (Datetime): 
+        """
+        return self._parse()[1]
+
+    @property
+    def periodicity(self):
+        """ :returns (str): Name of periodicity ("yearly", "quarterly", "monthly")
+        """
+        return self._parse()[2]
+
+    @property
+    def preliminary(self):
+        """ :returns (bool): Is this a preliminary measure?
+        """
+        return self._preliminary
+    
+    def in_range(self, date):
+        """ Check if a date is in the range if this period
+            :param date (Datetime):
+        """
+        return (self.period_start <= date) and (date <= self.period_end)
+
+    def _parse(self):
+        """ Parse start, end and periodicity from the label
+            :returns (tuple): (period_start, period_end, periodicity)
+        """
+        if self._bounds is not None:
+            return self._bounds
+
         period_name = self.label
 
+        if (u"Helår" in period_name) or (u"År" in period_name):
+            periodicity = "yearly"
+        elif "Kvartal" in period_name:
+            periodicity = "quarterly"
+        else:
+            periodicity = "monthly"
+
         if period_name[0:2] == u"År":
             period_name = period_name.replace(u" prel.","")
             year = int(period_name[-4:])
@@ -96,47 +142,18 @@ class Period(Category):
             except KeyError:
                 month = MONTHS.index(_part_of_year) + 1
 
-        return datetime(year=year, month=month, day=1)
+        period_start = datetime(year=year, month=month, day=1)
 
-    @property
-    def period_end(self):
-        """ Get the timepoint of the end of the period.
-            :returns (Datetime): 
-        """
-        period_end = deepcopy(self.period_start)
-        if self.periodicity == "yearly":
-            period_end = period_end + relativedelta(years=1)
-
-        elif self.periodicity == "quarterly":
-            period_end = period_end + relativedelta(months=3)
+        if periodicity == "yearly":
+            period_end = period_start + relativedelta(years=1)
 
-        elif self.periodicity == "monthly":
-            period_end = period_end + relativedelta(months=1)
+        elif periodicity == "quarterly":
+            period_end = period_start + relativedelta(months=3)
 
-        return period_end - relativedelta(days=1)
-        
-    
-    @property
-    def periodicity(self):
-        """ :returns (str): Name of periodicity ("yearly", "quarterly", "monthly")
-        """
-        if (u"Helår" in self.label) or (u"År" in self.label):
-            return "yearly"
-        elif "Kvartal" in self.label:
-            return "quarterly"
         else:
-            return "monthly"
+            period_end = period_start + relativedelta(months=1)
 
-    @property
-    def preliminary(self):
-        """ :returns (bool): Is this a preliminary measure?
-        """
-        return "Prel" in self.label
-    
-    def in_range(self, date):
-        """ Check if a date is in the range if this period
-            :param date (Datetime):
-        """
-        return (self.period_start <= date) and (date <= self.period_end)
+        period_end = period_end - relativedelta(days=1)
 
-    
\ No newline at end of file
+        self._bounds = (period_start, period_end, periodicity)
+        return self._bounds
@@ -0,0 +1,90 @@
+# encoding: utf-8
+import os
+import json
+import zlib
+import shutil
+import tempfile
+from bra_scraper.utils import request_key
+from bra_scraper.note import Note
+
+
+class Checkpoint(object):
+    """ Stores the parsed datapoints and notes of every finished request
+        of a query, so that an interrupted query can be resumed without
+        fetching the finished requests again.
+    """
+    def __init__(self, path):
+        """ :param path (str): Directory to store the checkpoint in
+        """
+        self.path = path
+
+    def has(self, topic, query):
+        """ Is this request finished?
+            :param topic (Topic):
+            :param query (dict): A request, as returned by `Topic.plan()`
+        """
+        return os.path.exists(self._file_path(topic, query))
+
+    def save(self, topic, query, data, notes):
+        """ Store the parsed result of a request
+            :param data (Dataset): Datapoints, as returned by `Topic._parse_data()`
+            :param notes (dict): Notes, as returned by `Topic._parse_notes()`
+        """
+        content = json.dumps({
+            "data": [list(x) for x in data.id_rows()],
+            "notes": [[
+                category,
+                note.note if note else None,
+                note.dimension.name if note else None,
+            ] for category, note in notes.items()],
+        })
+
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(zlib.compress(content.encode("utf-8")))
+        os.rename(tmp_path, self._file_path(topic, query))
+
+    def load(self, topic, query):
+        """ Get the parsed result of a finished request
+            :returns (tuple): (data, notes) in the same format as `.save()`
+        """
+        with open(self._file_path(topic, query), "rb") as f:
+            content = json.loads(zlib.decompress(f.read()).decode("utf-8"))
+
+        periods = topic.dimension("periods")
+        regions = topic.dimension("regions")
+        crimes = topic.dimension("crimes")
+        measures = topic.dimension("measures")
+        data = []
+        for period_id, region_id, crime_id, measure_id, value, status \
+                in content["data"]:
+            data.append({
+                'period': periods.get(period_id),
+                'crime': crimes.get(crime_id),
+                'region': regions.get(region_id),
+                'measure': measures.get(measure_id),
+                'value': value,
+                'status': status,
+            })
+
+        notes = {}
+        for category, note_text, dimension in content["notes"]:
+            if note_text is None:
+                notes[category] = None
+            else:
+                notes[category] = Note(note_text, category,
+                                       topic.dimension(dimension))
+
+        return data, notes
+
+    def clear(self):
+        """ Remove the checkpoint directory
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def _file_path(self, topic, query):
+        key = request_key(topic.menu_id, query["regions"], query["crimes"],
+                          query["periods"], query["measures"])
+        return os.path.join(self.path, key + ".zlib")
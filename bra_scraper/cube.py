@@ -0,0 +1,121 @@
+# encoding: utf-8
+
+
+class Cube(object):
+    """ The values of a query as an array with one axis per dimension,
+        made with `Dataset.to_cube()`. Missing values are NaN. Slice by
+        category id, label or end of label:
+
+            cube = result.to_cube()
+            cube.values.shape  # (regions, crimes, periods, measures)
+            stockholm = cube.sel(region=u"Stockholms län", measure="count")
+            stockholm.values   # (crimes, periods)
+    """
+    def __init__(self, values, dims, categories):
+        """ :param values (numpy.ndarray|sparse.COO): The array
+            :param dims (list): Name of every axis, e.g. "region"
+            :param categories (list): The categories along every axis
+        """
+        self.values = values
+        self.dims = tuple(dims)
+        self.categories = dict(zip(self.dims, [list(x) for x in categories]))
+        # Position along every axis, by category id
+        self.index = {}
+        for dim in self.dims:
+            self.index[dim] = dict([(category.id, i) for i, category
+                                    in enumerate(self.categories[dim])])
+        self._label_index = {}
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def sel(self, **keys):
+        """ Select categories along one or more axes. A single category
+            drops the axis, a list of categories keeps it.
+
+                cube.sel(region=[u"Stockholms län", u"Skåne län"],
+                         period=u"År 2015")
+
+            :returns (Cube): Or a float, if a single category is selected
+                along every axis
+        """
+        unknown = [x for x in keys if x not in self.dims]
+        if unknown:
+            raise ValueError("Unknown dimensions: {}. Options are {}."\
+                .format(", ".join(unknown), ", ".join(self.dims)))
+
+        values = self.values
+        dims = []
+        categories = []
+        axis = 0
+        for dim in self.dims:
+            if dim not in keys:
+                dims.append(dim)
+                categories.append(self.categories[dim])
+                axis += 1
+                continue
+
+            key = keys[dim]
+            before = (slice(None),) * axis
+            if isinstance(key, (list, tuple)):
+                positions = [self.position(dim, x) for x in key]
+                values = values[before + (positions,)]
+                dims.append(dim)
+                categories.append([self.categories[dim][i] for i in positions])
+                axis += 1
+            else:
+                values = values[before + (self.position(dim, key),)]
+
+        if not dims:
+            return float(values)
+        return Cube(values, dims, categories)
+
+    def position(self, dim, id_or_label):
+        """ Get the position of a category along an axis
+            :param id_or_label: Id, label or end of label (see
+                `Dimension.get()`) of the category
+            :returns (int):
+        """
+        try:
+            return self.index[dim][id_or_label]
+        except KeyError:
+            pass
+
+        if dim not in self._label_index:
+            index = {}
+            for i, category in enumerate(self.categories[dim]):
+                index.setdefault(category.label_short, i)
+            for i, category in enumerate(self.categories[dim]):
+                index[category.label] = i
+            self._label_index[dim] = index
+
+        try:
+            return self._label_index[dim][id_or_label]
+        except KeyError:
+            raise KeyError(u"There is no {} {}.".format(dim, id_or_label))
+
+    def __array__(self, dtype=None, copy=None):
+        """ Support `numpy.asarray(cube)`. `copy` is passed by NumPy 2:
+            True to always copy, False to never copy and None to copy only
+            if needed.
+        """
+        values = self.values
+        if hasattr(values, "todense"):
+            if copy is False:
+                raise ValueError("A sparse cube can't be made dense "
+                                 "without a copy")
+            values = values.todense()
+            copy = None
+        if dtype is not None and values.dtype != dtype:
+            if copy is False:
+                raise ValueError("Can't convert the values to {} without "
+                                 "a copy".format(dtype))
+            return values.astype(dtype)
+        if copy:
+            return values.copy()
+        return values
+
+    def __repr__(self):
+        return "<Cube: {}>".format(" x ".join([
+            "{} {}s".format(n, dim) for dim, n in zip(self.dims, self.shape)]))
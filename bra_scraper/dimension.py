@@ -2,6 +2,7 @@
 import requests
 import re
 import csv
+from bisect import bisect_left, bisect_right
 from bra_scraper.surfer import Surfer
 from bra_scraper.category import Category, Period, Region
 
@@ -10,17 +11,24 @@ class Dimension(Surfer):
     """ A base class for dimensions in the BRÅ database
         (Region, Crime, Period)
     """
-    def __init__(self, html=None, url=None):
-        """ Init with either a html blob or a url from a topic page
+    def __init__(self, html=None, url=None, categories=None):
+        """ Init with either a html blob or a url from a topic page,
+            or with a list of categories (see `.rows()`)
             :param html (str): HTML source code from topic page
             :param url (str): Full url of topic page
+            :param categories (list): A list of (id, label, parent_id) tuples
         """
         super(Dimension, self).__init__()
         if url:
             html = self._fetch_html()
         self._html = html
         # Store all categories in a dict with id as key
-        self._categories = self._parse_categories(html)
+        if categories is not None:
+            self._categories = self._build_categories(categories)
+        else:
+            self._categories = self._parse_categories(html)
+        # Lookup of categories by id, label and end of label
+        self._index = self._index_categories()
         # The id as described in html code, used for parsing categories
         self._id = None
 
@@ -32,33 +40,41 @@ class Dimension(Surfer):
         return self.categories
 
     def get(self, id_or_label):
-        """ Get category by id or label
+        """ Get category by id, label or end of label
             :returns (Category):
         """
-        try:
-            # 1) try id
-            return self._categories[id_or_label]
-        except KeyError:
-            pass
-
-        # 2) try label
-        for cat in self.categories:
-            if cat.label == id_or_label:
-                return cat
-
-        # 3) try end of label
-        for cat in self.categories:
-            # Labels are long an over explicit, like
-            # "Hela landet, Stockholms län"
-            # Hence we check if the end of the label
-            # matches. Eg. "Stockholms län"
-            n_chars = len(id_or_label)
-            if cat.label[-n_chars:] == id_or_label:
-                return cat
-
-        # 4) No match
-        else:
-            return None
+        return self._index.get(id_or_label)
+
+    @property
+    def index(self):
+        """ A dict with all keys that `.get()` accepts and their categories
+        """
+        return self._index
+
+    def _index_categories(self):
+        """ Index categories by
+            1) id
+            2) label
+            3) end of label. Labels are long an over explicit, like
+               "Hela landet, Stockholms län". Hence we also index every
+               ending that starts at a new word, e.g. "Stockholms län".
+            If a key matches several categories, the first one wins.
+            :returns (dict):
+        """
+        by_label = {}
+        by_label_end = {}
+        for category in self.categories:
+            label = category.label
+            by_label.setdefault(label, category)
+            by_label_end.setdefault(category.label_short, category)
+            for i in range(1, len(label)):
+                if label[i-1] in " ," and label[i] != " ":
+                    by_label_end.setdefault(label[i:], category)
+
+        index = by_label_end
+        index.update(by_label)
+        index.update(self._categories)
+        return index
 
     def to_csv(self, file_path):
         """ Store all categories as a csv file
@@ -86,24 +102,38 @@ class Dimension(Surfer):
             :returns: A dict with category id's as keys and
                 category instances as values.
         """
-        _categories = {}
         regex_str = r'{}\[\d+\]="(.+)"'.format(self._var_name)
         _categories_raw = re.findall(
             regex_str,
             self._html)
 
-        for _category_string in _categories_raw:
-            id, label, parent_id = self._parse_category_string(_category_string)
-            _category = self._category_class(id, label)
+        return self._build_categories([self._parse_category_string(x)
+                                       for x in _categories_raw])
 
+    def _build_categories(self, rows):
+        """ Make categories from a list of (id, label, parent_id) tuples
+            :returns: A dict with category id's as keys and
+                category instances as values.
+        """
+        _categories = {}
+        for id, label, parent_id in rows:
+            _categories[id] = self._category_class(id, label)
+
+        for id, label, parent_id in rows:
             if parent_id:
                 if parent_id != id:
-                    _category.parent = _categories[parent_id]
-
-            _categories[id] = _category
+                    _categories[id].parent = _categories[parent_id]
 
         return _categories
 
+    def rows(self):
+        """ Get all categories as (id, label, parent_id) tuples.
+            Can be passed to the constructor as `categories`.
+            :returns (list):
+        """
+        return [(x.id, x.label, x.parent.id if x.parent else None)
+                for x in self.categories]
+
 
     def _parse_category_string(self, category_string):
         """ Parse id, label and parent of category from strings.
@@ -132,40 +162,70 @@ class Dimension(Surfer):
 
             :returns (str): HTML content of the topic page
         """
-        self.start_session()
-        r = self.session.get(self.url, verify=False)
+        self.ensure_session()
+        r = self.request("GET", self.url)
         return r.text
 
 class Regions(Dimension):
     """ Represents the regional dimension"""
-    def __init__(self, html=None, url=None):
+    def __init__(self, html=None, url=None, categories=None):
         self.name = "regions"
         # The id used in the html code
         self._var_name = "arrayRegionNiva[Ett|Tva]{3}"
         self._category_class = Region
-        super(Regions, self).__init__(html=html, url=url)
+        super(Regions, self).__init__(html=html, url=url,
+                                      categories=categories)
 
 
 class Crimes(Dimension):
     """ Represents represents the crime"""
-    def __init__(self, html=None, url=None):
+    def __init__(self, html=None, url=None, categories=None):
         self.name = "crimes"
         # The id used in the html code
         self._var_name = "arrayNiva[ett|tva]{3}" # Not the best regex
         self._category_class = Category
 
-        super(Crimes, self).__init__(html=html, url=url)
+        super(Crimes, self).__init__(html=html, url=url,
+                                     categories=categories)
 
 
 class Periods(Dimension):
     """ Represents the time dimension"""
-    def __init__(self, html=None, url=None):
+    def __init__(self, html=None, url=None, categories=None):
         self.name = "periods"
         # The id used in the html code
         self._var_name = "arrayPeriod"
         self._category_class = Period
-
-        super(Periods, self).__init__(html=html, url=url)
+        # Periods sorted by end, for selecting date ranges
+        self._interval_index = None
+
+        super(Periods, self).__init__(html=html, url=url,
+                                      categories=categories)
+
+    def select(self, period_start, period_end):
+        """ Get all periods that end within a date range. Yearly and
+            quarterly periods that have begun before `period_start` are
+            included, eg. 2016-12-01 will return:
+            - 2016 (whole year)
+            - 2016, Q4
+            - 2016, December
+
+            :param period_start (datetime):
+            :param period_end (datetime):
+            :returns (list): Periods in the same order as `.categories`
+        """
+        if self._interval_index is None:
+            periods = sorted(enumerate(self.categories),
+                             key=lambda x: (x[1].period_end, x[0]))
+            self._interval_index = (
+                [period.period_end for i, period in periods],
+                periods,
+            )
+        ends, periods = self._interval_index
+
+        selected = periods[bisect_left(ends, period_start):
+                           bisect_right(ends, period_end)]
+        return [period for i, period in sorted(selected)]
 
     def _parse_category_string(self, category_string):
         """ Period parsing differs slightly from Region and Crime.
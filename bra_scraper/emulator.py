@@ -0,0 +1,424 @@
+# encoding: utf-8
+""" A local stand-in for the BRÅ site, for load testing the scraper
+    without touching the real site. It serves a catalog of synthetic
+    topics and implements the pages the scraper uses (start, urval,
+    vantapopup, sok, soktabell and sokinfo), including the navigation
+    state of every session and the cap of 10 000 datapoints per search.
+    Latency, errors and overload can be injected.
+
+        python -m bra_scraper.emulator --port 8000 --latency 0.05
+
+        emulator = Emulator(n_regions=300, error_rate=0.01)
+        emulator.start()
+        scraper = BRA(base_url=emulator.base_url)
+        ...
+        emulator.stop()
+"""
+from __future__ import print_function
+
+import re
+import sys
+import socket
+import time
+import uuid
+import random
+import threading
+from argparse import ArgumentParser
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "Maj", "Jun", "Jul", "Aug", "Sep",
+          "Okt", "Nov", "Dec")
+
+# Max number of datapoints in one search
+MAX_DATAPOINTS = 10000
+
+
+""" SYNTHETIC TOPICS
+"""
+
+def period_rows(n):
+    """ Yearly, quarterly and monthly periods, like those of a topic
+        :returns (list): (id, label, parent_id) tuples
+    """
+    rows = []
+    year = 1975
+    while len(rows) < n:
+        rows.append((len(rows) + 1, u"År {}".format(year), None))
+        for q in range(1, 5):
+            rows.append((len(rows) + 1, u"{}, Kvartal {}".format(year, q), None))
+        for month in MONTHS:
+            rows.append((len(rows) + 1, u"{}, {}".format(year, month), None))
+        year += 1
+    return rows[:n]
+
+def region_rows(n):
+    """ :returns (list): (id, label, parent_id) tuples """
+    rows = [(1, u"Hela landet", None)]
+    for i in range(2, n + 1):
+        rows.append((i, u"Hela landet, Region {} kommun".format(i), 1))
+    return rows
+
+def crime_rows(n):
+    """ :returns (list): (id, label, parent_id) tuples """
+    rows = [(1, u"Samtliga brott", None)]
+    for i in range(2, n + 1):
+        rows.append((i, u"Samtliga brott, Brott {}".format(i), 1))
+    return rows
+
+def topic_html(n_regions, n_crimes, n_periods):
+    """ The javascript arrays of a topic page, that the dimensions are
+        parsed from
+    """
+    lines = []
+    for i, (id, label, parent) in enumerate(region_rows(n_regions)):
+        if parent is None:
+            lines.append(u'arrayRegionNivaEtt[{}]="{}*{}"'.format(i, id, label))
+        else:
+            lines.append(u'arrayRegionNivaTva[{}]="{}*{}*{}*{}"'.format(
+                i, id, label.split(", ")[-1], parent, label))
+    for i, (id, label, parent) in enumerate(crime_rows(n_crimes)):
+        if parent is None:
+            lines.append(u'arrayNivaett[{}]="{}*{}"'.format(i, id, label))
+        else:
+            lines.append(u'arrayNivatva[{}]="{}*{}*{}*{}"'.format(
+                i, id, label.split(", ")[-1], parent, label))
+    for i, (id, label, parent) in enumerate(period_rows(n_periods)):
+        lines.append(u'arrayPeriod[{}]="{}*{}*{}*ar"'.format(
+            i, id, label[-4:], label))
+    return u"\n".join(lines)
+
+def value(period_id, region_id, crime_id):
+    """ The (made up) count of a datapoint. Every 23rd one is missing.
+        :returns (int): The count, or None
+    """
+    seed = period_id * 7919 + region_id * 104729 + crime_id * 1299709
+    if seed % 23 == 0:
+        return None
+    return seed % 100000
+
+
+""" SERVER
+"""
+
+class SessionError(Exception):
+    """ Raised when a page is opened in the wrong order, or outside
+        of a session
+    """
+    pass
+
+
+class Emulator(ThreadingMixIn, HTTPServer):
+    """ A threaded http server that emulates the BRÅ site
+    """
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, n_topics=2, n_regions=30,
+                 n_crimes=10, n_periods=40, latency=0.0, jitter=0.0,
+                 error_rate=0.0, capacity=None, seed=None):
+        """ :param port (int): Port to listen to. 0 picks a free port.
+            :param n_topics (int): Number of topics in the catalog
+            :param n_regions (int): Number of regions of every topic
+            :param n_crimes (int): Number of crimes of every topic
+            :param n_periods (int): Number of periods of every topic
+            :param latency (float): Min response time, in seconds
+            :param jitter (float): Max random time added to `latency`
+            :param error_rate (float): Share of requests (0-1) that fail
+                with 503
+            :param capacity (int): Max number of requests in progress.
+                Requests beyond that fail with 503, like an overloaded
+                site. Default is no limit.
+            :param seed (int): Seed for latency and errors
+        """
+        HTTPServer.__init__(self, (host, port), RequestHandler)
+        self.n_topics = n_topics
+        self.n_regions = n_regions
+        self.n_crimes = n_crimes
+        self.n_periods = n_periods
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.capacity = capacity
+        self.random = random.Random(seed)
+        self.topic_page = topic_html(n_regions, n_crimes, n_periods)
+
+        # Navigation state of each session, by session id
+        self.sessions = {}
+        # Number of requests by page, and of failed requests by reason
+        self.requests = {}
+        self.errors = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        """ Pass as `base_url` to BRA, Topic or Surfer """
+        return "http://{}:{}/".format(*self.server_address[:2])
+
+    def start(self):
+        """ Serve in a background thread
+        """
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        # A client that hangs up in the middle of a response, like a
+        # cancelled request, is not an error of the server
+        if isinstance(sys.exc_info()[1], socket.error):
+            return
+        HTTPServer.handle_error(self, request, client_address)
+
+    def stats(self):
+        """ :returns (dict): Requests by page, errors by reason, number
+            of sessions and max number of concurrent requests
+        """
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "errors": dict(self.errors),
+                "sessions": len(self.sessions),
+                "max_in_flight": self.max_in_flight,
+            }
+
+    def catalog_page(self):
+        items = []
+        for i in range(self.n_topics):
+            menu_id = 101 + i
+            level = "brottskod" if i % 2 else "brottstyp"
+            items.append(
+                u'<li class="menySol"><a href="{url}solwebb/action/anmalda/'
+                u'urval/urval?menyid={id}"><span class="menytext">Topic {id}'
+                u'</span></a></li><li class="menyText">Synthetic topic, '
+                u'per {level}</li>'.format(url=self.base_url, id=menu_id,
+                                           level=level))
+        return u"<html><body><ul>{}</ul></body></html>".format(u"".join(items))
+
+    def result_page(self, search):
+        rows = []
+        for measure in search["measures"]:
+            for region_id in search["regions"]:
+                for crime_id in search["crimes"]:
+                    for period_id in search["periods"]:
+                        count = value(period_id, region_id, crime_id)
+                        if count is None:
+                            text = u".."
+                        elif measure == "antal_100":
+                            text = u"{}".format(count // 1000)
+                        else:
+                            text = u"{:,}".format(count).replace(",", u"&nbsp;")
+                        rows.append(
+                            u'<td align="right" class="resultatAntal" '
+                            u'headers="{} 289 {} {} {}">{}</td>'.format(
+                                period_id, crime_id, region_id, measure, text))
+        return u"<html><body><table><tr>{}</tr></table></body></html>"\
+            .format(u"</tr>\n<tr>".join(rows))
+
+    def notes_page(self, search):
+        region_id = search["regions"][0]
+        return (u'<html><body><div id="infotexter">'
+                u'<span>Region {0} kommun</span>'
+                u'<div>Uppgifterna för region {0} är preliminära.</div>'
+                u'</div></body></html>').format(region_id)
+
+    def handle(self, session, method, page, params):
+        """ Serve a page, following the navigation rules of the site
+            :param session (dict): State of the session
+            :param page (str): Last part of the path, e.g. "soktabell"
+            :param params (dict): Query string and form data
+            :returns (str): HTML
+        """
+        location = session.get("location")
+
+        if page == "start":
+            session["location"] = "start"
+            return self.catalog_page()
+
+        if page == "":
+            session["location"] = "root"
+            return u"<html><body>Startsida</body></html>"
+
+        if location is None:
+            raise SessionError("No session")
+
+        if page == "urval":
+            session["location"] = "urval"
+            session["topic"] = params["menyid"][0]
+            return u"<html><script>\n{}\n</script></html>".format(
+                self.topic_page)
+
+        if page == "vantapopup" and method == "POST":
+            if location != "urval":
+                raise SessionError("The search form is not open")
+            search = {}
+            for key, name in (("regions", "region_id_string"),
+                              ("crimes", "brottstyp_id_string"),
+                              ("periods", "period_id_string")):
+                search[key] = [int(x) for x in
+                               params.get(name, [""])[0].split("*") if x]
+            search["measures"] = [
+                measure for measure, name in (("antal", "antal"),
+                                              ("antal_100", "antal_100k"))
+                if params.get(name, ["0"])[0] == "1"]
+            n = 1
+            for ids in search.values():
+                n *= len(ids)
+            if n > MAX_DATAPOINTS:
+                raise SessionError("Search of {} datapoints".format(n))
+            session["location"] = "vantapopup"
+            session["search"] = search
+            return u"<html><body>Vänta...</body></html>"
+
+        if page == "sok":
+            if location != "vantapopup":
+                raise SessionError("No search made")
+            session["location"] = "sok"
+            return u"<html><body>Sökresultat</body></html>"
+
+        if page in ("soktabell", "sokinfo"):
+            if location not in ("sok", "soktabell", "sokinfo"):
+                raise SessionError("No search result")
+            session["location"] = page
+            if page == "soktabell":
+                return self.result_page(session["search"])
+            return self.notes_page(session["search"])
+
+        raise SessionError("Unknown page {}".format(page))
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    cookie_name = "JSESSIONID"
+
+    def do_GET(self):
+        self.respond("GET")
+
+    def do_POST(self):
+        self.respond("POST")
+
+    def respond(self, method):
+        server = self.server
+        url = urlparse(self.path)
+        page = re.sub(r"/+", "/", url.path).rstrip("/").split("/")[-1]
+        if page == "action":
+            page = ""
+        params = parse_qs(url.query)
+        if method == "POST":
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length).decode("utf-8")
+            params.update(parse_qs(body, keep_blank_values=True))
+
+        with server._lock:
+            server.requests[page] = server.requests.get(page, 0) + 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            in_flight = server.in_flight
+            delay = server.latency + server.random.uniform(0, server.jitter)
+            fail = server.random.random() < server.error_rate
+
+        try:
+            time.sleep(delay)
+            if server.capacity is not None and in_flight > server.capacity:
+                return self.error(503, "overloaded")
+            if fail:
+                return self.error(503, "injected")
+
+            session_id = self.session_id()
+            new_session = session_id is None or session_id not in server.sessions
+            if new_session:
+                if page not in ("", "start"):
+                    return self.error(500, "no session")
+                session_id = uuid.uuid4().hex
+                with server._lock:
+                    server.sessions[session_id] = {}
+
+            try:
+                content = server.handle(server.sessions[session_id],
+                                        method, page, params)
+            except SessionError as e:
+                return self.error(500, str(e))
+
+            self.send(200, content,
+                      session_id if new_session else None)
+        finally:
+            with server._lock:
+                server.in_flight -= 1
+
+    def session_id(self):
+        cookies = self.headers.get("Cookie") or ""
+        for cookie in cookies.split(";"):
+            name, _, value = cookie.strip().partition("=")
+            if name == self.cookie_name:
+                return value
+        return None
+
+    def error(self, status, reason):
+        with self.server._lock:
+            self.server.errors[reason] = self.server.errors.get(reason, 0) + 1
+        self.send(status, u"<html><body>Ett fel har uppstått: {}</body></html>"
+                  .format(reason))
+
+    def send(self, status, content, session_id=None):
+        body = content.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if session_id is not None:
+            self.send_header("Set-Cookie", "{}={}; Path=/".format(
+                self.cookie_name, session_id))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = ArgumentParser(description="Serve a local stand-in for the BRÅ site")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--topics", type=int, default=2,
+                        help="number of topics")
+    parser.add_argument("--regions", type=int, default=30,
+                        help="number of regions per topic")
+    parser.add_argument("--crimes", type=int, default=10,
+                        help="number of crimes per topic")
+    parser.add_argument("--periods", type=int, default=40,
+                        help="number of periods per topic")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="min response time in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="max random time added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="share of requests that fail (0-1)")
+    parser.add_argument("--capacity", type=int,
+                        help="max number of concurrent requests")
+    args = parser.parse_args()
+
+    emulator = Emulator(host=args.host, port=args.port, n_topics=args.topics,
+                        n_regions=args.regions, n_crimes=args.crimes,
+                        n_periods=args.periods, latency=args.latency,
+                        jitter=args.jitter, error_rate=args.error_rate,
+                        capacity=args.capacity)
+    print("Serving on {}".format(emulator.base_url))
+    try:
+        emulator.serve_forever()
+    except KeyboardInterrupt:
+        print(emulator.stats())
+
+if __name__ == '__main__':
+    main()
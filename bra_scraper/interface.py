@@ -5,7 +5,6 @@
 
 import sys
 import argparse
-import argcomplete
 import logging
 
 FORMAT = '%(asctime)s %(levelname)s: %(message)s'
@@ -102,7 +101,15 @@ class Interface:
                 c.pop("long", None),
                 **c)
 
-        argcomplete.autocomplete(self.parser)
+        # Tab completion is optional. argcomplete sets _ARGCOMPLETE when
+        # it runs the script to complete a command, so only import it then.
+        if "_ARGCOMPLETE" in os.environ:
+            try:
+                import argcomplete
+            except ImportError:
+                pass
+            else:
+                argcomplete.autocomplete(self.parser)
         self.args = self.parser.parse_args()
 
         self.logger = logging.getLogger(name)
@@ -0,0 +1,101 @@
+# encoding: utf-8
+import os
+import json
+import tempfile
+import threading
+from datetime import datetime
+from bra_scraper.utils import request_key
+
+
+class Manifest(object):
+    """ Keeps track of the periods that have already been fetched from
+        each topic, so that a new run only has to fetch new periods.
+        Periods are tracked per set of regions, crimes and measures
+        (see `.filters_key()`), as a period is only fetched for the
+        categories of the query. Stored as a json file:
+
+            {"101": {"3f786850e387550fdab836ed7e6dc881de23001b":
+                {"period_ids": [2108, 2074], "updated": "2016-10-01T..."}}}
+    """
+    def __init__(self, path):
+        """ :param path (str): Path to the json file. Created on `.save()`
+                if it does not exist.
+        """
+        self.path = path
+        self._topics = self._read()
+        # (topic id, filters key) of the entries added since the last save
+        self._changed = set()
+
+    @staticmethod
+    def filters_key(topic_id, region_ids, crime_ids, measure_ids):
+        """ Identify the regions, crimes and measures of a query. The order
+            of the ids does not matter.
+            :returns (str): A sha1 hash
+        """
+        return request_key(topic_id, region_ids, crime_ids, [], measure_ids)
+
+    def period_ids(self, topic_id, filters_key):
+        """ Get the ids of all fetched periods of a topic
+            :param topic_id (str): Menu id of the topic
+            :param filters_key (str): See `.filters_key()`
+            :returns (set):
+        """
+        try:
+            return set(self._topics[str(topic_id)][filters_key]["period_ids"])
+        except KeyError:
+            return set()
+
+    def add(self, topic_id, filters_key, period_ids):
+        """ Mark periods as fetched
+            :param topic_id (str): Menu id of the topic
+            :param filters_key (str): See `.filters_key()`
+            :param period_ids (list): Ids of the fetched periods
+        """
+        period_ids = self.period_ids(topic_id, filters_key) | set(period_ids)
+        self._topics.setdefault(str(topic_id), {})[filters_key] = {
+            "period_ids": sorted(period_ids),
+            "updated": datetime.now().isoformat(),
+        }
+        self._changed.add((str(topic_id), filters_key))
+
+    def save(self):
+        """ Write the entries that were added to the file. Entries that
+            other Manifest instances have written to the file in the
+            meantime, like those of other jobs of a batch, are kept.
+        """
+        with _lock(self.path):
+            topics = self._read()
+            for topic_id, filters_key in self._changed:
+                entry = dict(self._topics[topic_id][filters_key])
+                try:
+                    written = topics[topic_id][filters_key]["period_ids"]
+                except KeyError:
+                    written = []
+                entry["period_ids"] = sorted(set(entry["period_ids"]) |
+                                             set(written))
+                topics.setdefault(topic_id, {})[filters_key] = entry
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(topics, f, indent=2, sort_keys=True)
+            os.rename(tmp_path, self.path)
+
+            self._topics = topics
+            self._changed = set()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+
+# A lock per manifest file, for threads that share one
+_locks = {}
+_locks_lock = threading.Lock()
+
+def _lock(path):
+    path = os.path.abspath(path)
+    with _locks_lock:
+        return _locks.setdefault(path, threading.Lock())
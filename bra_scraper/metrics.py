@@ -0,0 +1,215 @@
+# encoding: utf-8
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Upper bounds of the latency histogram, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Metrics(object):
+    """ Collects the latency, size and status of every request and the
+        time spent in every phase of a scrape (fetching the catalog,
+        parsing dimensions, planning, fetching, parsing data and notes,
+        exporting), for export as json or in the Prometheus text format.
+
+            metrics = Metrics()
+            scraper = BRA(metrics=metrics)
+            ...
+            metrics.to_json("metrics.json")
+            metrics.to_prometheus("metrics.prom")
+    """
+    def __init__(self):
+        self.started = time.time()
+        self.datapoints = 0
+        # Per (step, status): count, total latency, total bytes and
+        # counts per latency bucket
+        self._requests = {}
+        # Per phase: count and total duration
+        self._phases = {}
+        self._last_update = self.started
+        self._lock = threading.Lock()
+
+    def record_request(self, method, url, latency, n_bytes, status):
+        """ Record a finished request
+            :param url (str): Url of the request. Requests are grouped by
+                step, the last part of the path ("soktabell" for example).
+            :param latency (float): Duration in seconds
+            :param n_bytes (int): Size of the response body
+            :param status (int): Http status, or None if the request failed
+                without a response
+        """
+        key = (request_step(method, url), status)
+        with self._lock:
+            if key not in self._requests:
+                self._requests[key] = {
+                    "count": 0,
+                    "seconds": 0.0,
+                    "bytes": 0,
+                    "buckets": [0] * len(LATENCY_BUCKETS),
+                }
+            stats = self._requests[key]
+            stats["count"] += 1
+            stats["seconds"] += latency
+            stats["bytes"] += n_bytes
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    stats["buckets"][i] += 1
+            self._last_update = time.time()
+
+    def record_phase(self, name, duration):
+        """ Record time spent in a phase
+            :param name (str): "catalog" | "dimensions" | "store" | "plan" |
+                "fetch" | "parse" | "notes" | "export"
+            :param duration (float): Seconds
+        """
+        with self._lock:
+            stats = self._phases.setdefault(name, {"count": 0, "seconds": 0.0})
+            stats["count"] += 1
+            stats["seconds"] += duration
+            self._last_update = time.time()
+
+    @contextmanager
+    def phase(self, name):
+        """ Time a block of code as a phase
+
+                with metrics.phase("export"):
+                    result.data.to_csv(path)
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record_phase(name, time.time() - start)
+
+    def add_datapoints(self, n):
+        """ Count scraped datapoints
+        """
+        with self._lock:
+            self.datapoints += n
+            self._last_update = time.time()
+
+    @property
+    def datapoints_per_second(self):
+        """ Scraped datapoints per second, from the start until the last
+            recorded event
+        """
+        duration = self._last_update - self.started
+        if not duration:
+            return 0.0
+        return self.datapoints / duration
+
+    def to_dict(self):
+        """ :returns (dict): All metrics """
+        with self._lock:
+            requests = []
+            for (step, status), stats in sorted(self._requests.items(),
+                    key=lambda x: (x[0][0], x[0][1] or 0)):
+                requests.append({
+                    "step": step,
+                    "status": status,
+                    "count": stats["count"],
+                    "seconds": stats["seconds"],
+                    "mean_seconds": stats["seconds"] / stats["count"],
+                    "bytes": stats["bytes"],
+                })
+            phases = {}
+            for name, stats in self._phases.items():
+                phases[name] = dict(stats)
+
+        return {
+            "started": self.started,
+            "duration": self._last_update - self.started,
+            "datapoints": self.datapoints,
+            "datapoints_per_second": self.datapoints_per_second,
+            "requests": requests,
+            "phases": phases,
+        }
+
+    def to_json(self, path=None):
+        """ Export as json
+            :param path (str): File to write to
+            :returns (str): The json, if no path is given
+        """
+        content = json.dumps(self.to_dict(), indent=2, sort_keys=True)
+        if path is None:
+            return content
+        with open(path, "w") as f:
+            f.write(content)
+
+    def to_prometheus(self, path=None):
+        """ Export in the Prometheus text format, e.g. for the textfile
+            collector of the node exporter
+            :param path (str): File to write to
+            :returns (str): The metrics, if no path is given
+        """
+        lines = []
+
+        def metric(name, kind, help):
+            lines.append("# HELP bra_scraper_{} {}".format(name, help))
+            lines.append("# TYPE bra_scraper_{} {}".format(name, kind))
+
+        def sample(name, labels, value):
+            labels = ",".join(['{}="{}"'.format(k, v) for k, v in labels])
+            if labels:
+                name = "{}{{{}}}".format(name, labels)
+            lines.append("bra_scraper_{} {}".format(name, repr(float(value))))
+
+        with self._lock:
+            requests = sorted(self._requests.items(),
+                              key=lambda x: (x[0][0], x[0][1] or 0))
+            phases = sorted(self._phases.items())
+
+        metric("request_duration_seconds", "histogram",
+               "Duration of requests to the site by step and status")
+        for (step, status), stats in requests:
+            labels = [("step", step), ("status", status or "error")]
+            for bound, count in zip(LATENCY_BUCKETS, stats["buckets"]):
+                sample("request_duration_seconds_bucket",
+                       labels + [("le", bound)], count)
+            sample("request_duration_seconds_bucket",
+                   labels + [("le", "+Inf")], stats["count"])
+            sample("request_duration_seconds_sum", labels, stats["seconds"])
+            sample("request_duration_seconds_count", labels, stats["count"])
+
+        metric("response_bytes_total", "counter",
+               "Size of responses from the site by step and status")
+        for (step, status), stats in requests:
+            sample("response_bytes_total",
+                   [("step", step), ("status", status or "error")],
+                   stats["bytes"])
+
+        metric("phase_duration_seconds", "summary",
+               "Time spent in each phase of a scrape")
+        for name, stats in phases:
+            sample("phase_duration_seconds_sum", [("phase", name)],
+                   stats["seconds"])
+            sample("phase_duration_seconds_count", [("phase", name)],
+                   stats["count"])
+
+        metric("datapoints_total", "counter", "Scraped datapoints")
+        sample("datapoints_total", [], self.datapoints)
+        metric("datapoints_per_second", "gauge", "Scraped datapoints per second")
+        sample("datapoints_per_second", [], self.datapoints_per_second)
+
+        content = "\n".join(lines) + "\n"
+        if path is None:
+            return content
+        with open(path, "w") as f:
+            f.write(content)
+
+    def __repr__(self):
+        return "<Metrics: {} requests, {} datapoints>".format(
+            sum([x["count"] for x in self._requests.values()]),
+            self.datapoints)
+
+
+def request_step(method, url):
+    """ Name a request by the last part of its path
+        :returns (str): e.g. "soktabell", or "start" for the start page
+    """
+    path = url.split("?")[0].rstrip("/").split("/")[-1]
+    if path in ("", "action"):
+        return "start"
+    return path
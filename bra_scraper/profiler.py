@@ -0,0 +1,184 @@
+# encoding: utf-8
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class Profiler(object):
+    """ Profiles a run phase by phase: a cProfile profile of the main
+        thread, memory use per phase (traced with tracemalloc on Python 3,
+        max resident size on Python 2) and a sampled stack dump of all
+        threads in the folded format of flamegraph.pl and speedscope.
+
+            profiler = Profiler()
+            profiler.start()
+            with profiler.phase("query"):
+                result = topic.query()
+            profiler.stop()
+            profiler.write("data.csv")  # data.csv.profile.txt etc.
+    """
+    def __init__(self, interval=0.005, n_top=40):
+        """ :param interval (float): Seconds between stack samples
+            :param n_top (int): Number of functions and allocation sites
+                to list in the report
+        """
+        self.interval = interval
+        self.n_top = n_top
+        self.profile = cProfile.Profile()
+        # (name, seconds, memory stats) of every finished phase
+        self.phases = []
+        # Number of samples of every folded stack
+        self.stacks = {}
+        self._sampler = None
+        self._running = False
+
+    def start(self):
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._running = True
+        self._sampler = threading.Thread(target=self._sample)
+        self._sampler.daemon = True
+        self._sampler.start()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self._running = False
+        if self._sampler is not None:
+            self._sampler.join()
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextmanager
+    def phase(self, name):
+        """ Time and measure the memory use of a block of code
+        """
+        before = None
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+        rss_before = max_rss()
+        start = time.time()
+        try:
+            yield
+        finally:
+            duration = time.time() - start
+            memory = {"max_rss_growth": max_rss() - rss_before}
+            if before is not None:
+                current, peak = tracemalloc.get_traced_memory()
+                after = tracemalloc.take_snapshot()
+                memory["current"] = current
+                memory["peak"] = peak
+                # Leave out the allocations of the profiler itself
+                ignore = [tracemalloc.Filter(False, __file__),
+                          tracemalloc.Filter(False, tracemalloc.__file__)]
+                after = after.filter_traces(ignore)
+                before = before.filter_traces(ignore)
+                memory["top"] = [str(x) for x in
+                                 after.compare_to(before, "lineno")[:10]]
+            self.phases.append((name, duration, memory))
+
+    def write(self, path):
+        """ Write the report to `path` + ".profile.txt", the stack dump to
+            `path` + ".folded" and the raw profile (for pstats, snakeviz
+            etc) to `path` + ".pstats"
+            :param path (str): Typically the path of the output file
+            :returns (list): Paths of the written files
+        """
+        report_path = path + ".profile.txt"
+        folded_path = path + ".folded"
+        pstats_path = path + ".pstats"
+
+        with open(report_path, "w") as f:
+            f.write(self.report())
+
+        with open(folded_path, "w") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write("{} {}\n".format(stack, count))
+
+        self.profile.dump_stats(pstats_path)
+
+        return [report_path, folded_path, pstats_path]
+
+    def report(self):
+        """ :returns (str): Phases with timings and memory, followed by
+            the functions with the highest cumulative time
+        """
+        lines = ["PHASES", ""]
+        lines.append("{:<12} {:>10} {:>12} {:>12} {:>14}".format(
+            "phase", "seconds", "peak MB", "current MB", "max rss +MB"))
+        for name, duration, memory in self.phases:
+            lines.append("{:<12} {:>10.3f} {:>12} {:>12} {:>14.1f}".format(
+                name, duration,
+                _megabytes(memory.get("peak")),
+                _megabytes(memory.get("current")),
+                memory["max_rss_growth"] / 1024.0 / 1024))
+
+        for name, duration, memory in self.phases:
+            if memory.get("top"):
+                lines += ["", "Largest allocations in {}:".format(name)]
+                lines += ["  " + x for x in memory["top"]]
+
+        stream = StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats("cumulative").print_stats(self.n_top)
+        lines += ["", "", "CPU PROFILE (main thread)", "", stream.getvalue()]
+
+        return "\n".join(lines)
+
+    def _sample(self):
+        """ Count the stack of every thread, every `interval` seconds
+        """
+        own_id = threading.current_thread().ident
+        names = {}
+        while self._running:
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append("{}:{}:{}".format(
+                        os.path.basename(code.co_filename), code.co_name,
+                        code.co_firstlineno))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, "thread"))
+                key = ";".join(reversed(stack)).replace(" ", "_")
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            time.sleep(self.interval)
+
+
+def max_rss():
+    """ Max resident size of the process so far, in bytes """
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return rss if sys.platform == "darwin" else rss * 1024
+
+def _megabytes(n_bytes):
+    if n_bytes is None:
+        return "-"
+    return "{:.1f}".format(n_bytes / 1024.0 / 1024)
@@ -1,5 +1,10 @@
 # encoding: utf-8
+import os
+import sys
 import csv
+import json
+from array import array
+from numbers import Integral
 
 class ResultSet(object):
     """ Represents the response you get from a query
@@ -25,6 +30,15 @@ class ResultSet(object):
         """
         self._data += data
 
+    def add_results(self, results):
+        """ Append the data and notes of another ResultSet
+            :param results (ResultSet):
+        """
+        self.add_data(results.data)
+        for category, notes in results.notes.items():
+            for note in notes:
+                self.add_note(category, note)
+
     def add_note(self, category, note):
         """ Add a note to a category.
             One category can have multiple (but not identical notes)
@@ -38,6 +52,48 @@ class ResultSet(object):
         if note not in self._notes[category]:
             self._notes[category].append(note)
 
+    def save(self, path, topic=None, append=False):
+        """ Save the data in a format picked by the file extension:
+            a SQLite database (.db, .sqlite, .sqlite3, with the notes),
+            Parquet (.parquet) or csv (anything else)
+            :param path (str): file path
+            :param topic (Topic|str): The queried topic. Required for SQLite.
+            :param append (bool): Append to an existing csv file. A
+                database is always added to.
+        """
+        if path.endswith((".db", ".sqlite", ".sqlite3")):
+            if topic is None:
+                raise ValueError("A topic is needed to save to SQLite")
+            self.to_sqlite(path, topic)
+        elif path.endswith(".parquet"):
+            if append:
+                raise ValueError("Parquet files can't be appended to")
+            self.data.to_parquet(path)
+        else:
+            self.data.to_csv(path, append=append)
+
+    def to_sqlite(self, path, topic):
+        """ Load the data and notes into a SQLite database. Datapoints that
+            are already in the database are replaced, so loading the same
+            data again does not duplicate it. See `SqliteStore`.
+            :param path (str): Path to the database file
+            :param topic (Topic|str): The queried topic, or its menu id
+            :returns (int): Number of loaded datapoints
+        """
+        from bra_scraper.store import SqliteStore
+        store = SqliteStore(path)
+        try:
+            return store.save(self, topic)
+        finally:
+            store.close()
+
+    def to_cube(self, **kwargs):
+        """ Get the data as an array with one axis per dimension. Takes
+            the same parameters as `Dataset.to_cube()`. Requires numpy.
+            :returns (Cube):
+        """
+        return self.data.to_cube(**kwargs)
+
     def note(self, category):
         """ Get a note for a category value (a crime name
             or region for example)
@@ -49,63 +105,565 @@ class ResultSet(object):
 
 
 
-class Dataset(list):
-    """ This is where we store the results from the scraper
-        Basically a wrapper around Python's native list class.
+class Dataset(object):
+    """ This is where we store the results from the scraper.
+        Datapoints are stored column by column: the period, region, crime
+        and measure of every datapoint as an integer code (an index in the
+        list of categories of that dimension), the values as floats with
+        a mask for missing values and a flag for integer values, and the
+        status as a code.
+        Iterating gives a dict per datapoint, just like a list of dicts.
+        It supports indexing, slicing, `len()`, `==`, `append()`,
+        `extend()`, `+=`, `pop()` and `sort()`, but is not a `list`.
     """
-    def to_csv(self, path):
-        return self.dataframe.to_csv(path, encoding="utf-8")
+    DIMENSIONS = ("period", "region", "crime", "measure")
+
+    def __init__(self, data=None):
+        """ :param data (list): Datapoints to start with, as dicts
+        """
+        # Code columns and categories of each dimension
+        self._codes = dict([(dim, array("i")) for dim in self.DIMENSIONS])
+        self._categories = dict([(dim, []) for dim in self.DIMENSIONS])
+        self._category_codes = dict([(dim, {}) for dim in self.DIMENSIONS])
+
+        self._values = array("d")
+        self._missing = array("b")
+        # Whether every value is an integer (a count) or not
+        self._integer = array("b")
+        self._statuses = [None, "missing"]
+        self._status_codes = array("b")
+
+        if data is not None:
+            self.extend(data)
+
+    def append(self, datapoint):
+        """ Append a datapoint
+            :param datapoint (dict): A dict with period, region, crime and
+                measure (as Category instances), value and status.
+        """
+        self.add(datapoint["period"], datapoint["region"], datapoint["crime"],
+                 datapoint["measure"], datapoint["value"], datapoint["status"])
+
+    def add(self, period, region, crime, measure, value, status=None):
+        """ Append a datapoint without making a dict of it first
+        """
+        codes = self._codes
+        codes["period"].append(self._category_code("period", period))
+        codes["region"].append(self._category_code("region", region))
+        codes["crime"].append(self._category_code("crime", crime))
+        codes["measure"].append(self._category_code("measure", measure))
+
+        if value is None:
+            self._values.append(0.0)
+            self._missing.append(1)
+            self._integer.append(1)
+        else:
+            self._values.append(value)
+            self._missing.append(0)
+            self._integer.append(isinstance(value, Integral))
+
+        if status not in self._statuses:
+            self._statuses.append(status)
+        self._status_codes.append(self._statuses.index(status))
+
+    def extend(self, data):
+        """ Append datapoints
+            :param data (Dataset|list): Another Dataset, or a list of dicts
+        """
+        if not isinstance(data, Dataset):
+            for datapoint in data:
+                self.append(datapoint)
+            return
+
+        # Copy the columns, translating the codes of the other dataset
+        for dim in self.DIMENSIONS:
+            translate = [self._category_code(dim, category)
+                         for category in data._categories[dim]]
+            self._codes[dim].extend(
+                array("i", [translate[x] for x in data._codes[dim]]))
+
+        for status in data._statuses:
+            if status not in self._statuses:
+                self._statuses.append(status)
+        translate = [self._statuses.index(x) for x in data._statuses]
+        self._status_codes.extend(
+            array("b", [translate[x] for x in data._status_codes]))
+
+        self._values.extend(data._values)
+        self._missing.extend(data._missing)
+        self._integer.extend(data._integer)
+
+    def __iadd__(self, data):
+        self.extend(data)
+        return self
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self._take(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Dataset index out of range")
+        datapoint = {}
+        for dim in self.DIMENSIONS:
+            datapoint[dim] = self._categories[dim][self._codes[dim][i]]
+        datapoint["value"] = self._value(i)
+        datapoint["status"] = self._statuses[self._status_codes[i]]
+        return datapoint
+
+    def __eq__(self, other):
+        """ Compare with another Dataset, or a list of datapoint dicts
+        """
+        if not isinstance(other, (Dataset, list)):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    # Mutable, like a list
+    __hash__ = None
+
+    def pop(self, i=-1):
+        """ Remove a datapoint and return it, like `list.pop()`
+        """
+        datapoint = self[i]
+        if i < 0:
+            i += len(self)
+        for column in self._row_columns():
+            del column[i]
+        return datapoint
+
+    def sort(self, key=None, reverse=False):
+        """ Sort the datapoints in place, like `list.sort()`
+            :param key: A function of a datapoint dict
+        """
+        if key is None:
+            rows = sorted(range(len(self)), key=self.__getitem__,
+                          reverse=reverse)
+        else:
+            rows = sorted(range(len(self)), key=lambda i: key(self[i]),
+                          reverse=reverse)
+        # Take over the columns of the sorted copy
+        self.__dict__.update(self._take(rows).__dict__)
+
+    def _row_columns(self):
+        """ The columns with one item per datapoint """
+        return [self._codes[dim] for dim in self.DIMENSIONS] + \
+            [self._values, self._missing, self._integer, self._status_codes]
+
+    def _take(self, rows):
+        """ Get some of the datapoints as a new Dataset, with only the
+            categories that they use
+            :param rows (slice|list): A slice, or row numbers
+        """
+        if isinstance(rows, slice):
+            take = lambda column: column[rows]
+        else:
+            take = lambda column: array(column.typecode,
+                                        [column[x] for x in rows])
+        data = Dataset()
+        for dim in self.DIMENSIONS:
+            categories = self._categories[dim]
+            data._codes[dim] = array("i", [
+                data._category_code(dim, categories[x])
+                for x in take(self._codes[dim])])
+        data._values = take(self._values)
+        data._missing = take(self._missing)
+        data._integer = take(self._integer)
+        data._statuses = list(self._statuses)
+        data._status_codes = take(self._status_codes)
+        return data
+
+    def __repr__(self):
+        return "<Dataset: {} datapoints>".format(len(self))
+
+    # Columns of the csv export, after an unnamed column with the row
+    # number. Same layout as the csv files written with pandas before.
+    CSV_COLUMNS = ["crime", "crime_id", "measure", "measure_id", "period",
+                   "period_id", "periodicity", "region", "region_id",
+                   "status", "timepoint", "value"]
+
+    def to_csv(self, path, append=False):
+        """ Save as csv. Rows are written as they are produced, straight
+            from the columns of the dataset.
+            :param path: file path
+            :param append (bool): Append rows to an existing file. The
+                row numbers go on from the last row of the file.
+        """
+        if append and os.path.exists(path):
+            start = _last_row_number(path) + 1
+            with _open_csv(path, "a") as f:
+                csv.writer(f).writerows(self._csv_rows(start))
+        else:
+            with _open_csv(path, "w") as f:
+                writer = csv.writer(f)
+                writer.writerow([""] + self.CSV_COLUMNS)
+                writer.writerows(self._csv_rows())
+
+    def _csv_rows(self, start=0):
+        """ :param start (int): Number of the first row
+            :returns: A generator of csv rows, as lists of strings
+        """
+        # Cell values of every category, looked up by code
+        cells = {}
+        for dim in self.DIMENSIONS:
+            cells[dim] = [(_csv_cell(x.label), _csv_cell(x.id))
+                          for x in self._categories[dim]]
+        periods = [(_csv_cell(x.periodicity),
+                    x.period_start.strftime("%Y-%m-%d"))
+                   for x in self._categories["period"]]
+        statuses = [_csv_cell(x) for x in self._statuses]
+        codes = self._codes
+
+        for i in range(len(self)):
+            crime = cells["crime"][codes["crime"][i]]
+            measure = cells["measure"][codes["measure"][i]]
+            period_code = codes["period"][i]
+            period = cells["period"][period_code]
+            periodicity, timepoint = periods[period_code]
+            region = cells["region"][codes["region"][i]]
+            yield [start + i, crime[0], crime[1], measure[0], measure[1], period[0],
+                   period[1], periodicity, region[0], region[1],
+                   statuses[self._status_codes[i]], timepoint,
+                   _csv_cell(self._value(i))]
 
     @property
     def dataframe(self):
         import pandas as pd
-        return pd.DataFrame(self.dictlist)
+        return pd.DataFrame(self.columns)
+
+    def to_parquet(self, path, row_group_size=100000, compression="snappy"):
+        """ Save as a Parquet file, straight from the columns of the
+            dataset. Labels are dictionary encoded. Requires pyarrow.
+            :param path: file path
+            :param row_group_size (int): Number of datapoints per row group
+            :param compression (str): "snappy" | "gzip" | "zstd" | None
+        """
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for batch in self.record_batches(row_group_size):
+                if writer is None:
+                    writer = pq.ParquetWriter(path, batch.schema,
+                                              compression=compression)
+                writer.write_table(_arrow().Table.from_batches([batch]))
+            if writer is None:
+                # No data, but write the columns
+                pq.write_table(self.to_arrow(), path, compression=compression)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def to_arrow(self):
+        """ Get the data as an Arrow table, with the same columns as
+            `.columns`. Requires pyarrow.
+            :returns (pyarrow.Table):
+        """
+        pa = _arrow()
+        batches = list(self.record_batches())
+        if not batches:
+            return pa.Table.from_batches([], schema=self._arrow_schema())
+        return pa.Table.from_batches(batches)
+
+    def record_batches(self, batch_size=None):
+        """ Get the data as Arrow record batches. The dimension columns
+            are built from the category codes, without making a Python
+            object per datapoint. Requires pyarrow.
+            :param batch_size (int): Max number of datapoints per batch.
+                Default is one batch.
+            :returns: A generator of pyarrow.RecordBatch
+        """
+        pa = _arrow()
+        import pyarrow.compute as pc
+
+        n = len(self)
+        if batch_size is None:
+            batch_size = max(n, 1)
+
+        # Per category columns, looked up by code in every batch
+        dictionaries = {}
+        for dim in self.DIMENSIONS:
+            categories = self._categories[dim]
+            dictionaries[dim] = {
+                "label": pa.array([x.label for x in categories], pa.string()),
+                "id": pa.array([x.id for x in categories]),
+            }
+        periods = self._categories["period"]
+        dictionaries["period"]["timepoint"] = pa.array(
+            [x.period_start for x in periods], pa.timestamp("s"))
+        dictionaries["period"]["periodicity"] = pa.array(
+            [x.periodicity for x in periods], pa.string())
+        # Status code 0 (no status) is stored as null, not in the dictionary
+        statuses = pa.array([x or "" for x in self._statuses], pa.string())
+
+        # One type for the value column: integers if all values are
+        integer_values = 0 not in self._integer
+
+        def buffer_array(type, values):
+            return pa.Array.from_buffers(type, len(values),
+                                         [None, pa.py_buffer(values)])
+
+        for start in range(0, n, batch_size):
+            end = min(start + batch_size, n)
+            columns = []
+            for dim in self.DIMENSIONS:
+                codes = buffer_array(pa.int32(),
+                                     memoryview(self._codes[dim])[start:end])
+                dictionary = dictionaries[dim]
+                columns.append((dim, pa.DictionaryArray.from_arrays(
+                    codes, dictionary["label"])))
+                columns.append((dim + "_id", dictionary["id"].take(codes)))
+                if dim == "period":
+                    columns.append(("timepoint",
+                                    dictionary["timepoint"].take(codes)))
+                    columns.append(("periodicity",
+                        pa.DictionaryArray.from_arrays(
+                            codes, dictionary["periodicity"])))
+
+            missing = buffer_array(pa.int8(),
+                memoryview(self._missing)[start:end]).cast(pa.bool_())
+            values = buffer_array(pa.float64(),
+                                  memoryview(self._values)[start:end])
+            if integer_values:
+                values = values.cast(pa.int64())
+            values = pc.if_else(missing, pa.scalar(None, values.type), values)
+            status_codes = buffer_array(pa.int8(),
+                memoryview(self._status_codes)[start:end])
+            status_codes = pc.if_else(pc.equal(status_codes, 0),
+                                      pa.scalar(None, pa.int8()), status_codes)
 
+            columns.append(("value", values))
+            columns.append(("status", pa.DictionaryArray.from_arrays(
+                status_codes, statuses)))
+
+            yield pa.RecordBatch.from_arrays([x[1] for x in columns],
+                                             names=[x[0] for x in columns])
+
+    def _arrow_schema(self):
+        """ Schema of an empty dataset
+        """
+        pa = _arrow()
+        label = pa.dictionary(pa.int32(), pa.string())
+        return pa.schema([
+            ("period", label), ("period_id", pa.int64()),
+            ("timepoint", pa.timestamp("s")), ("periodicity", label),
+            ("region", label), ("region_id", pa.int64()),
+            ("crime", label), ("crime_id", pa.int64()),
+            ("measure", label), ("measure_id", pa.string()),
+            ("value", pa.int64()),
+            ("status", pa.dictionary(pa.int8(), pa.string())),
+        ])
+
+    def to_cube(self, dims=("region", "crime", "period", "measure"),
+                topic=None, sparse=False):
+        """ Get the values as an array with one axis per dimension, with
+            NaN for missing values. The array is filled in one go, straight
+            from the columns of the dataset. Requires numpy, and the sparse
+            package for sparse arrays.
+
+                cube = result.data.to_cube(topic=topic)
+                cube.sel(region=u"Stockholms län", crime=u"Samtliga brott")
+
+            :param dims (tuple): Order of the axes. A dimension can only be
+                left out if the data has one category of it.
+            :param topic (Topic): Make every axis span all categories of the
+                dimension of the topic, in the order of the site. By default
+                the axes span the categories in the data, in the order
+                they first occur.
+            :param sparse (bool): Return a `sparse.COO` array, with only the
+                values that we have stored
+            :returns (Cube):
+        """
+        from bra_scraper.cube import Cube
+        np = _numpy()
+
+        for dim in self.DIMENSIONS:
+            if dim in dims:
+                continue
+            n_categories = len(set(self._codes[dim]))
+            if n_categories > 1:
+                raise ValueError("The data has {} {} categories. Only a "
+                    "dimension with one category can be left out."\
+                    .format(n_categories, dim))
+
+        categories = []
+        positions = []
+        for dim in dims:
+            if dim not in self.DIMENSIONS:
+                raise ValueError("{} is not a dimension. Options are {}."\
+                    .format(dim, ", ".join(self.DIMENSIONS)))
+            codes = _column(np, self._codes[dim], np.intc)
+            if topic is None:
+                categories.append(self._categories[dim])
+                positions.append(codes)
+            else:
+                dim_categories = list(topic.dimension(dim + "s").categories)
+                index = dict([(x.id, i) for i, x in enumerate(dim_categories)])
+                translate = np.array([index[x.id] for x in
+                                      self._categories[dim]], dtype=np.intp)
+                categories.append(dim_categories)
+                positions.append(translate[codes])
+
+        shape = tuple([len(x) for x in categories])
+        values = _column(np, self._values, np.float64)
+        missing = _column(np, self._missing, np.int8).astype(bool)
+
+        if sparse:
+            try:
+                import sparse as sp
+            except ImportError:
+                raise ImportError("Sparse cubes require the sparse package. "
+                                  "Install it with `pip install sparse`.")
+            coords = np.vstack([x[~missing] for x in positions])
+            values = values[~missing]
+            # Keep the last value of every cell, like the dense array
+            cells = np.ravel_multi_index(coords, shape)
+            last = len(cells) - 1 - np.unique(cells[::-1], return_index=True)[1]
+            array = sp.COO(coords[:, last], values[last], shape=shape,
+                           fill_value=np.nan, has_duplicates=False,
+                           sorted=True)
+        else:
+            array = np.full(shape, np.nan)
+            values = values.copy()
+            values[missing] = np.nan
+            array[tuple(positions)] = values
+
+        return Cube(array, dims, categories)
+
+    @property
+    def columns(self):
+        """ The data as a dict of columns, with the same keys as the dicts
+            in `.dictlist`.
+        """
+        def column(dim, attr):
+            # Look up the attribute once per category, not once per row
+            values = [getattr(x, attr) for x in self._categories[dim]]
+            return [values[x] for x in self._codes[dim]]
+
+        return {
+            "period": column("period", "label"),
+            "period_id": column("period", "id"),
+            "timepoint": column("period", "period_start"),
+            "periodicity": column("period", "periodicity"),
+            "region": column("region", "label"),
+            "region_id": column("region", "id"),
+            "crime": column("crime", "label"),
+            "crime_id": column("crime", "id"),
+            "measure": column("measure", "label"),
+            "measure_id": column("measure", "id"),
+            "value": [self._value(i) for i in range(len(self))],
+            "status": [self._statuses[x] for x in self._status_codes],
+        }
 
     @property
     def dictlist(self):
-        _dictlist = []
-        for row in self:
-            _dictlist.append({
-                "period": row["period"].label,
-                "period_id": row["period"].id,
-                "timepoint": row["period"].period_start,
-                "periodicity": row["period"].periodicity,
-                "region": row["region"].label,
-                "region_id": row["region"].id,
-                "crime": row["crime"].label,
-                "crime_id": row["crime"].id,
-                "measure": row["measure"].label,
-                "measure_id": row["measure"].id,
-                "value": row["value"],
-                "status": row["status"],
-                })
-        return _dictlist
+        columns = self.columns
+        keys = columns.keys()
+        return [dict(zip(keys, row)) for row in zip(*columns.values())]
 
     def as_dictlist(self):
-        return self
+        return list(self)
+
+    def categories(self, dim):
+        """ Get the categories of a dimension that occur in the data
+            :param dim (str): "period" | "region" | "crime" | "measure"
+            :returns (list):
+        """
+        return list(self._categories[dim])
+
+    def id_rows(self):
+        """ Get the datapoints as tuples of ids, without making a dict
+            per datapoint
+            :returns: A generator of (period_id, region_id, crime_id,
+                measure_id, value, status) tuples
+        """
+        ids = [[x.id for x in self._categories[dim]]
+               for dim in ("period", "region", "crime", "measure")]
+        codes = [self._codes[dim]
+                 for dim in ("period", "region", "crime", "measure")]
+        statuses = self._statuses
+        for i in range(len(self)):
+            yield (ids[0][codes[0][i]], ids[1][codes[1][i]],
+                   ids[2][codes[2][i]], ids[3][codes[3][i]],
+                   self._value(i), statuses[self._status_codes[i]])
+
+    def _category_code(self, dim, category):
+        """ Get the code of a category, adding it if it is new
+        """
+        key = category.id if category is not None else None
+        try:
+            return self._category_codes[dim][key]
+        except KeyError:
+            code = len(self._categories[dim])
+            self._categories[dim].append(category)
+            self._category_codes[dim][key] = code
+            return code
+
+    def _value(self, i):
+        if self._missing[i]:
+            return None
+        if self._integer[i]:
+            return int(self._values[i])
+        return self._values[i]
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Cubes require numpy. "
+                          "Install it with `pip install numpy`.")
+    return numpy
+
+def _column(np, values, dtype):
+    """ View an array.array column as a numpy array, without copying """
+    if not len(values):
+        return np.zeros(0, dtype)
+    return np.frombuffer(values, dtype)
+
+def _arrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Parquet and Arrow export requires pyarrow. "
+                          "Install it with `pip install pyarrow`.")
+    return pyarrow
 
 class Notes(dict):
     """ Represents a dict of notes
         Basically a wrapper around Python's native dict class with
         some added export functionality.
     """
+    # Columns of the csv export
+    CSV_COLUMNS = ["note", "category_label", "category_id", "dimension"]
+
     def to_json(self, path):
-        """ Save as json
+        """ Save as json, based on `.to_dictlist()` representation
             :param path: file path
         """
-        with open(path) as f:
-            json.dump(self, f)
+        with open(path, "w") as f:
+            json.dump(self.to_dictlist(), f)
 
 
     def to_dictlist(self):
         """ Export to list of dicts
         """
         _dictlist = []
-        for category, notes in self.iteritems():
+        for category, notes in self.items():
             for note in notes:
-                #if "\n" in note.note:
-                #    import pdb;pdb.set_trace()
+                if note is None:
+                    # Notes that we could not parse
+                    continue
                 _dictlist.append({
                     "category_id": note.category.id,
                     "category_label": note.category.label,
@@ -119,16 +677,51 @@ class Notes(dict):
     def to_csv(self, path):
         """ Export to csv based on `.to_dictlist()` representation
 
-            dimension,category,note
-            ,,"My general note"
-            region,,"My regional note"
-            crime,,"My note on crime"
-            region,"Stockholms län","My note on Stockholm"
-            region,"Stockholms län","My 2nd note on Stockholm"
-        """
-        logger.info(u"Writing to {}".format(unicode(path,"utf-8")))
-        data = self.to_dictlist()
-        with open(path, 'wb') as f:
-            w = csv.DictWriter(f, data[0].keys())
-            w.writeheader()
-            w.writerows(data)
+            note,category_label,category_id,dimension
+            "My note on Stockholm","Hela landet, Stockholms län",8292,regions
+            "My 2nd note on Stockholm","Hela landet, Stockholms län",8292,regions
+        """
+        with _open_csv(path, "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(self.CSV_COLUMNS)
+            for row in self.to_dictlist():
+                writer.writerow([_csv_cell(row[x]) for x in self.CSV_COLUMNS])
+
+
+def _open_csv(path, mode):
+    """ Open a file for the csv module, which wants bytes in Python 2
+        and text in Python 3
+    """
+    if sys.version_info[0] < 3:
+        return open(path, mode + "b")
+    return open(path, mode, newline="", encoding="utf-8")
+
+def _last_row_number(path):
+    """ Get the number of the last row of a csv file written by
+        `Dataset.to_csv()`, reading only the end of the file
+        :returns (int): -1 if there are no rows
+    """
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        tail = b""
+        # Read backwards until we have a whole last line
+        while size and tail.strip().count(b"\n") < 1:
+            n = min(size, 4096)
+            size -= n
+            f.seek(size)
+            tail = f.read(n) + tail
+    lines = tail.strip().splitlines()
+    try:
+        return int(lines[-1].split(b",")[0])
+    except (IndexError, ValueError):
+        # Just the header
+        return -1
+
+def _csv_cell(value):
+    """ Format a value for the csv module, with None as an empty cell """
+    if value is None:
+        return ""
+    if sys.version_info[0] < 3 and isinstance(value, unicode):
+        return value.encode("utf-8")
+    return value
@@ -0,0 +1,224 @@
+# encoding: utf-8
+import sqlite3
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS topics (
+    topic TEXT PRIMARY KEY,
+    label TEXT,
+    updated TEXT
+);
+CREATE TABLE IF NOT EXISTS regions (
+    topic TEXT,
+    id INTEGER,
+    label TEXT,
+    parent_id INTEGER,
+    PRIMARY KEY (topic, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS crimes (
+    topic TEXT,
+    id INTEGER,
+    label TEXT,
+    parent_id INTEGER,
+    PRIMARY KEY (topic, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS periods (
+    topic TEXT,
+    id INTEGER,
+    label TEXT,
+    period_start TEXT,
+    period_end TEXT,
+    periodicity TEXT,
+    PRIMARY KEY (topic, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS measures (
+    id TEXT PRIMARY KEY,
+    label TEXT
+);
+CREATE TABLE IF NOT EXISTS datapoints (
+    topic TEXT,
+    period_id INTEGER,
+    region_id INTEGER,
+    crime_id INTEGER,
+    measure_id TEXT,
+    -- No type, so that integers and floats are kept as they are
+    value,
+    status TEXT,
+    PRIMARY KEY (topic, period_id, region_id, crime_id, measure_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS notes (
+    topic TEXT,
+    dimension TEXT,
+    category_id TEXT,
+    category TEXT,
+    note TEXT,
+    PRIMARY KEY (topic, dimension, category_id, note)
+) WITHOUT ROWID;
+"""
+
+
+class SqliteStore(object):
+    """ Loads query results into a SQLite database, with one table of
+        datapoints and one table per dimension. Datapoints are keyed on
+        (topic, period_id, region_id, crime_id, measure_id) and replaced
+        when loaded again, so that repeated loads are idempotent.
+
+            store = SqliteStore("bra.db")
+            store.save(topic.query(), topic)
+
+        Pass a store to `Topic.query()` to only fetch the datapoints that
+        are not already stored.
+    """
+    def __init__(self, path, batch_size=100000):
+        """ :param path (str): Path to the database file. Created if it
+                does not exist.
+            :param batch_size (int): Number of datapoints per transaction
+        """
+        self.path = path
+        self.batch_size = batch_size
+        # Wait for other writers, like other jobs of a batch
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def save(self, results, topic):
+        """ Load the datapoints, categories and notes of a query
+            :param results (ResultSet):
+            :param topic (Topic|str): The queried topic, or its menu id
+            :returns (int): Number of loaded datapoints
+        """
+        topic_id, topic_label = _topic_key(topic)
+        dataset = results.data
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO topics VALUES (?, ?, ?)",
+                (topic_id, topic_label, datetime.now().isoformat()))
+            self._save_categories(topic_id, dataset)
+            self._save_notes(topic_id, results.notes)
+
+        n = 0
+        rows = dataset.id_rows()
+        while True:
+            batch = []
+            for row in rows:
+                batch.append((topic_id,) + row)
+                if len(batch) == self.batch_size:
+                    break
+            if not batch:
+                break
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO datapoints VALUES "
+                    "(?, ?, ?, ?, ?, ?, ?)", batch)
+            n += len(batch)
+
+        return n
+
+    def load(self, topic, region_ids, crime_ids, period_ids, measure_ids):
+        """ Get the stored datapoints of a sub cube of a topic
+            :param topic (Topic|str): The topic, or its menu id
+            :returns: A generator of (period_id, region_id, crime_id,
+                measure_id, value, status) tuples, like `Dataset.id_rows()`
+        """
+        topic_id = _topic_key(topic)[0]
+        region_ids = set(region_ids)
+        crime_ids = set(crime_ids)
+        measure_ids = set(measure_ids)
+        period_ids = list(period_ids)
+        # Periods come first in the primary key. Look them up a few
+        # hundred at a time, to stay below the max number of parameters.
+        for i in range(0, len(period_ids), 500):
+            chunk = period_ids[i:i + 500]
+            rows = self.connection.execute(
+                "SELECT period_id, region_id, crime_id, measure_id, value, "
+                "status FROM datapoints WHERE topic = ? AND period_id IN "
+                "({})".format(", ".join(["?"] * len(chunk))),
+                [topic_id] + chunk)
+            for period_id, region_id, crime_id, measure_id, value, status \
+                    in rows:
+                if region_id not in region_ids or crime_id not in crime_ids \
+                        or measure_id not in measure_ids:
+                    continue
+                yield (period_id, region_id, crime_id, measure_id, value,
+                       status)
+
+    def notes(self, topic):
+        """ Get the stored notes of a topic
+            :param topic (Topic|str): The topic, or its menu id
+            :returns (list): (dimension, category id, category label, note)
+                tuples
+        """
+        return self.connection.execute(
+            "SELECT dimension, category_id, category, note FROM notes "
+            "WHERE topic = ?", (_topic_key(topic)[0],)).fetchall()
+
+    def count(self, topic=None):
+        """ :param topic (Topic|str): Count the datapoints of this topic only
+            :returns (int): Number of stored datapoints
+        """
+        if topic is None:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM datapoints").fetchone()[0]
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM datapoints WHERE topic = ?",
+            (_topic_key(topic)[0],)).fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def _save_categories(self, topic_id, dataset):
+        """ Store the categories of the dataset and their parents
+        """
+        for dim, table in (("region", "regions"), ("crime", "crimes")):
+            rows = {}
+            for category in dataset.categories(dim):
+                while category is not None and category.id not in rows:
+                    parent = category.parent
+                    rows[category.id] = (topic_id, category.id, category.label,
+                                         parent.id if parent else None)
+                    category = parent
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO {} VALUES (?, ?, ?, ?)".format(table),
+                rows.values())
+
+        rows = []
+        for period in dataset.categories("period"):
+            try:
+                start, end, periodicity = period._parse()
+                start, end = start.isoformat(), end.isoformat()
+            except (ValueError, IndexError):
+                start, end, periodicity = None, None, None
+            rows.append((topic_id, period.id, period.label, start, end,
+                         periodicity))
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO periods VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO measures VALUES (?, ?)",
+            [(x.id, _text(x.label)) for x in dataset.categories("measure")])
+
+    def _save_notes(self, topic_id, notes):
+        rows = []
+        for category, category_notes in notes.items():
+            for note in category_notes:
+                if note is None:
+                    continue
+                rows.append((topic_id, note.dimension.name,
+                             str(note.category.id), note.category.label,
+                             note.note))
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO notes VALUES (?, ?, ?, ?, ?)", rows)
+
+
+def _topic_key(topic):
+    """ :returns (tuple): (menu id, label) of a topic """
+    if hasattr(topic, "menu_id"):
+        return topic.menu_id, topic.label
+    return str(topic), None
+
+def _text(value):
+    """ sqlite3 wants unicode, not utf-8 encoded bytes, on Python 2 """
+    if isinstance(value, bytes) and not isinstance(value, type(u"")):
+        return value.decode("utf-8")
+    return value
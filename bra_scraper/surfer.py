@@ -1,36 +1,174 @@
 # encoding: utf-8
 
+import time
 import requests
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from bra_scraper.cache import ResponseCache
 
 BASE_URL = "https://statistik.bra.se/"
 INTERFACE_URL = BASE_URL + "solwebb/action/"
+SEARCH_URL = INTERFACE_URL + "anmalda/urval/"
 
 class Surfer(object):
     """ Common functions for handling sessions etc on the BRÅ site
     """
-    def __init__(self, logger=None):
-        """ :param: 
+    def __init__(self, logger=None, cache=None, throttle=None, base_url=None,
+                 metrics=None):
+        """ :param logger: A logger, silent by default
+            :param cache (str|ResponseCache): Directory (or cache instance)
+                to store result pages in.
+            :param throttle (AdaptiveController): Controls concurrency and
+                retries of searches.
+            :param base_url (str): Root url of the site, to use another
+                site than statistik.bra.se, like a local emulator (see
+                `bra_scraper.emulator`).
+            :param metrics (Metrics): Records requests and the time spent
+                in each phase.
         """
         self.session = None
-        self.BASE_URL = BASE_URL
-        self.INTERFACE_URL = INTERFACE_URL
+        # The last page we opened in the session. The site keeps track of
+        # where we are, and some pages can only be opened from others.
+        self.location = None
+        # Number of requests made by this surfer
+        self.request_count = 0
+        if base_url is None:
+            base_url = BASE_URL
+        self.BASE_URL = base_url
+        self.INTERFACE_URL = base_url + "solwebb/action/"
+        self.SEARCH_URL = self.INTERFACE_URL + "anmalda/urval/"
         if logger is None:
             logger = SilentLogger()
         self.logger = logger
+        if cache is not None and not isinstance(cache, ResponseCache):
+            cache = ResponseCache(cache)
+        self.cache = cache
+        self.throttle = throttle
+        self.metrics = metrics
+
+    # Max number of kept-alive connections per host in a session
+    POOL_SIZE = 10
 
     def start_session(self):
         """ We have to open the pages one by one to get a correct node path
             in our session. Otherwise the site will throw error.
         """
         self.log.info("Start new session")
+        self.close()
         self.session = requests.session()
-        self.session.get(INTERFACE_URL, verify=False)
-        self.session.get(INTERFACE_URL + "/start?menykatalogid=1", verify=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.location = None
+        self.request("GET", self.INTERFACE_URL)
+        self.request("GET", self.INTERFACE_URL + "/start?menykatalogid=1")
+
+    def close(self):
+        """ Close the session and its kept-alive connections
+        """
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+        self.location = None
+
+    def ensure_session(self):
+        """ Start a session, unless we already have one
+        """
+        if self.session is None or self.location is None:
+            self.start_session()
+
+    def navigate(self, url):
+        """ Open a page in the session, unless it is already open
+            :returns (Response): The response, or None if the page
+                already was open.
+        """
+        self.ensure_session()
+        if self.location != url:
+            return self.request("GET", url)
+
+    def request(self, method, url, **kwargs):
+        """ Make a request in the session and keep track of where we are.
+            With a throttle, server errors raise HTTPError and the latency
+            and outcome of every request is reported to the throttle.
+            With metrics, the latency, size and status of every request
+            is recorded.
+            :param method (str): "GET" | "POST"
+            :returns (Response):
+        """
+        if self.throttle is not None:
+            kwargs["timeout"] = self.throttle.timeout
+
+        start = time.time()
+        try:
+            r = self.session.request(method, url, verify=False, **kwargs)
+        except requests.RequestException:
+            latency = time.time() - start
+            if self.throttle is not None:
+                self.throttle.record(latency, ok=False)
+            if self.metrics is not None:
+                self.metrics.record_request(method, url, latency, 0, None)
+            raise
+        latency = time.time() - start
+
+        if self.metrics is not None:
+            self.metrics.record_request(method, url, latency,
+                                        len(r.content), r.status_code)
+        if self.throttle is not None:
+            ok = r.status_code < 500 and r.status_code != 429
+            self.throttle.record(latency, ok=ok)
+            if not ok:
+                r.raise_for_status()
+
+        self.request_count += 1
+        self.location = url
+        return r
+
+    def retry(self, func, *args, **kwargs):
+        """ Call `func` when the throttle has room for it. If a request
+            fails, start over in a new session after a delay.
+            Without a throttle `func` is just called.
+        """
+        if self.throttle is None:
+            return func(*args, **kwargs)
+
+        attempt = 0
+        while True:
+            self.throttle.acquire()
+            try:
+                return func(*args, **kwargs)
+            except requests.RequestException as e:
+                if attempt >= self.throttle.max_retries:
+                    raise
+                error = e
+            finally:
+                self.throttle.release()
+
+            delay = self.throttle.backoff(attempt)
+            self.log.warning(u"Request failed ({}). Retrying in {:.1f} s."\
+                .format(error, delay))
+            # We don't know where in the navigation the session ended up
+            self.location = None
+            time.sleep(delay)
+            attempt += 1
+
+    def phase(self, name):
+        """ Time a block of code as a phase in the metrics, if any
+
+                with self.phase("parse"):
+                    ...
+        """
+        if self.metrics is None:
+            return _no_phase()
+        return self.metrics.phase(name)
 
     @property
     def log(self):
         return self.logger
 
+@contextmanager
+def _no_phase():
+    yield
+
 class SilentLogger():
     """ Empyt "fake" logger
     """
@@ -0,0 +1,113 @@
+# encoding: utf-8
+import time
+import random
+import threading
+
+
+class AdaptiveController(object):
+    """ Controls how many searches we run against the site at once.
+
+        The limit grows by one for every `limit` successful requests and
+        is halved on errors, timeouts and slow responses (AIMD), so that
+        we settle at the highest concurrency the site sustains. Failed
+        searches are retried after a jittered, exponentially growing delay.
+
+            throttle = AdaptiveController(max_limit=16)
+            topic = Topic(label, url, throttle=throttle)
+            topic.query(regions="*")
+    """
+    def __init__(self, min_limit=1, max_limit=16, initial_limit=2,
+                 latency_target=None, decrease_factor=0.5, cooldown=1.0,
+                 max_retries=5, backoff_base=1.0, backoff_max=60.0,
+                 timeout=120):
+        """ :param min_limit (int): Lowest number of concurrent searches
+            :param max_limit (int): Highest number of concurrent searches
+            :param initial_limit (int): Number of concurrent searches to start with
+            :param latency_target (float): Requests slower than this (in
+                seconds) count as a sign of overload. Default is to only
+                react to errors.
+            :param decrease_factor (float): Multiply the limit with this on
+                overload.
+            :param cooldown (float): Decrease the limit at most once per
+                this many seconds, as one overload often fails several
+                requests at once.
+            :param max_retries (int): Number of times to retry a search
+            :param backoff_base (float): Delay before the first retry, in seconds
+            :param backoff_max (float): Max delay between retries, in seconds
+            :param timeout (float): Request timeout, in seconds
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+        self.in_flight = 0
+        self.n_requests = 0
+        self.n_errors = 0
+        # Moving average of the latency, in seconds
+        self.latency = None
+        self._last_decrease = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """ Wait until there is room for another search
+        """
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        """ Mark a search as done
+        """
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def record(self, latency, ok):
+        """ Adjust the limit after a request
+            :param latency (float): Duration of the request, in seconds
+            :param ok (bool): Did the request succeed?
+        """
+        with self._condition:
+            self.n_requests += 1
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency = 0.8 * self.latency + 0.2 * latency
+
+            if not ok:
+                self.n_errors += 1
+                self._decrease()
+            elif self.latency_target is not None and latency > self.latency_target:
+                self._decrease()
+            else:
+                # Additive increase: one more per "round" of requests
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+            self._condition.notify_all()
+
+    def backoff(self, attempt):
+        """ Get the delay before a retry
+            :param attempt (int): Number of failed attempts so far, minus one
+            :returns (float): Seconds
+        """
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.5)
+
+    def _decrease(self):
+        now = time.time()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+
+    def __repr__(self):
+        return "<AdaptiveController: limit {:.1f}, {} in flight>"\
+            .format(self.limit, self.in_flight)
@@ -1,19 +1,33 @@
 # encoding: utf-8
 import re
+import gzip
+import json
+import threading
+from collections import deque
+from itertools import islice
+# datetime.strptime imports this on first use, which is not thread safe on
+# Python 2, and topics are queried from several threads in batch mode
+import _strptime
 from datetime import datetime
-from math import floor
+from multiprocessing.pool import ThreadPool
 from lxml import html
 
 from bra_scraper.surfer import Surfer
 from bra_scraper.dimension import Regions, Crimes, Periods, Measures
-from bra_scraper.utils import parse_value
-from bra_scraper.resultset import ResultSet
+from bra_scraper.utils import group_queries, uncovered_boxes, \
+    parse_result_cells, parse_counts, is_result_page
+from bra_scraper.resultset import ResultSet, Dataset
 from bra_scraper.note import Note
+from bra_scraper.manifest import Manifest
+from bra_scraper.checkpoint import Checkpoint
 
 
 class Topic(Surfer):
     """ Represents a topic on the BRÅ site
     """
+    # We can query a maximum of 10 000 datapoints at a time.
+    MAX_DATAPOINTS = 10000
+
     def __init__(self, label, url, description=None, **kwargs):
         super(Topic, self).__init__(**kwargs)
         self.label = label
@@ -26,6 +40,9 @@ class Topic(Surfer):
         self._crimes = None
         self._periods = None
         self._measures = None
+        self._category_index = None
+        # Sessions of parallel workers, kept between queries
+        self._idle_surfers = []
 
     @property
     def level(self):
@@ -69,11 +86,11 @@ class Topic(Surfer):
             raise Exception("{} is not a valid dimension. Options are {}."\
                     .format(name, ",".join(dim_classes.keys())))
 
-        if not self._html:
-            self._fetch_html()
-
         if not getattr(self, "_" + name):
-            dim = dim_classes[name](html=self._html)
+            if not self._html:
+                self._fetch_html()
+            with self.phase("dimensions"):
+                dim = dim_classes[name](html=self._html)
             setattr(self, "_" + name, dim)
 
         return getattr(self, "_" + name)
@@ -88,9 +105,86 @@ class Topic(Surfer):
             self.dimension("measures"),
         ]
 
+    def close(self):
+        """ Close the session of the topic, and the sessions that parallel
+            workers have kept for the next query
+        """
+        super(Topic, self).close()
+        while self._idle_surfers:
+            self._idle_surfers.pop().close()
+
+    def save_snapshot(self, path):
+        """ Store the dimensions of this topic in a gzipped json file, so
+            that the topic can be loaded without fetching the topic page.
+            See `Topic.load_snapshot()`.
+            :param path (str): File path
+        """
+        periods = []
+        for period in self.dimension("periods").categories:
+            try:
+                start, end, periodicity = period._parse()
+                bounds = [start.isoformat(), end.isoformat(), periodicity]
+            except (ValueError, IndexError):
+                # Labels that we can't parse yet
+                bounds = None
+            periods.append([period.id, period.label, bounds])
+
+        snapshot = {
+            "label": self.label,
+            "url": self.url,
+            "description": self.description,
+            "created": datetime.now().isoformat(),
+            "regions": self.dimension("regions").rows(),
+            "crimes": self.dimension("crimes").rows(),
+            "periods": periods,
+        }
+        with gzip.open(path, "wb") as f:
+            f.write(json.dumps(snapshot).encode("utf-8"))
+
+    @classmethod
+    def load_snapshot(cls, path, refresh=False, **kwargs):
+        """ Init a topic from a file stored with `.save_snapshot()`,
+            without fetching anything from the site.
+
+                topic.save_snapshot("topic.json.gz")
+                topic = Topic.load_snapshot("topic.json.gz")
+
+            :param path (str): File path
+            :param refresh (bool): Fetch the topic page again and update
+                the snapshot file.
+            :returns (Topic):
+        """
+        with gzip.open(path, "rb") as f:
+            snapshot = json.loads(f.read().decode("utf-8"))
+
+        topic = cls(snapshot["label"], snapshot["url"],
+                    snapshot["description"], **kwargs)
+
+        if refresh:
+            topic._fetch_html()
+            topic.save_snapshot(path)
+            return topic
+
+        topic._regions = Regions(categories=snapshot["regions"])
+        topic._crimes = Crimes(categories=snapshot["crimes"])
+        topic._periods = Periods(categories=[
+            (id, label, None) for id, label, bounds in snapshot["periods"]])
+        topic._measures = Measures()
+
+        for id, label, bounds in snapshot["periods"]:
+            if bounds is not None:
+                start, end, periodicity = bounds
+                topic._periods.get(id)._bounds = (
+                    datetime.strptime(start, "%Y-%m-%dT%H:%M:%S"),
+                    datetime.strptime(end, "%Y-%m-%dT%H:%M:%S"),
+                    periodicity)
+
+        return topic
+
     def query(self, regions="*", crimes="*", period_start="1900-01-01",
             measures=["count"], period_end="2999-1-1",
-            ignore_ceased_regions=True, ignore_ceased_crimes=True):
+            ignore_ceased_regions=True, ignore_ceased_crimes=True,
+            max_workers=None, manifest=None, checkpoint=None, store=None):
         """ Get the data for a set of region, crime and period ids.
             A date range from 2016-03-01 to 2016-04-01 will include
             data for March and Q1 2016, but not April.
@@ -102,10 +196,262 @@ class Topic(Surfer):
             :param period_end (str|datetime): Last timepoint to be included.
             :param ignore_ceased_regions (bool): Skip regions that no longer exist
             :param ignore_ceased_crimes (bool): Skip crimes that no longer exist
+            :param max_workers (int): Number of parallel sessions to fetch
+                result pages with. Default is to fetch them one by one, or
+                as many at once as the throttle allows, if there is one.
+            :param manifest (str|Manifest): Incremental mode. Only periods
+                that are not listed in this manifest are fetched, and the
+                manifest is updated with the new periods.
+            :param checkpoint (str|Checkpoint): Directory to store the result
+                of every finished request in. Requests that are already
+                stored there are not fetched again.
+            :param store (str|SqliteStore): Database of earlier results.
+                Only datapoints that are not in the store are fetched, and
+                they are added to it. Datapoints that the site does not
+                return at all are fetched every time.
+        """
+        filters = dict(regions=regions, crimes=crimes,
+            period_start=period_start, period_end=period_end,
+            measures=measures, ignore_ceased_regions=ignore_ceased_regions,
+            ignore_ceased_crimes=ignore_ceased_crimes)
+        results = ResultSet()
+        # The data is only kept in memory until we return, so periods are
+        # added to the manifest at the end, not one by one
+        for batch in self._iter_query(filters, max_workers=max_workers,
+                manifest=manifest, checkpoint=checkpoint, store=store,
+                save_progress=False):
+            results.add_results(batch)
+
+        self.log.info("Parsed %s datapoints" % len(results.data))
+
+        return results
+
+    def iter_query(self, regions="*", crimes="*", period_start="1900-01-01",
+            measures=["count"], period_end="2999-1-1",
+            ignore_ceased_regions=True, ignore_ceased_crimes=True,
+            max_workers=None, manifest=None, checkpoint=None, store=None):
+        """ Like `.query()`, but yields the result of every request as soon
+            as it has been parsed, instead of keeping all of it in memory.
+            Takes the same parameters as `.query()`. In incremental mode,
+            the requests of a period are yielded together, in one batch,
+            once all of them are done, and the period is added to the
+            manifest as soon as the batch has been handled. An interrupted
+            run keeps its progress without handling part of a period twice.
+
+                for batch in topic.iter_query(regions="*"):
+                    for datapoint in batch.data:
+                        ...
+
+            :returns: A generator of ResultSet instances, one per request
+                (per group of whole periods in incremental mode). With a
+                store, the stored datapoints come first, in one batch.
+        """
+        filters = dict(regions=regions, crimes=crimes,
+            period_start=period_start, period_end=period_end,
+            measures=measures, ignore_ceased_regions=ignore_ceased_regions,
+            ignore_ceased_crimes=ignore_ceased_crimes)
+        return self._iter_query(filters, max_workers=max_workers,
+            manifest=manifest, checkpoint=checkpoint, store=store,
+            save_progress=True)
+
+    def _iter_query(self, filters, max_workers=None, manifest=None,
+            checkpoint=None, store=None, save_progress=True):
+        """ Make a query. See `.iter_query()`.
+            :param filters (dict): regions, crimes, period_start, period_end,
+                measures, ignore_ceased_regions and ignore_ceased_crimes
+            :param save_progress (bool): Save the manifest every time all
+                batches of a period have been handled, not just at the end
+        """
+        if manifest is not None and not isinstance(manifest, Manifest):
+            manifest = Manifest(manifest)
+
+        close_store = False
+        if store is not None:
+            # sqlite3 is only imported when it is used
+            from bra_scraper.store import SqliteStore
+            if not isinstance(store, SqliteStore):
+                store = SqliteStore(store)
+                close_store = True
+
+        try:
+            # Get the dimensions first, so that they are not timed as planning
+            self.dimensions()
+            exclude_period_ids = []
+            if manifest is not None or store is not None:
+                ids = self._select_ids(**filters)
+            if manifest is not None:
+                filters_key = Manifest.filters_key(self.menu_id, ids[0],
+                                                   ids[1], ids[3])
+                exclude_period_ids = manifest.period_ids(self.menu_id,
+                                                         filters_key)
+
+            stored = None
+            exclude_cells = None
+            if store is not None:
+                ids[2] = [x for x in ids[2] if x not in exclude_period_ids]
+                with self.phase("store"):
+                    stored, exclude_cells = self._load_stored(store, ids)
+
+            with self.phase("plan"):
+                queries = self.plan(exclude_period_ids=exclude_period_ids,
+                                    exclude_cells=exclude_cells, **filters)
+
+            if stored is not None and len(stored.data):
+                yield stored
+
+            # Number of unfinished requests of every period
+            n_requests = {}
+            for q in queries:
+                for period_id in q["periods"]:
+                    n_requests[period_id] = n_requests.get(period_id, 0) + 1
+            # Batches waiting for other requests of their periods
+            held = []
+
+            chunks = self._iter_chunks(queries, max_workers=max_workers,
+                                       checkpoint=checkpoint)
+            for i, (data, notes) in enumerate(chunks):
+                if self.metrics is not None:
+                    self.metrics.add_datapoints(len(data))
+                batch = ResultSet()
+                batch.add_data(data)
+                for category, note in notes.items():
+                    batch.add_note(category, note)
+                if store is not None:
+                    with self.phase("store"):
+                        store.save(batch, self)
+
+                if manifest is None or not save_progress:
+                    yield batch
+                    continue
+
+                for period_id in queries[i]["periods"]:
+                    n_requests[period_id] -= 1
+                held.append((batch, set(queries[i]["periods"])))
+                ready, held = _whole_periods(held, n_requests)
+                if not ready:
+                    continue
+
+                # Whole periods are yielded in one batch, so that a run
+                # that is interrupted in the middle of a period does not
+                # handle part of it again on the next run
+                batch = ResultSet()
+                finished = set()
+                for ready_batch, period_ids in ready:
+                    batch.add_results(ready_batch)
+                    finished |= period_ids
+                yield batch
+
+                # The batch has been handled by now
+                manifest.add(self.menu_id, filters_key, finished)
+                manifest.save()
+
+            if manifest is not None and not save_progress and queries:
+                manifest.add(self.menu_id, filters_key, n_requests.keys())
+                manifest.save()
+        finally:
+            # Also when the caller stops early, or on errors
+            if close_store:
+                store.close()
+
+    def aquery(self, max_pipelines=10, **kwargs):
+        """ asyncio version of `.query()` that keeps up to `max_pipelines`
+            chunks in flight on one event loop. Takes the same filters
+            as `.query()`. Requires Python 3 and aiohttp.
+
+                result = await topic.aquery(regions="*")
+
+            :param max_pipelines (int): Maximum number of concurrent sessions
+            :returns: A coroutine that returns a ResultSet
+        """
+        from bra_scraper.aio import query
+        return query(self, max_pipelines=max_pipelines, **kwargs)
+
+    def plan(self, regions="*", crimes="*", period_start="1900-01-01",
+            measures=["count"], period_end="2999-1-1",
+            ignore_ceased_regions=True, ignore_ceased_crimes=True,
+            exclude_period_ids=[], exclude_cells=None):
+        """ Make a list of the requests needed to get the data for a
+            query. Regions, crimes, periods and measures are chunked together
+            to make as few requests as possible, each within the limit of
+            `MAX_DATAPOINTS`. See `.query()` for parameters.
+
+            :param exclude_period_ids (list): Ids of periods to leave out,
+                typically because they have already been fetched.
+            :param exclude_cells (set): (period_id, region_id, crime_id,
+                measure_id) tuples of datapoints to leave out, typically
+                because they are stored. Requests are planned for the
+                rest of the cube only.
+
+            :returns (list): A list of dicts with the region, crime, period
+                and measure ids of each request.
+        """
+        region_ids, crime_ids, period_ids, measure_ids = self._select_ids(
+            regions=regions, crimes=crimes,
+            period_start=period_start, period_end=period_end,
+            measures=measures, ignore_ceased_regions=ignore_ceased_regions,
+            ignore_ceased_crimes=ignore_ceased_crimes)
+
+        if exclude_period_ids:
+            period_ids = [x for x in period_ids if x not in exclude_period_ids]
+            if not period_ids:
+                self.log.info(u"No new periods in {}".format(self.label))
+                return []
+
+        n_regions = len(region_ids)
+        n_crimes = len(crime_ids)
+        n_periods = len(period_ids)
+        n_measures = len(measure_ids)
+        n_datapoints = n_regions * n_crimes * n_periods * n_measures
+
+        assert n_regions > 0
+        assert n_crimes > 0
+        assert n_periods > 0
+        assert n_measures > 0
+
+        self.log.info(u"Making query of {} regions, {} crimes and {} periods and {} measures in {}."\
+            .format(n_regions, n_crimes, n_periods, n_measures, self.label))
+
+        ids = [region_ids, crime_ids, period_ids, measure_ids]
+        if exclude_cells:
+            boxes = uncovered_boxes(ids, exclude_cells)
+            n_datapoints = sum([len(r) * len(c) * len(p) * len(m)
+                                for r, c, p, m in boxes])
+            if not boxes:
+                self.log.info(u"All datapoints are stored")
+                return []
+        else:
+            boxes = [ids]
+
+        self.log.info(u"Getting expected {} datapoints"\
+            .format(n_datapoints))
+
+        # Make a list of all requests that we will do
+        queries = []
+        for box in boxes:
+            for region_group, crime_group, period_group, measure_group in \
+                    group_queries(box, self.MAX_DATAPOINTS):
+                queries.append({
+                    "regions": region_group,
+                    "crimes": crime_group,
+                    "periods": period_group,
+                    "measures": measure_group,
+                    })
+
+        self.log.info(u"Planned {} requests".format(len(queries)))
+
+        return queries
+
+    def _select_ids(self, regions="*", crimes="*", period_start="1900-01-01",
+            measures=["count"], period_end="2999-1-1",
+            ignore_ceased_regions=True, ignore_ceased_crimes=True):
+        """ Get the ids of the categories of a query. See `.query()` for
+            parameters.
+            :returns (list): [region_ids, crime_ids, period_ids, measure_ids]
         """
-        if isinstance(period_start, str):
+        # Dates can be given as strings, also unicode ones from job files
+        if not isinstance(period_start, datetime):
             period_start = datetime.strptime(period_start, "%Y-%m-%d")
-        if isinstance(period_end, str):
+        if not isinstance(period_end, datetime):
             period_end = datetime.strptime(period_end, "%Y-%m-%d")
         if not isinstance(regions, list) and regions != "*":
             regions = [regions]
@@ -114,9 +460,6 @@ class Topic(Surfer):
         if not isinstance(measures, list) and measures != "*":
             measures = [measures]
 
-        results = ResultSet()
-
-        queries = []
         region_ids = [x.id for x in self.regions
             # Filter by regions in query
             if (
@@ -139,20 +482,8 @@ class Topic(Surfer):
                 not (x.ceased and ignore_ceased_crimes) )
             ]
 
-        # For
-        period_ids = [x.id for x in self.periods
-            if (
-                (
-                    # Pick up yearly and quarterly data
-                    # eg. 2016-12-01 will return:
-                    # - 2016 (whole year)
-                    # - 2016, Q4
-                    # - 2016, December
-                    x.in_range(period_start)
-                    or
-                    x.period_start >= period_start
-                )
-                and x.period_end <= period_end)]
+        period_ids = [x.id for x in self.dimension("periods")
+                      .select(period_start, period_end)]
 
         measure_ids = [x.id for x in self.dimension("measures").categories
             if (
@@ -161,72 +492,266 @@ class Topic(Surfer):
                 x.id in measures)
             ]
 
-        # We can query a maximum of 10 000 datapoints at a time.
-        threshold = 10000.0
-        n_regions = len(region_ids)
-        n_crimes = len(crime_ids)
-        n_periods = len(period_ids)
-        n_measures = len(measure_ids)
-        n_datapoints = n_regions * n_crimes * n_periods * n_measures
-
-        assert n_regions > 0
-        assert n_crimes > 0
-        assert n_periods > 0
-        assert n_measures > 0
+        return [region_ids, crime_ids, period_ids, measure_ids]
 
-        self.log.info(u"Making query of {} regions, {} crimes and {} periods and {} measures in {}."\
-            .format(n_regions, n_crimes, n_periods, n_measures, self.label))
+    def _load_stored(self, store, ids):
+        """ Get the stored datapoints of a query, and the notes on their
+            categories
+            :param store (SqliteStore):
+            :param ids (list): [region_ids, crime_ids, period_ids, measure_ids]
+            :returns (tuple): (ResultSet, set of (period_id, region_id,
+                crime_id, measure_id) tuples of the stored datapoints)
+        """
+        region_ids, crime_ids, period_ids, measure_ids = ids
+        periods = self.dimension("periods")
+        regions = self.dimension("regions")
+        crimes = self.dimension("crimes")
+        measures = self.dimension("measures")
 
-        self.log.info(u"Getting expected {} datapoints"\
-            .format(n_datapoints))
+        results = ResultSet()
+        data = Dataset()
+        cells = set()
+        for period_id, region_id, crime_id, measure_id, value, status in \
+                store.load(self, region_ids, crime_ids, period_ids,
+                           measure_ids):
+            cells.add((period_id, region_id, crime_id, measure_id))
+            data.add(periods.get(period_id), regions.get(region_id),
+                     crimes.get(crime_id), measures.get(measure_id),
+                     value, status)
+        results.add_data(data)
+
+        if cells:
+            category_ids = {
+                "regions": set([str(x) for x in region_ids]),
+                "crimes": set([str(x) for x in crime_ids]),
+                "periods": set([str(x) for x in period_ids]),
+            }
+            for dimension, category_id, category, note_text in \
+                    store.notes(self):
+                if category_id in category_ids.get(dimension, ()):
+                    results.add_note(category, Note(note_text, category,
+                        self.dimension(dimension)))
+
+        n_datapoints = len(region_ids) * len(crime_ids) * len(period_ids) * \
+            len(measure_ids)
+        self.log.info(u"{} out of {} datapoints are stored"\
+            .format(len(cells), n_datapoints))
+
+        return results, cells
+
+    def _iter_chunks(self, queries, max_workers=None, checkpoint=None):
+        """ Fetch and parse the result and notes page of every request
+            :param queries (list): Requests, as returned by `.plan()`
+            :param max_workers (int): Number of parallel sessions
+            :param checkpoint (str|Checkpoint): See `.query()`
+            :returns: A generator of (data, notes) tuples, one per request,
+                in the same order as `queries`.
+        """
+        if checkpoint is not None and not isinstance(checkpoint, Checkpoint):
+            checkpoint = Checkpoint(checkpoint)
 
+        done = set()
+        if checkpoint is not None:
+            done = set([i for i, q in enumerate(queries)
+                        if checkpoint.has(self, q)])
+            self.log.info("%s out of %s requests already done" \
+                % (len(done), len(queries)))
 
-        # Group crimes if there are a lot of them
-        # TODO: A more generic solution would sort dims by number of categories
-        # and optimize the way request queries are put together
-        if n_crimes * n_periods > threshold:
-            _n = int(floor(threshold / float(n_periods)))
-            crime_groups = [ crime_ids[i:i+_n] for i in range(0, n_crimes, _n) ]
-        else:
-            crime_groups = [ crime_ids ]
+        todo = [q for i, q in enumerate(queries) if i not in done]
 
-        # Make a list of all requests that we will do
-        queries = []
-        for crime_group in crime_groups:
-            n_crimes_in_group = len(crime_group)
-            # Group regions to fit within threshold
-            _n = int(floor(threshold / float(n_periods) / float(n_crimes_in_group)))
-            region_groups = [ region_ids[i:i+_n] for i in range(0, n_regions, _n) ]
-            for region_group in region_groups:
-                # TODO: Now we end up doing on request per measure, which is
-                # often not neessary. A more generic solution for chunkifying
-                # queries sould solve this. 
-                for measure_id in measure_ids:
-                    queries.append({
-                        "regions": region_group,
-                        "crimes": crime_group,
-                        "periods": period_ids,
-                        "measures": [measure_id],
-                        })
+        if max_workers is None and self.throttle is not None:
+            max_workers = self.throttle.max_limit
 
         # Perform the actual requests
-        self.start_session()
+        if max_workers and max_workers > 1 and len(todo) > 1:
+            pages = self._get_result_pages_parallel(todo, max_workers)
+        else:
+            pages = self._get_result_pages(todo)
+
         for i, q in enumerate(queries):
+            if i in done:
+                self.log.info("Load result page %s out of %s from checkpoint" \
+                    % (i+1, len(queries)))
+                yield checkpoint.load(self, q)
+                continue
+
+            result_page_html, notes_page_html = next(pages)
             self.log.info("Parse result page %s out of %s" % (i+1, len(queries)))
-            result_page_html, notes_page_html = self._get_result_page(
-                q["regions"], q["crimes"], q["periods"], q["measures"])
-            results.add_data(self._parse_data(result_page_html))
-            notes = self._parse_notes(notes_page_html)
+            with self.phase("parse"):
+                data = self._parse_data(result_page_html)
+            with self.phase("notes"):
+                notes = self._parse_notes(notes_page_html)
+            if checkpoint is not None:
+                checkpoint.save(self, q, data, notes)
+
+            yield data, notes
+
+    def _parse_pages(self, pages, n_pages):
+        """ Parse result and notes pages into a ResultSet
+            :param pages: An iterable of (result page, notes page) tuples
+            :param n_pages (int): Number of pages, for logging
+        """
+        results = ResultSet()
+        for i, (result_page_html, notes_page_html) in enumerate(pages):
+            self.log.info("Parse result page %s out of %s" % (i+1, n_pages))
+            with self.phase("parse"):
+                results.add_data(self._parse_data(result_page_html))
+            with self.phase("notes"):
+                notes = self._parse_notes(notes_page_html)
             for category, note in notes.items():
                 results.add_note(category, note)
 
+        if self.metrics is not None:
+            self.metrics.add_datapoints(len(results.data))
         self.log.info("Parsed %s datapoints" % len(results.data))
 
         return results
 
 
-    def _get_result_page(self,regions, crimes, periods, measures):
+    def _get_result_pages(self, queries):
+        """ Fetch the result and notes page of each query, one by one,
+            in the session of this topic.
+        """
+        for q in queries:
+            yield self._get_result_page(
+                q["regions"], q["crimes"], q["periods"], q["measures"])
+
+    def _get_result_pages_parallel(self, queries, max_workers):
+        """ Fetch the result and notes page of each query with a pool of
+            threads. The site keeps track of the navigation in the session,
+            so every worker keeps a session (Surfer) of its own. Sessions
+            are kept for the next query.
+            Pages are yielded in the same order as `queries`.
+        """
+        local = threading.local()
+        lock = threading.Lock()
+        # (surfer, request count when we got it) of every worker
+        surfers = []
+        # Surfers in the middle of a search, surfers whose search failed
+        # and surfers to close as soon as their search is over
+        busy = set()
+        failed = set()
+        discarded = set()
+        # Set when we are done, so that no worker starts another search
+        done = []
+
+        def fetch(q):
+            with lock:
+                if done:
+                    return None
+                if not hasattr(local, "surfer"):
+                    try:
+                        local.surfer = self._idle_surfers.pop()
+                    except IndexError:
+                        local.surfer = Surfer(logger=self.logger,
+                                              throttle=self.throttle,
+                                              base_url=self.BASE_URL,
+                                              metrics=self.metrics)
+                    surfers.append((local.surfer, local.surfer.request_count))
+                surfer = local.surfer
+                busy.add(surfer)
+
+            ok = False
+            try:
+                pages = self._get_result_page(
+                    q["regions"], q["crimes"], q["periods"], q["measures"],
+                    surfer=surfer)
+                ok = True
+                return pages
+            finally:
+                with lock:
+                    busy.discard(surfer)
+                    if ok:
+                        failed.discard(surfer)
+                    else:
+                        failed.add(surfer)
+                    close = surfer in discarded
+                if close:
+                    surfer.close()
+
+        n_workers = min(max_workers, len(queries))
+        pool = ThreadPool(n_workers)
+        queries = iter(queries)
+        pending = deque()
+        try:
+            # Keep at most one request per worker ahead of the consumer,
+            # so that pages don't pile up in memory when it is slower
+            # than the workers
+            for q in islice(queries, n_workers):
+                pending.append(pool.apply_async(fetch, (q,)))
+            while pending:
+                pages = pending.popleft().get()
+                for q in islice(queries, 1):
+                    pending.append(pool.apply_async(fetch, (q,)))
+                yield pages
+        finally:
+            # Terminated worker threads are not stopped, but finish the
+            # search that they are in
+            pool.terminate()
+            with lock:
+                done.append(True)
+                for surfer, request_count in surfers:
+                    self.request_count += surfer.request_count - request_count
+                    if surfer in busy:
+                        # Still in use. Its worker closes it when done.
+                        discarded.add(surfer)
+                    elif surfer in failed:
+                        # We don't know where in the navigation its
+                        # session ended up
+                        surfer.close()
+                    else:
+                        self._idle_surfers.append(surfer)
+
+    def _get_result_page(self, regions, crimes, periods, measures, surfer=None):
         """ Make a query and return the html of the result and notes page.
+            :param surfer (Surfer): The surfer whose session to make the
+                requests in. Defaults to the session of the topic.
+        """
+        if self.cache is not None:
+            cache_key = self.cache.key(self.menu_id,
+                regions, crimes, periods, measures)
+            pages = self.cache.get(cache_key)
+            if pages is not None:
+                self.log.debug("Got result page from cache")
+                return pages
+
+        if surfer is None:
+            surfer = self
+
+        payload = self._payload(regions, crimes, periods, measures)
+
+        with self.phase("fetch"):
+            r_table, r_notes = surfer.retry(self._search, surfer, payload)
+
+        if self.cache is not None:
+            if r_table.status_code == 200 and r_notes.status_code == 200 \
+                    and is_result_page(r_table.text, r_notes.text):
+                self.cache.set(cache_key, r_table.text, r_notes.text)
+            else:
+                self.log.debug("Got no result page, not caching it")
+
+        return r_table.text, r_notes.text
+
+    def _search(self, surfer, payload):
+        """ Post a search and get the result and notes page
+            :returns (tuple): (result page response, notes page response)
+        """
+        # Make the search. The search form has to be open before we post,
+        # which it already is if we just fetched the topic page.
+        surfer.navigate(self.url)
+        surfer.request("POST", self.SEARCH_URL + "vantapopup", data=payload)
+        surfer.request("GET", self.SEARCH_URL + "sok")
+
+        # Get data table
+        r_table = surfer.request("GET", self.SEARCH_URL + "soktabell")
+
+        # Get notes
+        r_notes = surfer.request("GET", self.SEARCH_URL + "sokinfo")
+
+        return r_table, r_notes
+
+    def _payload(self, regions, crimes, periods, measures):
+        """ Compose the form data of a search
         """
         payload = {
             "brottstyp_id_string": "*".join([str(x) for x in  crimes]),
@@ -243,59 +768,39 @@ class Topic(Surfer):
         else:
             payload["antal_100k"] = 0
 
-        # Make the search
-        self.session.get(self.url, verify=False)
-        self.session.post("https://statistik.bra.se/solwebb/action/anmalda/urval/vantapopup", data=payload, verify=False)
-        self.session.get("https://statistik.bra.se/solwebb/action/anmalda/urval/sok", verify=False)
-
-        # Get data table
-        r_table = self.session.get("https://statistik.bra.se/solwebb/action/anmalda/urval/soktabell", verify=False)
-
-        # Get notes
-        r_notes = self.session.get("https://statistik.bra.se/solwebb/action/anmalda/urval/sokinfo", verify=False)
-
-        return r_table.text, r_notes.text
+        return payload
 
     def _parse_data(self, page_content):
         """ Get the datapoints from the result page
+            :returns (Dataset):
         """
-        tree = html.fromstring(page_content)
-        data = []
+        _measures = { "antal": "count", "antal_100": "per capita" }
+        data = Dataset()
 
-        """ Luckily the value cells all have the same class name
+        """ Luckily the value cells all have the same class name.
+            Empty rows only have one id.
         """
-        for td in tree.xpath("//td[@class='resultatAntal']"):
-            ids = td.get("headers").split(" ")
-
-            if len(ids) == 1:
-                # Empty rows
-                continue
+        cells = [(ids, text) for ids, text in parse_result_cells(page_content)
+                 if len(ids) > 1]
+        values = parse_counts([text for ids, text in cells])
 
-            period_id = int(ids[0])
-            region_id = int(ids[3])
-            crime_id = int(ids[2])
-            value = parse_value(td.text, "integer")
-            _measures = { "antal": "count", "antal_100": "per capita" }
+        for (ids, text), value in zip(cells, values):
             assert ids[-1] in _measures, "Unknown measure: {}".format(ids[-1])
-            measure_id = _measures[ids[-1]]
             status = None
 
-            if td.text == "..":
+            if text == "..":
                 """ In case value is missing, we store 'value' as None
                     and 'status' as 'missing'
                 """
                 status = "missing"
 
-            datapoint = {
-                'period': self._periods.get(period_id),
-                'crime': self._crimes.get(crime_id),
-                'region': self._regions.get(region_id),
-                'measure': self._measures.get(measure_id),
-                'value': value,
-                'status': status,
-            }
-
-            data.append(datapoint)
+            data.add(
+                self._periods.get(int(ids[0])),
+                self._regions.get(int(ids[3])),
+                self._crimes.get(int(ids[2])),
+                self._measures.get(_measures[ids[-1]]),
+                value,
+                status)
 
         return data
 
@@ -328,21 +833,61 @@ class Topic(Surfer):
         """ Return the dimension ot a given cateogry.
             Eg. "Stockholms län" => Regions
         """
-        for dim in self.dimensions():
-            if dim.get(category):
-                return dim
-        else:
+        try:
+            return self.category_index[category][0]
+        except KeyError:
             return None
 
+    @property
+    def category_index(self):
+        """ A topic wide lookup of categories by id, label and end of label
+            (see `Dimension.get()`). If a key exists in several dimensions,
+            the first one in `.dimensions()` wins.
+            :returns (dict): A dict with (dimension, category) tuples as values
+        """
+        if self._category_index is None:
+            index = {}
+            for dim in self.dimensions():
+                for key, category in dim.index.items():
+                    index.setdefault(key, (dim, category))
+            self._category_index = index
+
+        return self._category_index
+
     def _fetch_html(self):
         """ Get and store the html content of the topic page
             :returns (str): HTML content of the topic page
         """
-        self.start_session()
-        r = self.session.get(self.url, verify=False)
-        self._html = r.text
+        def fetch():
+            self.ensure_session()
+            return self.request("GET", self.url).text
+
+        self._html = self.retry(fetch)
         return self._html
 
 
     def __repr__(self):
         return u"<Topic: {} ({})>".format(self.label, self.level).encode("utf-8")
+
+
+def _whole_periods(batches, n_requests):
+    """ Split held batches into those that can be handled and those that
+        have to wait. A batch has to wait if one of its periods has
+        requests left, or shares a period with a batch that has to wait.
+        :param batches (list): (batch, period ids) tuples
+        :param n_requests (dict): Number of unfinished requests by period
+        :returns (tuple): (ready batches, waiting batches)
+    """
+    waiting_periods = set([p for p, n in n_requests.items() if n])
+    waiting = []
+    ready = list(batches)
+    changed = True
+    while changed:
+        changed = False
+        for x in list(ready):
+            if x[1] & waiting_periods:
+                ready.remove(x)
+                waiting.append(x)
+                waiting_periods |= x[1]
+                changed = True
+    return ready, [x for x in batches if x in waiting]
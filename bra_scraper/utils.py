@@ -1,4 +1,6 @@
 # encoding: utf-8
+import re
+import hashlib
 from datetime import datetime
 
 def parse_float(value):
@@ -32,6 +34,51 @@ def parse_value(value, value_type, date_format="%Y-%m-%d"):
 
 
 
+""" PARSE RESULT PAGES
+"""
+
+RESULT_CELL = re.compile(
+    r'<td\b([^>]*\bclass=["\']resultatAntal["\'][^>]*)>([^<]*)', re.IGNORECASE)
+HEADERS_ATTRIBUTE = re.compile(r'\bheaders=["\']([^"\']*)["\']', re.IGNORECASE)
+ENTITY = re.compile(r'&#?\w+;')
+
+def parse_result_cells(page_content):
+    """ Get the value cells of a result page in one pass over the html,
+        without building a tree.
+        :param page_content (str): HTML of the result page
+        :returns: A generator of (header ids, raw text) tuples, like
+            (["2108", "289", "3144", "8291", "antal"], "1&nbsp;416&nbsp;280")
+    """
+    for match in RESULT_CELL.finditer(page_content):
+        headers = HEADERS_ATTRIBUTE.search(match.group(1))
+        ids = headers.group(1).split(" ") if headers else []
+        yield ids, match.group(2)
+
+def parse_counts(texts):
+    """ Parse a column of raw counts from a result page, like
+        "1&nbsp;416&nbsp;280".
+        :returns (list): Integers, or None where there is no valid value
+    """
+    values = []
+    for text in texts:
+        text = ENTITY.sub("", text).replace(" ", "").replace(u"\xa0", "")
+        try:
+            values.append(int(text))
+        except ValueError:
+            try:
+                values.append(parse_int(text))
+            except ValueError:
+                values.append(None)
+    return values
+
+def is_result_page(table, notes):
+    """ Check that a search got a result and notes page, and not an
+        error page, before caching it
+        :param table (str): Html of the result page
+        :param notes (str): Html of the notes page
+    """
+    return "resultatAntal" in table and "infotexter" in notes
+
 def json_serial(obj):
     """JSON serializer for objects not serializable by default json code"""
 
@@ -40,6 +87,17 @@ def json_serial(obj):
         return serial
     raise TypeError ("Type not serializable")
 
+def request_key(topic_id, regions, crimes, periods, measures):
+    """ Get a key that identifies a request to a topic. The order of
+        the ids does not matter.
+        :param topic_id (str): Menu id of the topic
+        :returns (str): A sha1 hash
+    """
+    parts = [str(topic_id)]
+    for ids in (regions, crimes, periods, measures):
+        parts.append("*".join(sorted([str(x) for x in ids])))
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
 def chunks(l, n):
     n = max(1, n)
     return [l[i:i + n] for i in range(0, len(l), n)]
@@ -47,74 +105,150 @@ def chunks(l, n):
 
 
 from itertools import product
-from collections import defaultdict
 
 
 """ GROUP QUERIES
 """ 
 
-def srange(start, stop, step):
-    """ Like range(), but with custom incrementation
+def chunk_sizes(n):
+    """ All chunk sizes worth trying when splitting `n` items in equally
+        sized chunks, largest first. Splitting 10 items in 3 or 4 chunks
+        gives chunk sizes 4 and 3 (other sizes would add requests without
+        making the chunks smaller).
     """
-    r = start
-    while r < stop:
-        yield r
-        r += step
-
-def get_basepoint(ll, chunk_size):
-    """ Get the index of the basepoint, that is the last
-        datapoint that fits in a single query 
+    sizes = []
+    for n_chunks in range(1, n + 1):
+        size = -(-n // n_chunks)
+        if not sizes or size < sizes[-1]:
+            sizes.append(size)
+    return sizes
+
+def n_chunks(n, size):
+    return -(-n // size)
+
+def best_chunking(lengths, chunk_size):
+    """ Find the chunk size of each list that gives the fewest combinations
+        while the product of the chunk sizes does not exceed `chunk_size`.
+        :param lengths (list): Length of each list
+        :returns (list): The chunk size of each list
     """
-    prev = 1
-    for i, l in enumerate(ll):
-        if prev * len(l) > chunk_size:
-            j = int(float(chunk_size) / float(prev))
-            return (i, j)
-        prev = prev * len(l)
-    return (len(ll), 0)
-
-
-def make_increments(i, j, ll):
-    step = max(j,1)
-    return [(x, min(x + step, len(ll[i]))) for x in srange(j, len(ll[i]), step)]
+    # The longest list gets whatever room is left by the others, so we
+    # only have to try the chunk sizes of the shorter ones.
+    longest = lengths.index(max(lengths))
+    others = [i for i in range(len(lengths)) if i != longest]
+    # Best (number of combinations, chunk sizes) so far
+    best = [None]
+
+    def search(k, sizes, room, n_queries):
+        if best[0] is not None and n_queries >= best[0][0]:
+            return
+        if k == len(others):
+            size = min(lengths[longest], room)
+            n_queries = n_queries * n_chunks(lengths[longest], size)
+            if best[0] is None or n_queries < best[0][0]:
+                sizes = dict(sizes)
+                sizes[longest] = size
+                best[0] = (n_queries, [sizes[i] for i in range(len(lengths))])
+            return
+        i = others[k]
+        for size in chunk_sizes(lengths[i]):
+            if size > room:
+                continue
+            sizes[i] = size
+            search(k + 1, sizes, room // size,
+                   n_queries * n_chunks(lengths[i], size))
+        sizes.pop(i, None)
+
+    search(0, {}, chunk_size, 1)
+    return best[0][1]
 
 def group_queries(ll, chunk_size):
     """ Pass a list of lists and compose a list of query combinations
-        that, when multiplied, do not exceed a given chunk size. 
+        that, when multiplied, do not exceed a given chunk size.
+        Every list is split in equally sized chunks, and the chunk sizes
+        are picked to give as few combinations as possible.
+
+        :param ll (list): A list of lists, e.g. [region_ids, crime_ids]
+        :param chunk_size (int): Max number of datapoints in a combination
+        :returns (list): A list of tuples with one chunk of each list
     """
-    #print "*** group (chunk_size: %s) ***" % chunk_size
-    
-    # Sort lists by length, but also store original order so that we can return
-    # the original sorting
-    list_lengths = [len(l) for l in ll]
-    list_lengths, original_order, ll = zip(*sorted(zip(list_lengths, range(0,len(ll)), ll)))
-
-    # The "basepoint" is the last datapoint that fits in a single query 
-    bp = get_basepoint(ll, chunk_size)
-    i,j = bp[0],bp[1]
-    indecies = defaultdict(list)
-    
-    # Base query
-    for _i in range(0,i):
-        indecies[_i].append((0,len(ll[_i])))
-    if i < len(ll):
-        indecies[i] = [(0,j)] + make_increments(i, j, ll) 
-
-    # Query ranges that are added "on top" of the base query
-    for _i in range(i+1,len(ll)):
-        indecies[_i] = make_increments(_i, 0, ll) 
-
-    queries_i = list(product(*indecies.values()))
-    queries = []
-    for i, q in enumerate(queries_i):
-        # Populate the queries with actual values (instead of indecies)
-        values = [ ll[i][x[0]:x[1]] for i, x in enumerate(q)]
-        
-        # Get the size of the current query
-        # size = reduce(lambda x,y: x*y, [len(l) for l in values])
-
-        # Revert to original sorting
-        sorted_order, values = zip(*sorted(zip(original_order, values)))
-        queries.append(values)
-
-    return queries
\ No newline at end of file
+    if not ll or min([len(l) for l in ll]) == 0:
+        return []
+
+    lengths = [len(l) for l in ll]
+    sizes = best_chunking(lengths, int(chunk_size))
+
+    chunks_per_list = [
+        [l[i:i + size] for i in range(0, len(l), size)]
+        for l, size in zip(ll, sizes)
+    ]
+    return list(product(*chunks_per_list))
+
+def uncovered_boxes(ll, covered):
+    """ Cover the cells of a cube that are not in `covered` with as few
+        boxes as we easily can. Regions that miss the same cells are put
+        in one box, and so are crimes that miss the same (period, measure)
+        cells within such a group of regions. A box spans all periods and
+        measures missed by its crimes, so it may include some covered cells,
+        but never leaves out a missing one.
+
+        :param ll (list): [region_ids, crime_ids, period_ids, measure_ids]
+        :param covered (set): (period_id, region_id, crime_id, measure_id)
+            tuples of the cells that we already have
+        :returns (list): A list of [region_ids, crime_ids, period_ids,
+            measure_ids] lists, one per box
+    """
+    region_ids, crime_ids, period_ids, measure_ids = ll
+    if not covered:
+        return [list(ll)]
+
+    # Covered (period, measure) cells of every (region, crime)
+    covered_cells = {}
+    for period_id, region_id, crime_id, measure_id in covered:
+        covered_cells.setdefault((region_id, crime_id), set())\
+            .add((period_id, measure_id))
+    all_cells = tuple([(period_id, measure_id) for period_id in period_ids
+                       for measure_id in measure_ids])
+
+    # Missing (period, measure) cells of every crime, per region
+    signatures = []
+    regions_by_signature = {}
+    for region_id in region_ids:
+        signature = []
+        for crime_id in crime_ids:
+            cells = covered_cells.get((region_id, crime_id))
+            if cells is None:
+                missing = all_cells
+            else:
+                missing = tuple([x for x in all_cells if x not in cells])
+            if missing:
+                signature.append((crime_id, missing))
+        signature = tuple(signature)
+        if not signature:
+            continue
+        if signature not in regions_by_signature:
+            signatures.append(signature)
+            regions_by_signature[signature] = []
+        regions_by_signature[signature].append(region_id)
+
+    boxes = []
+    for signature in signatures:
+        cell_sets = []
+        crimes_by_cells = {}
+        for crime_id, missing in signature:
+            if missing not in crimes_by_cells:
+                cell_sets.append(missing)
+                crimes_by_cells[missing] = []
+            crimes_by_cells[missing].append(crime_id)
+
+        for missing in cell_sets:
+            missing_periods = set([x[0] for x in missing])
+            missing_measures = set([x[1] for x in missing])
+            boxes.append([
+                regions_by_signature[signature],
+                crimes_by_cells[missing],
+                [x for x in period_ids if x in missing_periods],
+                [x for x in measure_ids if x in missing_measures],
+            ])
+
+    return boxes
@@ -2,9 +2,13 @@
 # coding: utf-8
 """ Run the scraper against BRÅ
 """
+import json
+from contextlib import contextmanager
 
 from bra_scraper.interface import Interface
 from bra_scraper.BRA import BRA
+from bra_scraper.checkpoint import Checkpoint
+from bra_scraper.resultset import ResultSet
 
 def main():
     """ Entry point when run from command line """
@@ -25,8 +29,7 @@ def main():
         'short': "-o", "long": "--outfile",
         'dest': "outfile",
         'type': str,
-        'help': """store result in this csv file""",
-        'required': True,
+        'help': """store result in this file: csv, parquet if it ends with .parquet or a sqlite database if it ends with .db, .sqlite or .sqlite3 (required unless --batch is given)""",
     }, {
         'short': "-n", "long": "--notes",
         'dest': "notes",
@@ -44,16 +47,106 @@ def main():
         'default': "2999-01-01",
         'type': str,
         'help': """end date (for example 2016-09-01)"""
+    }, {
+        'short': "-im", "long": "--incremental",
+        'dest': "manifest",
+        'type': str,
+        'help': """only fetch periods that are not listed in this manifest file, and append them to the outfile"""
+    }, {
+        'short': "-re", "long": "--resume",
+        'dest': "resume",
+        'action': "store_true",
+        'default': False,
+        'help': """resume an interrupted run with the same outfile, without fetching finished requests again"""
+    }, {
+        'short': "-s", "long": "--stream",
+        'dest': "stream",
+        'action': "store_true",
+        'default': False,
+        'help': """write the data to the outfile request by request, instead of keeping all of it in memory"""
+    }, {
+        'short': "-c", "long": "--catalog",
+        'dest': "catalog",
+        'type': str,
+        'help': """store the list of topics in this json file, and reuse it for a day"""
+    }, {
+        'short': "-m", "long": "--metrics",
+        'dest': "metrics",
+        'type': str,
+        'help': """store timings of requests and phases in this file, as json or, if it ends with .prom, in the Prometheus text format"""
+    }, {
+        'short': "-pr", "long": "--profile",
+        'dest': "profile",
+        'action': "store_true",
+        'default': False,
+        'help': """profile cpu and memory use per phase, and write a report (.profile.txt), a flamegraph stack dump (.folded) and a pstats file next to the outfile"""
+    }, {
+        'short': "-b", "long": "--batch",
+        'dest': "batch",
+        'type': str,
+        'help': """run the jobs (topic, regions, periods and outfile) of this json or yaml file, and write a summary to FILE.summary.json"""
+    }, {
+        'short': "-j", "long": "--jobs",
+        'dest': "jobs",
+        'type': int,
+        'default': 4,
+        'help': """number of topics to scrape at once in batch mode"""
+    }, {
+        'short': "-mr", "long": "--max_requests",
+        'dest': "max_requests",
+        'type': int,
+        'help': """max number of requests in flight, across all topics"""
     }]
     ui = Interface("Run scraper",
                    "Fetch data from command line",
                    commandline_args=cmd_args)
 
 
-    # Init
-    scraper = BRA(logger=ui)
+    # Init. Optional features are imported when they are used, to keep
+    # the startup fast.
+    profiler = None
+    if ui.args.profile:
+        from bra_scraper.profiler import Profiler
+        profiler = Profiler()
+        profiler.start()
+
+    if not ui.args.batch and not ui.args.outfile:
+        ui.parser.error("argument -o/--outfile is required")
+
+    # One throttle for all sessions of all topics
+    throttle = None
+    if ui.args.max_requests:
+        from bra_scraper.throttle import AdaptiveController
+        throttle = AdaptiveController(max_limit=ui.args.max_requests)
+
+    metrics = None
+    if ui.args.metrics:
+        from bra_scraper.metrics import Metrics
+        metrics = Metrics()
+    scraper = BRA(logger=ui, catalog=ui.args.catalog, metrics=metrics,
+                  throttle=throttle)
+
+    if ui.args.batch:
+        from bra_scraper.batch import load_jobs, run_batch
+        jobs = load_jobs(ui.args.batch)
+        with optional_phase(profiler, "batch"):
+            summary = run_batch(scraper, jobs, max_jobs=ui.args.jobs,
+                                resume=ui.args.resume)
+        for job in summary["jobs"]:
+            ui.info(u"{:>8.1f} s {:>6} requests {:>9} datapoints  {}  {}".format(
+                job["seconds"], job["requests"], job["datapoints"],
+                job["outfile"], job["error"] or u"ok"))
+        ui.info(u"{} jobs ({} failed) in {:.1f} s, {} requests".format(
+            len(summary["jobs"]), summary["failed"], summary["seconds"],
+            summary["requests"]))
+        with open(ui.args.batch + ".summary.json", "w") as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+        write_reports(ui, metrics, profiler, ui.args.batch)
+        return
+
     topic_name = unicode(ui.args.topic, "utf-8")
-    topic = scraper.topic(topic_name)
+    with optional_phase(profiler, "topic"):
+        topic = scraper.topic(topic_name)
 
     # Make query
     if not ui.args.regions:
@@ -61,26 +154,108 @@ def main():
     else:
         regions = ui.args.regions.decode("utf-8").split(",")
 
-    result = topic.query(
+    # Finished requests are stored next to the outfile until the data
+    # has been written, so that an interrupted run can be resumed
+    checkpoint = Checkpoint(ui.args.outfile + ".checkpoint")
+    if not ui.args.resume:
+        checkpoint.clear()
+
+    query = dict(
         period_start=ui.args.period_start,
         period_end=ui.args.period_end,
         regions=regions,
+        manifest=ui.args.manifest,
+        checkpoint=checkpoint,
         )
-    
+
     # Store data
     data_file_path = ui.args.outfile
-    result.data.to_csv(data_file_path)
+    parquet = data_file_path.endswith(".parquet")
+    sqlite = data_file_path.endswith((".db", ".sqlite", ".sqlite3"))
+    if parquet and (ui.args.stream or ui.args.manifest):
+        # Parquet files can't be appended to
+        ui.error("Parquet output can't be combined with --stream or --incremental")
+        ui.exit()
+
+    store = None
+    if sqlite:
+        from bra_scraper.store import SqliteStore
+        store = SqliteStore(data_file_path)
+
+    def write(results, append):
+        """ Write the data (and, to a database, the notes) of a ResultSet """
+        with optional_phase(metrics, "export"):
+            if store is not None:
+                store.save(results, topic)
+            else:
+                results.save(data_file_path, append=append)
+
+    if ui.args.stream:
+        # Keep the notes, but write the data as soon as it is parsed
+        result = ResultSet()
+        append = bool(ui.args.manifest)
+        # Writing is part of the query phase in this mode
+        with optional_phase(profiler, "query"):
+            for batch in topic.iter_query(**query):
+                if len(batch.data):
+                    write(batch, append)
+                    append = True
+                for category, notes in batch.notes.items():
+                    for note in notes:
+                        result.add_note(category, note)
+    else:
+        with optional_phase(profiler, "query"):
+            result = topic.query(**query)
+        with optional_phase(profiler, "export"):
+            # In incremental mode there may be no new data to append
+            if len(result.data) or not ui.args.manifest:
+                write(result, append=bool(ui.args.manifest))
     ui.info(u"Writing to {}".format(unicode(data_file_path,"utf-8")))
 
     #
     if not ui.args.notes:
         # If note path not defined, write to "mydata_notes.csv" (if "mydata.csv" is data path)
-        notes_file = data_file_path.replace(".csv", "_notes.csv")
+        notes_file = data_file_path.replace(".csv", "_notes.csv")\
+            .replace(".parquet", "_notes.csv")
     else:
         notes_file = ui.args.notes
 
+    if store is not None:
+        # The notes are in the database
+        store.close()
+        if not ui.args.notes:
+            result.notes.clear()
+
     if result.notes:
-        result.notes.to_csv(notes_file)
+        with optional_phase(profiler, "notes"), \
+                optional_phase(metrics, "export"):
+            result.notes.to_csv(notes_file)
+
+    checkpoint.clear()
+
+    write_reports(ui, metrics, profiler, data_file_path)
+
+def write_reports(ui, metrics, profiler, path):
+    """ Write the metrics and the profile, if asked for """
+    if metrics is not None:
+        if ui.args.metrics.endswith(".prom"):
+            metrics.to_prometheus(ui.args.metrics)
+        else:
+            metrics.to_json(ui.args.metrics)
+
+    if profiler is not None:
+        profiler.stop()
+        for path in profiler.write(path):
+            ui.info(u"Wrote profile to {}".format(unicode(path, "utf-8")))
+
+@contextmanager
+def optional_phase(recorder, name):
+    """ Time a phase of `main()` with a Profiler or Metrics, if we have one """
+    if recorder is None:
+        yield
+    else:
+        with recorder.phase(name):
+            yield
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,69 @@
+# encoding: utf-8
+
+import os
+import json
+import pytest
+import sqlite3
+from bra_scraper import BRA
+from bra_scraper.batch import load_jobs, run_batch
+from bra_scraper.emulator import Emulator
+
+
+def test_load_jobs(tmpdir):
+    path = os.path.join(str(tmpdir), "jobs.json")
+    with open(path, "w") as f:
+        json.dump({
+            "defaults": {"period_start": "2015-01-01", "outfile": "a.csv"},
+            "jobs": [{"topic": "101"}, {"topic": "102", "outfile": "b.csv"}],
+        }, f)
+    jobs = load_jobs(path)
+    assert [x["outfile"] for x in jobs] == ["a.csv", "b.csv"]
+    assert jobs[1]["period_start"] == "2015-01-01"
+
+def test_run_batch(tmpdir):
+    tmpdir = str(tmpdir)
+    emulator = Emulator(n_topics=2, n_regions=10, n_crimes=5,
+                        n_periods=20).start()
+    try:
+        scraper = BRA(base_url=emulator.base_url)
+        url = emulator.base_url + "solwebb/action/anmalda/urval/urval?menyid="
+        jobs = [
+            {"topic": url + "101", "outfile": os.path.join(tmpdir, "a.csv"),
+             "regions": [u"Region 2 kommun"]},
+            {"topic": url + "102", "outfile": os.path.join(tmpdir, "bra.db")},
+            {"topic": url + "101", "outfile": os.path.join(tmpdir, "bra.db")},
+            {"topic": url + "101", "outfile": os.path.join(tmpdir, "c.csv"),
+             "regions": [u"No such region"]},
+            # Dates as read from a job file
+            {"topic": url + "102", "outfile": os.path.join(tmpdir, "d.csv"),
+             "period_start": u"1975-01-01", "period_end": u"1975-12-31"},
+        ]
+        summary = run_batch(scraper, jobs, max_jobs=2)
+    finally:
+        emulator.stop()
+
+    assert [x["datapoints"] for x in summary["jobs"]] == \
+        [100, 1000, 1000, 0, 850]
+    assert summary["failed"] == 1
+    assert summary["jobs"][3]["error"]
+    assert summary["datapoints"] == 2950
+    assert summary["requests"] == scraper.request_count + \
+        sum([x["requests"] for x in summary["jobs"]])
+
+    with open(os.path.join(tmpdir, "a.csv")) as f:
+        assert len(f.readlines()) == 101
+    db = sqlite3.connect(os.path.join(tmpdir, "bra.db"))
+    assert db.execute("SELECT topic, COUNT(*) FROM datapoints GROUP BY topic")\
+        .fetchall() == [(u"101", 1000), (u"102", 1000)]
+    assert not [x for x in os.listdir(tmpdir) if x.endswith(".checkpoint")]
+
+def test_run_batch_with_unknown_topic():
+    emulator = Emulator(n_topics=1, n_regions=10, n_crimes=5,
+                        n_periods=20).start()
+    try:
+        scraper = BRA(base_url=emulator.base_url)
+        with pytest.raises(ValueError) as e:
+            run_batch(scraper, [{"topic": u"Månadsvis", "outfile": "a.csv"}])
+    finally:
+        emulator.stop()
+    assert e.value.args[0] == u"Unknown topic: Månadsvis"
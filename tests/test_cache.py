@@ -0,0 +1,68 @@
+# encoding: utf-8
+
+import os
+import pytest
+from bra_scraper import BRA
+from bra_scraper.cache import ResponseCache
+from bra_scraper.emulator import Emulator
+
+
+def test_cache_roundtrip(tmpdir):
+    cache = ResponseCache(str(tmpdir))
+    key = cache.key("101", [8291], [3144], [2108, 2074], ["count"])
+    assert cache.get(key) is None
+
+    cache.set(key, u"<table>Årsvis</table>", u"<div></div>")
+    assert cache.get(key) == (u"<table>Årsvis</table>", u"<div></div>")
+
+def test_cache_key_ignores_order(tmpdir):
+    cache = ResponseCache(str(tmpdir))
+    key_1 = cache.key("101", [1, 2], [3], [4], ["count", "per capita"])
+    key_2 = cache.key("101", [2, 1], [3], [4], ["per capita", "count"])
+    key_3 = cache.key("102", [2, 1], [3], [4], ["per capita", "count"])
+    assert key_1 == key_2
+    assert key_1 != key_3
+
+def test_cache_ttl(tmpdir):
+    cache = ResponseCache(str(tmpdir), ttl=-1)
+    cache.set("foo", u"table", u"notes")
+    assert cache.get("foo") is None
+
+def test_cache_evicts_least_recently_used(tmpdir):
+    cache = ResponseCache(str(tmpdir))
+    for key in ["a", "b", "c"]:
+        cache.set(key, u"x" * 1000, u"")
+    # Make "a" the most recently used
+    os.utime(cache._file_path("b"), (1, 1))
+    os.utime(cache._file_path("c"), (2, 2))
+    cache.get("a")
+
+    # The files differ slightly in size, as the creation time is stored
+    cache.max_size = os.path.getsize(cache._file_path("a")) + \
+        os.path.getsize(cache._file_path("c"))
+    cache._evict()
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+def test_error_pages_are_not_cached(tmpdir):
+    emulator = Emulator(n_regions=3, n_crimes=2, n_periods=4).start()
+    try:
+        scraper = BRA(base_url=emulator.base_url, cache=str(tmpdir))
+        topic = scraper.topics[0]
+        topic.dimensions()
+
+        # Without a throttle, the error page only fails when it is parsed
+        emulator.error_rate = 1.0
+        with pytest.raises(IndexError):
+            topic.query()
+        assert len(os.listdir(str(tmpdir))) == 0
+
+        emulator.error_rate = 0.0
+        assert len(topic.query().data) == 3 * 2 * 4
+        assert len(os.listdir(str(tmpdir))) == 1
+        assert len(topic.query().data) == 3 * 2 * 4
+        assert emulator.stats()["requests"]["soktabell"] == 2
+    finally:
+        emulator.stop()
@@ -0,0 +1,86 @@
+# encoding: utf-8
+
+import os
+import json
+import time
+import pytest
+from bra_scraper import BRA
+from bra_scraper.emulator import Emulator
+
+
+@pytest.fixture
+def emulator():
+    emulator = Emulator(n_topics=3).start()
+    yield emulator
+    emulator.stop()
+
+def _n_fetched(emulator):
+    """ Number of times the list of topics was fetched """
+    return emulator.stats()["requests"].get("start", 0)
+
+def _topics(scraper):
+    return [(x.label, x.url, x.description) for x in scraper.topics]
+
+def _set_age(path, seconds):
+    with open(path) as f:
+        catalog = json.load(f)
+    catalog["fetched"] = time.time() - seconds
+    with open(path, "w") as f:
+        json.dump(catalog, f)
+
+def test_read_topics_from_catalog(emulator, tmpdir):
+    path = os.path.join(str(tmpdir), "catalog.json")
+    topics = _topics(BRA(catalog=path, base_url=emulator.base_url))
+    assert len(topics) == 3
+    assert _n_fetched(emulator) == 1
+    assert os.path.exists(path)
+
+    scraper = BRA(catalog=path, base_url=emulator.base_url)
+    assert _topics(scraper) == topics
+    assert _n_fetched(emulator) == 1
+    assert scraper.topic(topics[0][1]).label == topics[0][0]
+
+def test_catalog_expires(emulator, tmpdir):
+    path = os.path.join(str(tmpdir), "catalog.json")
+    BRA(catalog=path, base_url=emulator.base_url).topics
+
+    _set_age(path, 600)
+    BRA(catalog=path, catalog_max_age=3600, base_url=emulator.base_url).topics
+    assert _n_fetched(emulator) == 1
+
+    _set_age(path, 7200)
+    BRA(catalog=path, catalog_max_age=None, base_url=emulator.base_url).topics
+    assert _n_fetched(emulator) == 1
+    BRA(catalog=path, catalog_max_age=3600, base_url=emulator.base_url).topics
+    assert _n_fetched(emulator) == 2
+
+    # The fetched list was stored again
+    BRA(catalog=path, catalog_max_age=3600, base_url=emulator.base_url).topics
+    assert _n_fetched(emulator) == 2
+
+def test_refresh_topics(emulator, tmpdir):
+    path = os.path.join(str(tmpdir), "catalog.json")
+    scraper = BRA(catalog=path, base_url=emulator.base_url)
+    topics = _topics(scraper)
+    _set_age(path, 600)
+
+    assert [(x.label, x.url, x.description)
+            for x in scraper.refresh_topics()] == topics
+    assert _n_fetched(emulator) == 2
+    with open(path) as f:
+        assert time.time() - json.load(f)["fetched"] < 60
+
+def test_corrupt_catalog_is_fetched_again(emulator, tmpdir):
+    path = os.path.join(str(tmpdir), "catalog.json")
+    topics = _topics(BRA(catalog=path, base_url=emulator.base_url))
+    with open(path) as f:
+        content = f.read()
+    with open(path, "w") as f:
+        f.write(content[:len(content) // 2])
+
+    assert _topics(BRA(catalog=path, base_url=emulator.base_url)) == topics
+    assert _n_fetched(emulator) == 2
+    # Only the catalog is left, without temporary files
+    assert os.listdir(str(tmpdir)) == ["catalog.json"]
+    BRA(catalog=path, base_url=emulator.base_url).topics
+    assert _n_fetched(emulator) == 2
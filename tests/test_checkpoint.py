@@ -0,0 +1,35 @@
+# encoding: utf-8
+
+import os
+from bra_scraper import BRA
+from bra_scraper.emulator import Emulator, value
+
+
+def test_resume_interrupted_query(tmpdir):
+    emulator = Emulator(n_regions=30, n_crimes=10, n_periods=170).start()
+    try:
+        checkpoint = os.path.join(str(tmpdir), "checkpoint")
+        topic = BRA(base_url=emulator.base_url).topics[0]
+        n_requests = len(topic.plan())
+        assert n_requests > 3
+
+        # Interrupt the query after three requests
+        batches = topic.iter_query(checkpoint=checkpoint)
+        for i in range(3):
+            next(batches)
+        batches.close()
+        assert emulator.stats()["requests"]["soktabell"] == 3
+
+        result = topic.query(checkpoint=checkpoint)
+
+        # The finished requests are loaded, not fetched again
+        assert emulator.stats()["requests"]["soktabell"] == n_requests
+        assert len(result.data) == 30 * 10 * 170
+        cells = set()
+        for period_id, region_id, crime_id, measure_id, x, status \
+                in result.data.id_rows():
+            assert x == value(period_id, region_id, crime_id)
+            cells.add((period_id, region_id, crime_id))
+        assert len(cells) == 30 * 10 * 170
+    finally:
+        emulator.stop()
@@ -0,0 +1,64 @@
+# encoding: utf-8
+
+from datetime import datetime
+from bra_scraper.dimension import Regions, Periods
+
+REGIONS_HTML = u"""
+arrayRegionNivaEtt[0]="8291*Hela landet"
+arrayRegionNivaTva[0]="8292*Stockholms län*8291*Hela landet, Stockholms län"
+arrayRegionNivaTva[1]="8293*Uppsala län*8291*Hela landet, Uppsala län"
+"""
+
+PERIODS_HTML = u"""
+arrayPeriod[0]="2108*2011*År 2011*ar"
+arrayPeriod[1]="2201*2012*2012, Kvartal 2*kvartal"
+arrayPeriod[2]="2074*2016*År 2016 prel.*ar"
+arrayPeriod[3]="2300*2016*2016, Kvartal 4*kvartal"
+arrayPeriod[4]="2311*2016*2016, Nov*manad"
+arrayPeriod[5]="2312*2016*2016, Dec*manad"
+"""
+
+
+def test_get_category():
+    regions = Regions(html=REGIONS_HTML)
+    stockholm = regions.get(8292)
+    assert stockholm.label == u"Hela landet, Stockholms län"
+    assert stockholm.parent is regions.get(8291)
+    assert regions.get(u"Hela landet, Stockholms län") is stockholm
+    assert regions.get(u"Stockholms län") is stockholm
+    assert regions.get(u"Hela landet") is regions.get(8291)
+    assert regions.get(u"foo") is None
+
+def test_get_period():
+    periods = Periods(html=PERIODS_HTML)
+    assert periods.get(2201).label == u"2012, Kvartal 2"
+    assert periods.get(u"Kvartal 2") is periods.get(2201)
+
+def test_period_bounds():
+    periods = Periods(html=PERIODS_HTML)
+    quarter = periods.get(2201)
+    assert quarter.period_start == datetime(2012, 4, 1)
+    assert quarter.period_end == datetime(2012, 6, 30)
+    assert quarter.periodicity == "quarterly"
+    assert periods.get(2074).period_end == datetime(2016, 12, 31)
+    assert periods.get(2312).periodicity == "monthly"
+
+def test_select_periods():
+    periods = Periods(html=PERIODS_HTML)
+    for start, end in [(datetime(2016, 12, 1), datetime(2016, 12, 31)),
+                       (datetime(2016, 11, 1), datetime(2016, 11, 30)),
+                       (datetime(1900, 1, 1), datetime(2999, 1, 1)),
+                       (datetime(2012, 5, 1), datetime(2016, 1, 1))]:
+        expected = [x for x in periods.categories
+                    if (x.in_range(start) or x.period_start >= start)
+                    and x.period_end <= end]
+        assert periods.select(start, end) == expected
+
+    selected = periods.select(datetime(2016, 12, 1), datetime(2016, 12, 31))
+    assert set([x.id for x in selected]) == set([2074, 2300, 2312])
+
+def test_init_dimension_from_rows():
+    regions = Regions(html=REGIONS_HTML)
+    copy = Regions(categories=regions.rows())
+    assert sorted(copy.rows()) == sorted(regions.rows())
+    assert copy.get(u"Uppsala län").parent is copy.get(8291)
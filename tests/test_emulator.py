@@ -0,0 +1,133 @@
+# encoding: utf-8
+
+import os
+import time
+import pytest
+import requests
+from bra_scraper import BRA
+from bra_scraper.emulator import Emulator, value
+
+
+@pytest.fixture
+def emulator():
+    emulator = Emulator(n_regions=30, n_crimes=10, n_periods=40).start()
+    yield emulator
+    emulator.stop()
+
+def test_query_against_emulator(emulator):
+    scraper = BRA(base_url=emulator.base_url)
+    topic = scraper.topics[0]
+    result = topic.query(max_workers=2)
+
+    # 30 * 10 * 40 datapoints, in requests of at most 10 000
+    assert len(result.data) == 12000
+    assert emulator.stats()["requests"]["soktabell"] == 2
+    assert emulator.stats()["errors"] == {}
+    for datapoint in list(result.data)[:100]:
+        assert datapoint["value"] == value(datapoint["period"].id,
+            datapoint["region"].id, datapoint["crime"].id)
+
+def test_iter_query_streams_requests():
+    emulator = Emulator(n_regions=30, n_crimes=10, n_periods=170).start()
+    try:
+        scraper = BRA(base_url=emulator.base_url)
+        topic = scraper.topics[0]
+        n_requests = len(topic.plan())
+        assert n_requests > 3
+
+        batches = topic.iter_query(max_workers=2)
+        first = next(batches)
+        time.sleep(0.5)
+        # The workers wait for the consumer instead of fetching ahead
+        assert emulator.stats()["requests"]["soktabell"] <= 3
+
+        n_datapoints = len(first.data) + sum([len(b.data) for b in batches])
+        assert n_datapoints == 30 * 10 * 170
+        assert emulator.stats()["requests"]["soktabell"] == n_requests
+        assert emulator.stats()["errors"] == {}
+    finally:
+        emulator.stop()
+
+def test_aquery_against_emulator(emulator):
+    pytest.importorskip("aiohttp")
+    import asyncio
+    scraper = BRA(base_url=emulator.base_url)
+    topic = scraper.topics[0]
+    loop = asyncio.new_event_loop()
+    try:
+        result = loop.run_until_complete(topic.aquery(max_pipelines=2))
+    finally:
+        loop.close()
+
+    assert len(result.data) == 12000
+    assert emulator.stats()["requests"]["soktabell"] == 2
+    assert emulator.stats()["errors"] == {}
+    for datapoint in list(result.data)[:100]:
+        assert datapoint["value"] == value(datapoint["period"].id,
+            datapoint["region"].id, datapoint["crime"].id)
+
+def test_aquery_stops_all_pipelines_on_error(emulator, monkeypatch):
+    pytest.importorskip("aiohttp")
+    import asyncio
+    scraper = BRA(base_url=emulator.base_url)
+    topic = scraper.topics[0]
+    topic.dimensions()
+
+    payload = topic._payload
+    def fail_once(regions, crimes, periods, measures):
+        if not calls:
+            calls.append(periods)
+            raise ValueError("Bad request")
+        return payload(regions, crimes, periods, measures)
+    calls = []
+    monkeypatch.setattr(topic, "_payload", fail_once)
+
+    loop = asyncio.new_event_loop()
+    try:
+        with pytest.raises(ValueError):
+            loop.run_until_complete(topic.aquery(max_pipelines=2))
+        # No pipeline is left running on the closed connection pool
+        assert [x for x in asyncio.all_tasks(loop) if not x.done()] == []
+    finally:
+        loop.close()
+
+def test_aquery_does_not_cache_error_pages(emulator, tmpdir):
+    aiohttp = pytest.importorskip("aiohttp")
+    import asyncio
+    scraper = BRA(base_url=emulator.base_url, cache=str(tmpdir))
+    topic = scraper.topics[0]
+    topic.dimensions()
+
+    loop = asyncio.new_event_loop()
+    try:
+        emulator.error_rate = 1.0
+        with pytest.raises(aiohttp.ClientResponseError):
+            loop.run_until_complete(topic.aquery(max_pipelines=2))
+        assert os.listdir(str(tmpdir)) == []
+
+        emulator.error_rate = 0.0
+        result = loop.run_until_complete(topic.aquery(max_pipelines=2))
+    finally:
+        loop.close()
+    assert len(result.data) == 12000
+    assert len(os.listdir(str(tmpdir))) == 2
+
+def test_emulator_enforces_navigation(emulator):
+    session = requests.session()
+    search_url = emulator.base_url + "solwebb/action/anmalda/urval/"
+    r = session.get(search_url + "urval?menyid=101")
+    assert r.status_code == 500
+
+    session.get(emulator.base_url + "solwebb/action/")
+    r = session.post(search_url + "vantapopup", data={"antal": 1})
+    assert r.status_code == 500
+
+    session.get(search_url + "urval?menyid=101")
+    r = session.post(search_url + "vantapopup", data={
+        "region_id_string": "*".join([str(x) for x in range(1, 31)]),
+        "brottstyp_id_string": "*".join([str(x) for x in range(1, 11)]),
+        "period_id_string": "*".join([str(x) for x in range(1, 41)]),
+        "antal": 1,
+    })
+    # More than 10 000 datapoints
+    assert r.status_code == 500
@@ -0,0 +1,134 @@
+# encoding: utf-8
+
+import os
+import json
+import threading
+import pytest
+from bra_scraper import BRA
+from bra_scraper.emulator import Emulator
+from bra_scraper.manifest import Manifest
+
+REGIONS = [u"Region 2 kommun", u"Region 3 kommun"]
+
+
+@pytest.fixture
+def emulator():
+    # 17 periods a year, 1975 and 1976
+    emulator = Emulator(n_regions=10, n_crimes=5, n_periods=34).start()
+    yield emulator
+    emulator.stop()
+
+def _searches(emulator):
+    return emulator.stats()["requests"].get("soktabell", 0)
+
+def test_incremental_query_fetches_new_periods(emulator, tmpdir):
+    path = os.path.join(str(tmpdir), "manifest.json")
+    topic = BRA(base_url=emulator.base_url).topics[0]
+
+    result = topic.query(regions=REGIONS, period_end="1975-12-31",
+                         manifest=path)
+    assert len(result.data) == 2 * 5 * 17
+
+    result = topic.query(regions=REGIONS, period_end="1976-12-31",
+                         manifest=path)
+    assert len(result.data) == 2 * 5 * 17
+    assert all([u"1976" in x.label
+                for x in result.data.categories("period")])
+
+    n_searches = _searches(emulator)
+    result = topic.query(regions=REGIONS, period_end="1976-12-31",
+                         manifest=path)
+    assert len(result.data) == 0
+    assert _searches(emulator) == n_searches
+
+def test_incremental_query_with_other_filters(emulator, tmpdir):
+    path = os.path.join(str(tmpdir), "manifest.json")
+    topic = BRA(base_url=emulator.base_url).topics[0]
+
+    topic.query(regions=REGIONS, period_end="1975-12-31", manifest=path)
+
+    # Other regions, crimes or measures are fetched for every period
+    result = topic.query(regions=[u"Region 4 kommun"],
+                         period_end="1975-12-31", manifest=path)
+    assert len(result.data) == 5 * 17
+    result = topic.query(regions=REGIONS, crimes=[u"Brott 2"],
+                         period_end="1975-12-31", manifest=path)
+    assert len(result.data) == 2 * 17
+    result = topic.query(regions=REGIONS, measures="*",
+                         period_end="1975-12-31", manifest=path)
+    assert len(result.data) == 2 * 5 * 17 * 2
+
+    with open(path) as f:
+        assert len(json.load(f)[topic.menu_id]) == 4
+
+def test_interrupted_incremental_query_keeps_progress(emulator, tmpdir):
+    path = os.path.join(str(tmpdir), "manifest.json")
+    topic = BRA(base_url=emulator.base_url).topics[0]
+    # One request per 5 periods
+    topic.MAX_DATAPOINTS = 2 * 5 * 5
+
+    batches = topic.iter_query(regions=REGIONS, period_end="1976-12-31",
+                               manifest=path)
+    fetched = set()
+    for batch in batches:
+        if len(fetched) >= 10:
+            # Stop before handling this batch
+            break
+        fetched |= set([x.id for x in batch.data.categories("period")])
+    batches.close()
+
+    manifest = Manifest(path)
+    key = Manifest.filters_key(topic.menu_id, [2, 3], range(1, 6), ["count"])
+    assert manifest.period_ids(topic.menu_id, key) == fetched
+
+    result = topic.query(regions=REGIONS, period_end="1976-12-31",
+                         manifest=path)
+    periods = set([x.id for x in result.data.categories("period")])
+    assert not periods & fetched
+    assert len(periods | fetched) == 34
+
+def test_interrupted_incremental_query_handles_whole_periods(emulator,
+                                                              tmpdir):
+    path = os.path.join(str(tmpdir), "manifest.json")
+    topic = BRA(base_url=emulator.base_url).topics[0]
+    # Two requests per period
+    topic.MAX_DATAPOINTS = 5
+
+    # Like run.py --stream, which writes every batch as it arrives
+    written = []
+    batches = topic.iter_query(regions=REGIONS, period_end="1975-12-31",
+                               manifest=path)
+    for i, batch in enumerate(batches):
+        if i == 3:
+            # Interrupted before writing this batch
+            break
+        written += list(batch.data.id_rows())
+    batches.close()
+
+    for batch in topic.iter_query(regions=REGIONS, period_end="1975-12-31",
+                                  manifest=path):
+        written += list(batch.data.id_rows())
+    cells = [x[:3] for x in written]
+    assert len(cells) == 2 * 5 * 17
+    assert len(set(cells)) == len(cells)
+
+def test_shared_manifest_keeps_entries_of_others(tmpdir):
+    path = os.path.join(str(tmpdir), "manifest.json")
+    manifests = [Manifest(path) for i in range(8)]
+
+    def save(i):
+        for period_id in range(20):
+            manifests[i].add(str(100 + i % 4), "key", [period_id + i])
+            manifests[i].save()
+
+    threads = [threading.Thread(target=save, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    manifest = Manifest(path)
+    for i in range(4):
+        assert manifest.period_ids(str(100 + i), "key") == \
+            set(range(i, i + 24))
+    assert [x for x in os.listdir(str(tmpdir))] == ["manifest.json"]
@@ -0,0 +1,46 @@
+# encoding: utf-8
+
+import json
+from bra_scraper import BRA
+from bra_scraper.emulator import Emulator
+from bra_scraper.metrics import Metrics
+
+
+def test_metrics_of_query():
+    emulator = Emulator(n_regions=30, n_crimes=10, n_periods=40).start()
+    try:
+        metrics = Metrics()
+        scraper = BRA(base_url=emulator.base_url, metrics=metrics)
+        topic = scraper.topics[0]
+        topic.query(max_workers=2)
+    finally:
+        emulator.stop()
+
+    stats = metrics.to_dict()
+    assert stats["datapoints"] == 12000
+    requests = dict([(x["step"], x) for x in stats["requests"]])
+    assert requests["soktabell"]["count"] == 2
+    assert requests["soktabell"]["status"] == 200
+    assert requests["soktabell"]["bytes"] > 0
+    assert sum([x["count"] for x in stats["requests"]]) == \
+        scraper.request_count + topic.request_count
+    for phase in ("catalog", "dimensions", "plan", "fetch", "parse", "notes"):
+        assert stats["phases"][phase]["count"] > 0
+    assert stats["phases"]["fetch"]["count"] == 2
+    json.loads(metrics.to_json())
+
+def test_prometheus_format():
+    metrics = Metrics()
+    metrics.record_request("GET", "http://x/solwebb/action/anmalda/urval/soktabell",
+                           0.3, 1000, 200)
+    metrics.record_request("GET", "http://x/solwebb/action/", 0.01, 0, None)
+    metrics.record_phase("parse", 0.5)
+    metrics.add_datapoints(10)
+
+    lines = metrics.to_prometheus().splitlines()
+    assert 'bra_scraper_request_duration_seconds_bucket{step="soktabell",status="200",le="0.25"} 0.0' in lines
+    assert 'bra_scraper_request_duration_seconds_bucket{step="soktabell",status="200",le="0.5"} 1.0' in lines
+    assert 'bra_scraper_request_duration_seconds_count{step="start",status="error"} 1.0' in lines
+    assert 'bra_scraper_response_bytes_total{step="soktabell",status="200"} 1000.0' in lines
+    assert 'bra_scraper_phase_duration_seconds_sum{phase="parse"} 0.5' in lines
+    assert 'bra_scraper_datapoints_total 10.0' in lines
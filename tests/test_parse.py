@@ -0,0 +1,64 @@
+# encoding: utf-8
+
+import os
+from lxml import html
+from bra_scraper.topic import Topic
+from bra_scraper.dimension import Periods, Regions, Crimes, Measures
+from bra_scraper.utils import parse_counts, parse_value
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+def _read(file_name):
+    with open(os.path.join(DATA_DIR, file_name), "rb") as f:
+        return f.read().decode("iso-8859-1")
+
+def _parse_with_lxml(page_content):
+    """ Reference implementation that parses the full html tree
+    """
+    tree = html.fromstring(page_content)
+    cells = []
+    for td in tree.xpath("//td[@class='resultatAntal']"):
+        ids = td.get("headers").split(" ")
+        if len(ids) == 1:
+            continue
+        cells.append((ids, parse_value(td.text, "integer"), td.text == ".."))
+    return cells
+
+def _topic(reference):
+    """ A topic with the categories of the recorded result page
+    """
+    topic = Topic(u"Anmälda brott", "urval?menyid=1", u"brottstyp")
+    ids = [ids for ids, value, missing in reference]
+    topic._periods = Periods(categories=[
+        (id, u"År {}".format(id), None)
+        for id in sorted(set(int(x[0]) for x in ids))])
+    topic._regions = Regions(categories=[
+        (id, u"Region {}".format(id), None)
+        for id in sorted(set(int(x[3]) for x in ids))])
+    topic._crimes = Crimes(categories=[
+        (id, u"Brott {}".format(id), None)
+        for id in sorted(set(int(x[2]) for x in ids))])
+    topic._measures = Measures()
+    return topic
+
+def test_parse_result_page_with_missing_values():
+    page_content = _read("result_page_html_with_missing_values.html")
+    reference = _parse_with_lxml(page_content)
+    assert reference[0] == \
+        (["2108", "289", "3144", "8291", "antal"], 1416280, False)
+    assert any([missing for ids, value, missing in reference])
+
+    data = _topic(reference)._parse_data(page_content)
+
+    measures = {"antal": "count", "antal_100": "per capita"}
+    assert len(data) == len(reference)
+    assert [(x["period"].id, x["region"].id, x["crime"].id,
+             x["measure"].id, x["value"], x["status"]) for x in data] == \
+        [(int(ids[0]), int(ids[3]), int(ids[2]), measures[ids[-1]], value,
+          "missing" if missing else None)
+         for ids, value, missing in reference]
+
+def test_parse_counts():
+    assert parse_counts([u"1&nbsp;416&nbsp;280", u"1\xa0416", u"..", u"12"]) \
+        == [1416280, 1416, None, 12]
@@ -0,0 +1,35 @@
+# encoding: utf-8
+
+import os
+from bra_scraper import BRA
+from bra_scraper.emulator import Emulator
+from bra_scraper.profiler import Profiler
+
+
+def test_profile_phases(tmpdir):
+    emulator = Emulator().start()
+    profiler = Profiler(interval=0.001)
+    profiler.start()
+    try:
+        with profiler.phase("topic"):
+            topic = BRA(base_url=emulator.base_url).topics[0]
+        with profiler.phase("query"):
+            topic.query()
+    finally:
+        profiler.stop()
+        emulator.stop()
+
+    assert [x[0] for x in profiler.phases] == ["topic", "query"]
+    paths = profiler.write(os.path.join(str(tmpdir), "data.csv"))
+    assert [os.path.basename(x) for x in paths] == \
+        ["data.csv.profile.txt", "data.csv.folded", "data.csv.pstats"]
+
+    with open(paths[0]) as f:
+        report = f.read()
+    assert "query" in report
+    assert "_parse_data" in report
+
+    with open(paths[1]) as f:
+        stack, count = f.readline().rsplit(" ", 1)
+    assert int(count) > 0
+    assert ";" in stack
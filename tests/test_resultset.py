@@ -0,0 +1,222 @@
+# encoding: utf-8
+
+import os
+import pytest
+from bra_scraper.category import Category, Period, Region
+from bra_scraper.resultset import Dataset, ResultSet
+from bra_scraper.dimension import Regions
+from bra_scraper.note import Note
+
+PERIODS = [Period(2108, u"År 2011"), Period(2074, u"År 2012")]
+REGIONS = [Region(8291, u"Hela landet"),
+           Region(8292, u"Hela landet, Stockholms län")]
+CRIME = Category(3144, u"Samtliga brott")
+COUNT = Category("count", "Antal")
+
+
+def _datapoints(values):
+    datapoints = []
+    for period, region, value in zip(PERIODS * 2, REGIONS * 2, values):
+        datapoints.append({
+            "period": period,
+            "region": region,
+            "crime": CRIME,
+            "measure": COUNT,
+            "value": value,
+            "status": "missing" if value is None else None,
+        })
+    return datapoints
+
+def test_dataset_behaves_like_a_list():
+    datapoints = _datapoints([1416280, None, 16990])
+    dataset = Dataset(datapoints)
+    assert len(dataset) == 3
+    assert list(dataset) == datapoints
+    assert dataset[-1] == datapoints[-1]
+    assert dataset[1]["value"] is None
+    assert dataset[1]["status"] == "missing"
+    assert isinstance(dataset[0]["value"], int)
+
+def test_slice_dataset():
+    datapoints = _datapoints([1416280, None, 16990])
+    dataset = Dataset(datapoints)
+    first = dataset[:2]
+    assert isinstance(first, Dataset)
+    assert list(first) == datapoints[:2]
+    assert list(dataset[::-2]) == datapoints[::-2]
+    assert list(dataset[5:]) == []
+    # Only the categories of the slice are kept
+    assert dataset[1:2].categories("region") == [REGIONS[1]]
+
+def test_dataset_list_methods():
+    datapoints = _datapoints([1416280, None, 16990])
+    dataset = Dataset(datapoints)
+    assert dataset == datapoints
+    assert dataset == Dataset(datapoints)
+    assert dataset != datapoints[:2]
+    assert not isinstance(dataset, list)
+
+    dataset.sort(key=lambda x: x["value"] or 0)
+    assert dataset == [datapoints[1], datapoints[2], datapoints[0]]
+    assert dataset.pop() == datapoints[0]
+    assert dataset.pop(0) == datapoints[1]
+    assert dataset == datapoints[2:]
+
+def test_integer_values_are_kept_per_datapoint():
+    datapoints = _datapoints([1416280, None, 16990])
+    datapoints[0]["value"] = 12.5
+    dataset = Dataset(datapoints)
+    assert dataset[0]["value"] == 12.5
+    assert isinstance(dataset[2]["value"], int)
+
+    dataset += Dataset(_datapoints([3]))
+    assert isinstance(dataset[-1]["value"], int)
+    assert dataset[:1][0]["value"] == 12.5
+
+def test_extend_dataset_with_dataset():
+    first = Dataset(_datapoints([1, 2]))
+    # Categories in another order than in `first`
+    second = Dataset(list(reversed(_datapoints([3, 4]))))
+    first += second
+    assert list(first) == _datapoints([1, 2]) + list(reversed(_datapoints([3, 4])))
+
+def test_dictlist():
+    dataset = Dataset(_datapoints([1, None]))
+    rows = dataset.dictlist
+    assert rows[0]["region_id"] == 8291
+    assert rows[0]["region"] == u"Hela landet"
+    assert rows[0]["timepoint"].year == 2011
+    assert rows[0]["periodicity"] == "yearly"
+    assert rows[1]["value"] is None
+    assert rows[1]["status"] == "missing"
+
+def test_add_results():
+    results = ResultSet()
+    batch = ResultSet()
+    batch.add_data(_datapoints([1, 2]))
+    batch.add_note(u"Hela landet", "note")
+    results.add_results(batch)
+    results.add_results(batch)
+    assert len(results.data) == 4
+    assert results.note(u"Hela landet") == ["note"]
+
+def test_to_parquet(tmpdir):
+    pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+    dataset = Dataset(_datapoints([1416280, None, 16990]))
+    path = os.path.join(str(tmpdir), "data.parquet")
+    dataset.to_parquet(path, row_group_size=2)
+
+    assert pq.ParquetFile(path).metadata.num_row_groups == 2
+    rows = pq.read_table(path).to_pylist()
+    expected = dataset.dictlist
+    assert [sorted(x.keys()) for x in rows] == [sorted(x.keys()) for x in expected]
+    for row, expected_row in zip(rows, expected):
+        for key in ["region", "region_id", "period_id", "crime_id",
+                    "measure_id", "periodicity", "value", "status", "timepoint"]:
+            assert row[key] == expected_row[key]
+    assert dataset.to_arrow().schema.field("region").type.value_type == "string"
+
+def test_to_csv(tmpdir):
+    path = os.path.join(str(tmpdir), "data.csv")
+    Dataset(_datapoints([1416280, None])).to_csv(path)
+    Dataset(_datapoints([16990])).to_csv(path, append=True)
+    with open(path, "rb") as f:
+        lines = f.read().decode("utf-8").splitlines()
+    assert lines == [
+        u",crime,crime_id,measure,measure_id,period,period_id,periodicity,"
+        u"region,region_id,status,timepoint,value",
+        u"0,Samtliga brott,3144,Antal,count,År 2011,2108,yearly,"
+        u"Hela landet,8291,,2011-01-01,1416280",
+        u'1,Samtliga brott,3144,Antal,count,År 2012,2074,yearly,'
+        u'"Hela landet, Stockholms län",8292,missing,2012-01-01,',
+        u"2,Samtliga brott,3144,Antal,count,År 2011,2108,yearly,"
+        u"Hela landet,8291,,2011-01-01,16990",
+    ]
+
+def test_save_batches_to_one_csv(tmpdir):
+    path = os.path.join(str(tmpdir), "data.csv")
+    for i, values in enumerate([[1, 2], [3]]):
+        batch = ResultSet()
+        batch.add_data(_datapoints(values))
+        batch.save(path, append=i > 0)
+    with open(path, "rb") as f:
+        lines = f.read().decode("utf-8").splitlines()
+    assert len(lines) == 4
+    assert [line.split(",")[0] for line in lines[1:]] == ["0", "1", "2"]
+    assert [line.split(",")[-1] for line in lines[1:]] == ["1", "2", "3"]
+
+    with pytest.raises(ValueError):
+        batch.save(os.path.join(str(tmpdir), "data.parquet"), append=True)
+
+def test_notes_to_csv(tmpdir):
+    regions = Regions(categories=[(8291, u"Hela landet", None),
+        (8292, u"Hela landet, Stockholms län", 8291)])
+    results = ResultSet()
+    results.add_note(u"Stockholms län",
+                     Note(u"Preliminära uppgifter", u"Stockholms län", regions))
+    results.add_note(u"Okänd", None)
+
+    path = os.path.join(str(tmpdir), "notes.csv")
+    results.notes.to_csv(path)
+    with open(path, "rb") as f:
+        lines = f.read().decode("utf-8").splitlines()
+    assert lines == [
+        u"note,category_label,category_id,dimension",
+        u'Preliminära uppgifter,"Hela landet, Stockholms län",8292,regions',
+    ]
+
+def _cube_dataset():
+    """ Values for (År 2011, Hela landet), (År 2012, Stockholms län) and
+        (År 2011, Stockholms län), of which one is missing """
+    dataset = Dataset()
+    for period, region, value in [(0, 0, 1416280), (1, 1, None), (0, 1, 16990)]:
+        dataset.add(PERIODS[period], REGIONS[region], CRIME, COUNT, value,
+                    "missing" if value is None else None)
+    return dataset
+
+def test_to_cube():
+    np = pytest.importorskip("numpy")
+    results = ResultSet()
+    results.add_data(_cube_dataset())
+    cube = results.to_cube()
+    assert cube.dims == ("region", "crime", "period", "measure")
+    assert cube.shape == (2, 1, 2, 1)
+    assert cube.index["region"] == {8291: 0, 8292: 1}
+    assert cube.values[0, 0, 0, 0] == 1416280
+    # Missing, and not in the data
+    assert np.isnan(cube.values[1, 0, 1, 0])
+    assert np.isnan(cube.values[0, 0, 1, 0])
+
+    stockholm = cube.sel(region=u"Stockholms län", measure="count")
+    assert stockholm.dims == ("crime", "period")
+    assert stockholm.values[0, 0] == 16990
+    assert cube.sel(region=8292, crime=u"Samtliga brott", period=u"År 2011",
+                    measure="Antal") == 16990
+    assert cube.sel(period=[u"År 2012", u"År 2011"]).values[0, 0, 1, 0] == \
+        1416280
+    with pytest.raises(KeyError):
+        cube.sel(region=u"Skåne län")
+
+    transposed = _cube_dataset().to_cube(dims=("period", "region"))
+    assert transposed.shape == (2, 2)
+    assert transposed.values[0, 1] == 16990
+    # Values of different regions would end up in the same cell
+    with pytest.raises(ValueError):
+        _cube_dataset().to_cube(dims=("period", "crime", "measure"))
+
+def test_cube_as_array():
+    np = pytest.importorskip("numpy")
+    cube = _cube_dataset().to_cube()
+    assert np.asarray(cube) is cube.values
+    assert np.array(cube) is not cube.values
+    assert np.asarray(cube, dtype=np.float32).dtype == np.float32
+    assert np.array_equal(np.array(cube), cube.values, equal_nan=True)
+
+def test_to_sparse_cube():
+    np = pytest.importorskip("numpy")
+    pytest.importorskip("sparse")
+    dense = _cube_dataset().to_cube()
+    cube = _cube_dataset().to_cube(sparse=True)
+    assert cube.values.nnz == 2
+    assert np.array_equal(np.asarray(cube), dense.values, equal_nan=True)
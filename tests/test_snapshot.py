@@ -0,0 +1,38 @@
+# encoding: utf-8
+
+import os
+from bra_scraper import BRA
+from bra_scraper.topic import Topic
+from bra_scraper.emulator import Emulator
+
+
+def _periods(topic):
+    return [(x.id, x.label, x.period_start, x.period_end, x.periodicity)
+            for x in topic.dimension("periods").categories]
+
+def test_snapshot_roundtrip(tmpdir):
+    emulator = Emulator(n_regions=5, n_crimes=4, n_periods=20).start()
+    try:
+        path = os.path.join(str(tmpdir), "topic.json.gz")
+        topic = BRA(base_url=emulator.base_url).topics[0]
+        topic.save_snapshot(path)
+        n_requests = sum(emulator.stats()["requests"].values())
+
+        loaded = Topic.load_snapshot(path, base_url=emulator.base_url)
+        # Nothing is fetched
+        assert sum(emulator.stats()["requests"].values()) == n_requests
+
+        assert (loaded.label, loaded.url, loaded.description) == \
+            (topic.label, topic.url, topic.description)
+        for name in ("regions", "crimes"):
+            assert loaded.dimension(name).rows() == topic.dimension(name).rows()
+        assert [x.id for x in loaded.dimension("measures").categories] == \
+            [x.id for x in topic.dimension("measures").categories]
+
+        # The period bounds are stored, not parsed from the labels again
+        assert all([x._bounds is not None
+                    for x in loaded.dimension("periods").categories])
+        assert _periods(loaded) == _periods(topic)
+        assert loaded.plan() == topic.plan()
+    finally:
+        emulator.stop()
@@ -0,0 +1,133 @@
+# encoding: utf-8
+
+import os
+import sqlite3
+from bra_scraper import BRA
+from bra_scraper.emulator import Emulator, value
+from bra_scraper.store import SqliteStore
+from bra_scraper.category import Category, Period, Region
+from bra_scraper.resultset import ResultSet
+
+
+def test_load_query_into_sqlite(tmpdir):
+    path = os.path.join(str(tmpdir), "bra.db")
+    emulator = Emulator(n_regions=10, n_crimes=5, n_periods=20).start()
+    try:
+        topic = BRA(base_url=emulator.base_url).topics[0]
+        result = topic.query()
+        assert result.to_sqlite(path, topic) == 1000
+
+        # Loading again replaces the datapoints
+        store = SqliteStore(path, batch_size=300)
+        assert store.save(topic.query(regions=[u"Region 2 kommun"]), topic) == 100
+        assert store.count() == 1000
+        assert store.count(topic) == 1000
+        assert store.count("102") == 0
+        store.close()
+    finally:
+        emulator.stop()
+
+    db = sqlite3.connect(path)
+    rows = db.execute("""
+        SELECT p.label, p.periodicity, r.label, r.parent_id, c.label, d.value
+        FROM datapoints d
+        JOIN periods p ON p.topic = d.topic AND p.id = d.period_id
+        JOIN regions r ON r.topic = d.topic AND r.id = d.region_id
+        JOIN crimes c ON c.topic = d.topic AND c.id = d.crime_id
+        WHERE d.period_id = 2 AND d.region_id = 3 AND d.crime_id = 4
+    """).fetchall()
+    assert rows == [(u"1975, Kvartal 1", u"quarterly",
+                     u"Hela landet, Region 3 kommun", 1,
+                     u"Samtliga brott, Brott 4", value(2, 3, 4))]
+    assert db.execute("SELECT COUNT(*) FROM regions").fetchone()[0] == 10
+    assert db.execute("SELECT COUNT(*) FROM notes").fetchone()[0] == 1
+    assert db.execute("SELECT COUNT(*) FROM datapoints WHERE value IS NULL")\
+        .fetchone()[0] == db.execute(
+            "SELECT COUNT(*) FROM datapoints WHERE status = 'missing'")\
+        .fetchone()[0]
+
+def test_store_keeps_value_types(tmpdir):
+    period = Period(2108, u"År 2011")
+    crime = Category(3144, u"Samtliga brott")
+    count = Category("count", u"Antal")
+    per_capita = Category("per capita", u"Per 100 000 invånare")
+    results = ResultSet()
+    rows = [(Region(8291, u"Hela landet"), count, 1416280),
+            (Region(8291, u"Hela landet"), per_capita, 14163),
+            (Region(8292, u"Hela landet, Stockholms län"), per_capita, 2.5),
+            (Region(8293, u"Hela landet, Uppsala län"), per_capita, None)]
+    for region, measure, x in rows:
+        results.data.add(period, region, crime, measure, x,
+                         "missing" if x is None else None)
+
+    store = SqliteStore(os.path.join(str(tmpdir), "bra.db"))
+    store.save(results, "101")
+    loaded = sorted(store.load("101", [8291, 8292, 8293], [3144], [2108],
+                               ["count", "per capita"]))
+    store.close()
+
+    assert loaded == sorted(results.data.id_rows())
+    assert [type(x[4]) for x in loaded] == \
+        [int, int, float, type(None)]
+
+def test_query_fetches_only_missing_cells(tmpdir):
+    path = os.path.join(str(tmpdir), "bra.db")
+    emulator = Emulator(n_regions=10, n_crimes=5, n_periods=20).start()
+    try:
+        topic = BRA(base_url=emulator.base_url).topics[0]
+        expected = topic.query(measures="*")
+        regions = [u"Region 2 kommun", u"Region 3 kommun"]
+
+        result = topic.query(regions=regions, store=path)
+        assert len(result.data) == 200
+        assert SqliteStore(path).count(topic) == 200
+
+        # A superset of the regions, and another measure
+        n_searches = emulator.stats()["requests"]["soktabell"]
+        plan = topic.plan(regions=regions + [u"Region 4 kommun"],
+                          measures="*", exclude_cells=set(
+                              [(x[0], x[1], x[2], x[3])
+                               for x in SqliteStore(path).load(
+                                   topic, [2, 3, 4], range(1, 6),
+                                   range(1, 21), ["count", "per capita"])]))
+        assert sorted([(q["regions"], q["measures"]) for q in plan]) == \
+            [([2, 3], ["per capita"]), ([4], ["count", "per capita"])]
+
+        result = topic.query(regions=regions + [u"Region 4 kommun"],
+                             measures="*", store=path)
+        assert emulator.stats()["requests"]["soktabell"] == n_searches + 2
+        assert len(result.data) == 600
+
+        # Everything is stored now
+        result = topic.query(regions=regions, measures="*", store=path)
+        assert emulator.stats()["requests"]["soktabell"] == n_searches + 2
+        assert len(result.data) == 400
+        assert len(result.notes) == 1
+    finally:
+        emulator.stop()
+
+    expected = dict([((x[0], x[1], x[2], x[3]), x[4:])
+                     for x in expected.data.id_rows()])
+    for row in result.data.id_rows():
+        assert expected[row[:4]] == row[4:]
+
+def test_iter_query_closes_its_store(tmpdir, monkeypatch):
+    path = os.path.join(str(tmpdir), "bra.db")
+    closed = []
+    close = SqliteStore.close
+    def record_close(self):
+        closed.append(self.path)
+        close(self)
+    monkeypatch.setattr(SqliteStore, "close", record_close)
+
+    emulator = Emulator(n_regions=10, n_crimes=5, n_periods=20).start()
+    try:
+        topic = BRA(base_url=emulator.base_url).topics[0]
+        topic.MAX_DATAPOINTS = 100
+        batches = topic.iter_query(store=path)
+        next(batches)
+        # Stop early
+        batches.close()
+    finally:
+        emulator.stop()
+    assert closed == [path]
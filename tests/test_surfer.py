@@ -0,0 +1,138 @@
+# encoding: utf-8
+
+import time
+import threading
+import pytest
+import requests
+from bra_scraper import BRA
+from bra_scraper.topic import Topic
+from bra_scraper.surfer import Surfer
+from bra_scraper.emulator import Emulator
+
+TOPIC_HTML = u"""
+arrayRegionNivaEtt[0]="8291*Hela landet"
+arrayNivaett[0]="3144*Samtliga brott"
+arrayPeriod[0]="2108*2011*År 2011*ar"
+"""
+RESULT_HTML = u"""<table><tr>
+<td class="resultatAntal" headers="2108 289 3144 8291 antal">1&nbsp;416&nbsp;280</td>
+</tr></table>"""
+NOTES_HTML = u"""<div id="infotexter"></div>"""
+
+
+class FakeResponse(object):
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeSession(object):
+    """ Serves a topic with one datapoint and logs all requests
+    """
+    def __init__(self, log):
+        self.log = log
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def close(self):
+        pass
+
+    def request(self, method, url, **kwargs):
+        self.log.append((method, url))
+        if "urval?menyid=" in url:
+            return FakeResponse(TOPIC_HTML)
+        if url.endswith("soktabell"):
+            return FakeResponse(RESULT_HTML)
+        if url.endswith("sokinfo"):
+            return FakeResponse(NOTES_HTML)
+        return FakeResponse(u"")
+
+
+def test_query_skips_redundant_navigation(monkeypatch):
+    log = []
+    monkeypatch.setattr(requests, "session", lambda: FakeSession(log))
+    topic = Topic(u"Årsvis", "http://statistik.bra.se/?menyid=101")
+
+    result = topic.query()
+    assert len(result.data) == 1
+    # Start page (2), topic page, then search without opening the
+    # topic page again
+    assert topic.request_count == 7
+    assert [x[1].split("/")[-1] for x in log[3:]] == \
+        ["vantapopup", "sok", "soktabell", "sokinfo"]
+
+    # A warm session only has to open the search form again
+    topic.query()
+    assert topic.request_count == 7 + 5
+
+def test_parallel_workers_close_failed_sessions(monkeypatch):
+    emulator = Emulator(n_regions=30, n_crimes=10, n_periods=40).start()
+    try:
+        topic = BRA(base_url=emulator.base_url).topics[0]
+        topic.query(max_workers=2)
+        # The sessions of the workers are kept for the next query
+        surfers = list(topic._idle_surfers)
+        assert len(surfers) > 0
+        assert all([x.session is not None for x in surfers])
+
+        def fail(surfer, payload):
+            surfer.request("GET", surfer.SEARCH_URL + "sok")
+            raise requests.ConnectionError("Connection reset")
+        monkeypatch.setattr(topic, "_search", fail)
+        with pytest.raises(requests.ConnectionError):
+            topic.query(max_workers=2)
+
+        # Failed sessions are closed instead of being reused
+        assert len(topic._idle_surfers) < len(surfers)
+        for surfer in surfers:
+            if surfer not in topic._idle_surfers:
+                assert surfer.session is None
+
+        topic.close()
+        assert topic._idle_surfers == []
+        assert topic.session is None
+        assert all([x.session is None for x in surfers])
+    finally:
+        emulator.stop()
+
+def test_sessions_in_use_are_closed_when_their_search_is_over(monkeypatch):
+    emulator = Emulator(n_regions=30, n_crimes=10, n_periods=170,
+                        latency=0.05).start()
+    try:
+        topic = BRA(base_url=emulator.base_url).topics[0]
+        topic.dimensions()
+
+        # Thread of every running search, by surfer
+        searching = {}
+        search = topic._search
+        def record_search(surfer, payload):
+            searching[surfer] = threading.current_thread()
+            try:
+                return search(surfer, payload)
+            finally:
+                del searching[surfer]
+        monkeypatch.setattr(topic, "_search", record_search)
+
+        # Closed surfers, and whether another thread was searching in them
+        closed = []
+        close = Surfer.close
+        def record_close(self):
+            if self.session is not None:
+                thread = searching.get(self)
+                closed.append((self, thread not in (
+                    None, threading.current_thread())))
+            close(self)
+        monkeypatch.setattr(Surfer, "close", record_close)
+
+        batches = topic.iter_query(max_workers=2)
+        next(batches)
+        # The other worker is in the middle of a search
+        batches.close()
+        time.sleep(1)
+    finally:
+        emulator.stop()
+
+    # Sessions are not closed under a running search, but after it
+    assert len(closed) > 0
+    assert not [x for x in closed if x[1]]
+    assert not [x for x in topic._idle_surfers if x in [y[0] for y in closed]]
@@ -0,0 +1,37 @@
+# encoding: utf-8
+
+from bra_scraper.throttle import AdaptiveController
+
+
+def test_limit_grows_on_success_and_shrinks_on_errors():
+    throttle = AdaptiveController(min_limit=1, max_limit=8, initial_limit=2,
+                                  cooldown=0)
+    for i in range(4):
+        throttle.record(0.1, ok=True)
+    assert 3 <= throttle.limit < 4
+
+    throttle.record(0.1, ok=False)
+    assert 1.5 <= throttle.limit < 2
+    assert throttle.n_errors == 1
+
+    for i in range(1000):
+        throttle.record(0.1, ok=True)
+    assert throttle.limit == 8
+
+def test_slow_requests_shrink_limit():
+    throttle = AdaptiveController(initial_limit=4, latency_target=1.0,
+                                  cooldown=0)
+    throttle.record(5.0, ok=True)
+    assert throttle.limit == 2
+
+def test_one_decrease_per_cooldown():
+    throttle = AdaptiveController(initial_limit=8, cooldown=60)
+    throttle.record(0.1, ok=False)
+    throttle.record(0.1, ok=False)
+    assert throttle.limit == 4
+
+def test_backoff():
+    throttle = AdaptiveController(backoff_base=1.0, backoff_max=10.0)
+    assert 0.5 <= throttle.backoff(0) <= 1.5
+    assert 2.0 <= throttle.backoff(2) <= 6.0
+    assert throttle.backoff(20) <= 15.0
@@ -0,0 +1,56 @@
+# encoding: utf-8
+
+from itertools import product
+from bra_scraper.utils import group_queries, chunk_sizes
+
+
+def _size(query):
+    n = 1
+    for values in query:
+        n *= len(values)
+    return n
+
+def test_chunk_sizes():
+    assert chunk_sizes(10) == [10, 5, 4, 3, 2, 1]
+    assert chunk_sizes(1) == [1]
+
+def test_group_queries_covers_all_combinations():
+    ll = [range(30), range(12), range(7), ["count", "per capita"]]
+    queries = group_queries(ll, 100)
+
+    combinations = []
+    for query in queries:
+        assert _size(query) <= 100
+        combinations += list(product(*query))
+
+    assert len(combinations) == len(set(combinations))
+    assert set(combinations) == set(product(*ll))
+
+def test_group_queries_packs_small_queries():
+    """ Everything that fits in one request should be one request
+    """
+    ll = [[1], range(20), range(40), ["count", "per capita"]]
+    queries = group_queries(ll, 10000)
+    assert len(queries) == 1
+    assert list(queries[0][3]) == ["count", "per capita"]
+
+def test_group_queries_is_minimal():
+    """ Compare with trying all ways of splitting the lists in equally
+        sized chunks.
+    """
+    ll = [range(9), range(14), range(5), range(2)]
+    chunk_size = 60
+    best = None
+    for sizes in product(*[range(1, len(l) + 1) for l in ll]):
+        if _size([range(x) for x in sizes]) > chunk_size:
+            continue
+        n = 1
+        for l, size in zip(ll, sizes):
+            n *= -(-len(l) // size)
+        if best is None or n < best:
+            best = n
+
+    assert len(group_queries(ll, chunk_size)) == best
+
+def test_group_queries_with_empty_list():
+    assert group_queries([range(3), []], 10) == []